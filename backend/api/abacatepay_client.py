@@ -0,0 +1,177 @@
+"""
+Cliente HTTP compartilhado para a API do AbacatePay.
+
+Uma única requests.Session por processo mantém um pool de conexões
+keep-alive, então criar/consultar PIX não paga um handshake TCP+TLS a cada
+chamada. Timeouts de conexão e leitura são separados e falhas transitórias
+(erro de conexão, 429, 5xx) são repetidas com backoff exponencial e jitter.
+
+A latência de cada chamada é exportada por endpoint e status no Prometheus
+(api/metrics.py) e registrada como span 'abacatepay' (api/tracing.py).
+
+As views assíncronas (api/async_views.py) usam arequest/aget/apost: mesma
+política de timeouts e repetições, com um httpx.AsyncClient por event loop.
+"""
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from decouple import config
+from requests.adapters import HTTPAdapter
+
+from . import tracing
+from .metrics import ABACATEPAY_LATENCY, ABACATEPAY_RETRIES
+
+ABACATEPAY_API_KEY = config('ABACATEPAY_API_KEY', default='abc_dev_B56yaqbnxKKqUat1hM1qTX4y')
+ABACATEPAY_BASE_URL = config('ABACATEPAY_BASE_URL', default='https://api.abacatepay.com/v1')
+ABACATEPAY_HEADERS = {
+    "Authorization": f"Bearer {ABACATEPAY_API_KEY}",
+    "Content-Type": "application/json",
+}
+
+POOL_SIZE = config('ABACATEPAY_POOL_SIZE', default=20, cast=int)
+CONNECT_TIMEOUT = config('ABACATEPAY_CONNECT_TIMEOUT', default=3.05, cast=float)
+READ_TIMEOUT = config('ABACATEPAY_READ_TIMEOUT', default=10.0, cast=float)
+MAX_RETRIES = config('ABACATEPAY_MAX_RETRIES', default=2, cast=int)
+BACKOFF_BASE = 0.25  # segundos
+BACKOFF_MAX = 4.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+# Um AsyncClient por event loop: as conexões de um cliente não podem ser
+# usadas em outro loop (ex.: async_to_sync abre um loop por chamada)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_session():
+    """Session compartilhada (criada na primeira chamada de cada processo)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE, pool_block=False)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update(ABACATEPAY_HEADERS)
+                _session = session
+    return _session
+
+
+def get_async_client():
+    """AsyncClient compartilhado do event loop atual"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers=ABACATEPAY_HEADERS,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _backoff(attempt, retry_after=None):
+    """Atraso antes da próxima tentativa: Retry-After se houver, senão full jitter"""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX))
+
+
+def _record(endpoint, elapsed_ms, status_code, retries):
+    tracing.record('abacatepay', elapsed_ms / 1000)
+    status = 'error' if status_code is None else str(status_code)
+    ABACATEPAY_LATENCY.labels(endpoint, status).observe(elapsed_ms / 1000)
+    if retries:
+        ABACATEPAY_RETRIES.labels(endpoint).inc(retries)
+
+
+def request(method, path, *, idempotent=True, **kwargs):
+    """
+    Chama a API do AbacatePay (path relativo, ex.: '/pixQrCode/check').
+
+    Timeout de conexão e 429 são sempre repetidos (a requisição não foi
+    processada); demais erros de rede e 5xx só quando `idempotent`, para não
+    criar dois QR Codes. Retorna a Response da última tentativa ou propaga a
+    exceção de rede se todas falharem.
+    """
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    url = f"{ABACATEPAY_BASE_URL}{path}"
+    session = get_session()
+
+    attempt = 0
+    started = time.perf_counter()
+    while True:
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # Sem idempotência só repete quando a conexão nem chegou a abrir
+            retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+            if attempt >= MAX_RETRIES or not retryable:
+                _record(path, (time.perf_counter() - started) * 1000, None, attempt)
+                raise
+            time.sleep(_backoff(attempt))
+        else:
+            retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+            if attempt >= MAX_RETRIES or not retryable:
+                _record(path, (time.perf_counter() - started) * 1000, response.status_code, attempt)
+                return response
+            print(f"WARN ABACATE: {method} {path} respondeu {response.status_code}, tentando novamente")
+            time.sleep(_backoff(attempt, response.headers.get('Retry-After')))
+        attempt += 1
+
+
+def get(path, **kwargs):
+    return request('GET', path, **kwargs)
+
+
+def post(path, **kwargs):
+    return request('POST', path, **kwargs)
+
+
+async def arequest(method, path, *, idempotent=True, **kwargs):
+    """
+    Versão assíncrona de request(): mesmas regras de repetição, sem bloquear
+    o event loop durante a chamada nem durante o backoff. Retorna a
+    httpx.Response da última tentativa ou propaga a exceção de rede.
+    """
+    url = f"{ABACATEPAY_BASE_URL}{path}"
+    client = get_async_client()
+
+    attempt = 0
+    started = time.perf_counter()
+    while True:
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            # Sem idempotência só repete quando a conexão nem chegou a abrir
+            retryable = idempotent or isinstance(e, httpx.ConnectTimeout)
+            if attempt >= MAX_RETRIES or not retryable:
+                _record(path, (time.perf_counter() - started) * 1000, None, attempt)
+                raise
+            await asyncio.sleep(_backoff(attempt))
+        else:
+            retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+            if attempt >= MAX_RETRIES or not retryable:
+                _record(path, (time.perf_counter() - started) * 1000, response.status_code, attempt)
+                return response
+            print(f"WARN ABACATE: {method} {path} respondeu {response.status_code}, tentando novamente")
+            await asyncio.sleep(_backoff(attempt, response.headers.get('Retry-After')))
+        attempt += 1
+
+
+async def aget(path, **kwargs):
+    return await arequest('GET', path, **kwargs)
+
+
+async def apost(path, **kwargs):
+    return await arequest('POST', path, **kwargs)
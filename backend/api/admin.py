@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import RaceRegistration
+from django.utils import timezone
+from .models import RaceRegistration, EmailOutbox, Broadcast, BroadcastRecipient, AbacatePayWebhookEvent, StripeEvent
 
 
 @admin.register(RaceRegistration)
@@ -63,31 +64,25 @@ class RaceRegistrationAdmin(admin.ModelAdmin):
     
     def mark_as_paid(self, request, queryset):
         """Marca inscrições como pagas"""
-        from .services import send_payment_confirmation_email
+        from .services import mark_registration_paid_atomic
         
+        # Gera número e enfileira o email de confirmação na mesma transação
         updated = 0
-        emails_sent = 0
-        
-        for registration in queryset:
-            if registration.payment_status != 'PAID':
-                registration.payment_status = 'PAID'
-                registration.save(update_fields=['payment_status'])
+        for registration in queryset.exclude(payment_status='PAID'):
+            if mark_registration_paid_atomic(registration.id):
                 updated += 1
-                
-                # Enviar email de confirmação de pagamento se ainda não foi enviado
-                if not registration.payment_email_sent:
-                    try:
-                        send_payment_confirmation_email(registration)
-                        emails_sent += 1
-                    except Exception:
-                        pass
         
-        self.message_user(request, f'{updated} inscrições marcadas como pagas. {emails_sent} emails de confirmação enviados.')
+        self.message_user(request, f'{updated} inscrições marcadas como pagas. Emails de confirmação enfileirados.')
     mark_as_paid.short_description = "Marcar como pago e enviar email"
     
     def mark_as_pending(self, request, queryset):
         """Marca inscrições como pendentes"""
-        updated = queryset.update(payment_status='PENDING')
+        # save() por inscrição para manter os contadores de estatísticas
+        updated = 0
+        for registration in queryset.exclude(payment_status='PENDING'):
+            registration.payment_status = 'PENDING'
+            registration.save(update_fields=['payment_status'])
+            updated += 1
         self.message_user(request, f'{updated} inscrições marcadas como pendentes.')
     mark_as_pending.short_description = "Marcar como pendente"
     
@@ -109,3 +104,76 @@ class RaceRegistrationAdmin(admin.ModelAdmin):
     resend_payment_email.short_description = "Reenviar email de pagamento (apenas pagos)"
 
 
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'registration', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at']
+    list_filter = ['status', 'kind', 'created_at']
+    search_fields = ['registration__full_name', 'registration__email']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    raw_id_fields = ['registration']
+    ordering = ['-id']
+    
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        """Reagenda emails para a próxima passada do worker"""
+        updated = queryset.exclude(status=EmailOutbox.STATUS_SENT).update(
+            status=EmailOutbox.STATUS_PENDING,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f'{updated} emails reagendados.')
+    retry_now.short_description = "Reenviar agora (pendentes/falhos)"
+
+
+class BroadcastRecipientInline(admin.TabularInline):
+    model = BroadcastRecipient
+    fields = ['email', 'full_name', 'status', 'sent_at', 'error']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    show_change_link = False
+
+    def get_queryset(self, request):
+        # Mostra apenas as falhas; envios grandes teriam milhares de linhas
+        return super().get_queryset(request).filter(status=BroadcastRecipient.STATUS_FAILED)
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'total', 'created_at', 'started_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject']
+    readonly_fields = ['id', 'total', 'heartbeat_at', 'created_at', 'started_at', 'finished_at', 'error']
+    ordering = ['-created_at']
+    inlines = [BroadcastRecipientInline]
+
+
+@admin.register(AbacatePayWebhookEvent)
+class AbacatePayWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'registration', 'received_at']
+    list_filter = ['event_type', 'received_at']
+    search_fields = ['event_id', 'registration__full_name']
+    readonly_fields = ['event_id', 'event_type', 'registration', 'received_at']
+    ordering = ['-received_at']
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'status', 'attempts', 'stripe_created', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_type', 'received_at']
+    search_fields = ['event_id']
+    readonly_fields = ['event_id', 'event_type', 'payload', 'stripe_created', 'received_at', 'processed_at', 'last_error']
+    ordering = ['-received_at']
+    
+    actions = ['retry_now']
+    
+    def retry_now(self, request, queryset):
+        """Reagenda eventos para a próxima passada do worker"""
+        updated = queryset.exclude(status=StripeEvent.STATUS_PROCESSED).update(
+            status=StripeEvent.STATUS_PENDING,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f'{updated} eventos reagendados.')
+    retry_now.short_description = "Reprocessar agora (pendentes/falhos)"
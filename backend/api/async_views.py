@@ -0,0 +1,276 @@
+"""
+Versões assíncronas das views que esperam pelo Stripe ou AbacatePay
+
+Com o gunicorn sync cada chamada ao gateway segura um worker durante todo o
+round-trip. Servidas pelo worker ASGI (uvicorn, ver gunicorn.conf.py), estas
+views liberam o event loop enquanto esperam a resposta: o gateway é chamado
+com httpx (api/abacatepay_client.arequest e StripeClient *_async) e o banco
+pelo ORM assíncrono do Django ou, nas transações, por sync_to_async.
+
+Mesmos caminhos, parâmetros e respostas das views de api/views.py; api/urls.py
+escolhe entre as duas com ASYNC_GATEWAY_VIEWS.
+"""
+from adrf.decorators import api_view
+from asgiref.sync import sync_to_async
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.decorators import permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from .idempotency import idempotent
+from .models import RaceRegistration
+from .services import (
+    acheck_abacatepay_payment_status,
+    acreate_abacatepay_pix,
+    acreate_stripe_checkout_session,
+    mark_registration_paid_atomic,
+)
+from .stripe_sessions import aget_checkout_session_status
+
+PAYMENT_REQUEST = {
+    'type': 'object',
+    'properties': {
+        'registration_id': {'type': 'integer', 'description': 'ID da inscrição'},
+        'coupon_code': {'type': 'string', 'description': 'Código do cupom (opcional)'},
+    },
+    'required': ['registration_id']
+}
+
+amark_registration_paid_atomic = sync_to_async(mark_registration_paid_atomic)
+
+
+async def _unpaid_registration(registration_id):
+    """(inscrição, None) ou (None, Response de erro) para os endpoints de criação"""
+    if not registration_id:
+        return None, Response({
+            'success': False,
+            'error': 'registration_id é obrigatório'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        registration = await RaceRegistration.objects.aget(id=registration_id)
+    except RaceRegistration.DoesNotExist:
+        return None, Response({
+            'success': False,
+            'error': 'Inscrição não encontrada'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    if registration.payment_status == 'PAID':
+        return None, Response({
+            'success': False,
+            'error': 'Esta inscrição já foi paga'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return registration, None
+
+
+@extend_schema(
+    tags=['pagamento'],
+    summary='Criar sessão de checkout do Stripe',
+    description='Cria uma sessão de checkout do Stripe para pagamento da inscrição',
+    request=PAYMENT_REQUEST,
+    responses={
+        200: {'description': 'Sessão de checkout criada com sucesso'},
+        400: {'description': 'Dados inválidos'},
+        404: {'description': 'Inscrição não encontrada'},
+    }
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@idempotent('payment-create-session')
+async def create_payment_session(request):
+    """
+    Cria uma sessão de checkout do Stripe para pagamento da inscrição
+    """
+    try:
+        registration, error = await _unpaid_registration(request.data.get('registration_id'))
+        if error is not None:
+            return error
+
+        result = await acreate_stripe_checkout_session(registration, coupon_code=request.data.get('coupon_code'))
+
+        if result['success']:
+            return Response(result, status=status.HTTP_200_OK)
+        else:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@extend_schema(
+    tags=['pagamento'],
+    summary='Verificar status de pagamento',
+    description=(
+        'Verifica o status de uma sessão de checkout do Stripe. Inscrição já paga é respondida '
+        'pelo banco e o status da sessão fica em cache (sem expiração depois de pago); '
+        '`source` indica a origem da resposta (db, cache ou stripe).'
+    ),
+    parameters=[
+        {
+            'name': 'session_id',
+            'in': 'query',
+            'description': 'ID da sessão de checkout do Stripe',
+            'required': True,
+            'type': 'string'
+        }
+    ],
+    responses={
+        200: {'description': 'Status do pagamento verificado'},
+        400: {'description': 'Parâmetros inválidos'},
+    }
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+async def verify_payment_status(request):
+    """
+    Verifica o status de uma sessão de checkout do Stripe (banco, cache ou Stripe)
+    """
+    try:
+        session_id = request.query_params.get('session_id')
+
+        if not session_id:
+            return Response({
+                'success': False,
+                'error': 'session_id é obrigatório'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        result = await aget_checkout_session_status(session_id)
+
+        if not result['success']:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+
+        session = result['session']
+        registration_updated = False
+
+        # Pago e ainda não PAID no banco (inclusive resposta do cache): atualizar
+        if result['source'] != 'db' and session['payment_status'] == 'paid':
+            registration_id = session['registration_id']
+
+            if registration_id:
+                try:
+                    amt_total = session['amount_total']
+                    registration_updated = await amark_registration_paid_atomic(
+                        int(registration_id),
+                        amount_reais=(amt_total or 0) / 100.0 if amt_total is not None else None,
+                        payment_intent_id=session['payment_intent'],
+                    )
+                except RaceRegistration.DoesNotExist:
+                    pass
+
+        return Response({
+            'success': True,
+            'payment_status': session['payment_status'],
+            'amount_total': session['amount_total'],
+            'customer_email': session['customer_email'],
+            'registration_updated': registration_updated,
+            'source': result['source']
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@extend_schema(
+    tags=['pagamento'],
+    summary='Criar QR Code PIX via AbacatePay',
+    description='Cria um QR Code PIX para pagamento da inscrição',
+    request=PAYMENT_REQUEST,
+    responses={
+        200: {'description': 'QR Code PIX criado com sucesso'},
+        400: {'description': 'Dados inválidos'},
+        404: {'description': 'Inscrição não encontrada'},
+    }
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@idempotent('payment-pix-create')
+async def create_pix_payment(request):
+    """
+    Cria um QR Code PIX via AbacatePay para pagamento da inscrição
+    """
+    try:
+        registration, error = await _unpaid_registration(request.data.get('registration_id'))
+        if error is not None:
+            return error
+
+        result = await acreate_abacatepay_pix(registration, coupon_code=request.data.get('coupon_code'))
+
+        if result['success']:
+            return Response(result, status=status.HTTP_200_OK)
+        else:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@extend_schema(
+    tags=['pagamento'],
+    summary='Verificar status de pagamento PIX',
+    description='Verifica o status de um pagamento PIX no AbacatePay',
+    parameters=[
+        {
+            'name': 'pix_id',
+            'in': 'query',
+            'description': 'ID do PIX no AbacatePay',
+            'required': True,
+            'type': 'string'
+        }
+    ],
+    responses={
+        200: {'description': 'Status verificado com sucesso'},
+        400: {'description': 'Parâmetros inválidos'},
+    }
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+async def check_pix_status(request):
+    """
+    Verifica o status de um pagamento PIX
+    """
+    try:
+        pix_id = request.query_params.get('pix_id')
+
+        if not pix_id:
+            return Response({
+                'success': False,
+                'error': 'pix_id é obrigatório'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        result = await acheck_abacatepay_payment_status(pix_id)
+
+        if not result['success']:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+
+        registration_updated = False
+
+        # Se o pagamento foi concluído, atualizar a inscrição
+        if result['status'] == 'PAID':
+            try:
+                registration = await RaceRegistration.objects.only('id').aget(abacatepay_pix_id=pix_id)
+                registration_updated = await amark_registration_paid_atomic(registration.id)
+            except RaceRegistration.DoesNotExist:
+                pass
+
+        return Response({
+            'success': True,
+            'status': result['status'],
+            'expires_at': result.get('expires_at'),
+            'registration_updated': registration_updated
+        }, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return Response({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,137 @@
+"""
+Progresso dos envios em massa no Redis.
+
+O progresso fica num hash do Redis (sent_count, failed_count, ...). O worker
+acumula os resultados em memória e grava no máximo a cada N mensagens ou
+T milissegundos, somando os contadores com HINCRBY num único pipeline, em vez
+de regravar o dicionário inteiro a cada email.
+
+Sem Redis (ex.: LocMemCache nos testes) o progresso é um dicionário no cache.
+"""
+import time
+
+from django.core.cache import cache
+
+from .redis_utils import cache_key, get_redis_connection_or_none
+
+PROGRESS_TIMEOUT = 1800
+PROGRESS_FLUSH_EVERY = 50
+PROGRESS_FLUSH_INTERVAL_MS = 500
+
+_COUNTER_FIELDS = ('total', 'sent_count', 'failed_count')
+
+
+def progress_key(task_id) -> str:
+    return f'broadcast_progress:{task_id}'
+
+
+def _decode(raw):
+    progress = {}
+    for field, value in raw.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        value = value.decode() if isinstance(value, bytes) else value
+        progress[field] = int(value) if field in _COUNTER_FIELDS else value
+    if not progress.get('error'):
+        progress.pop('error', None)
+    return progress
+
+
+def write_progress(task_id, progress):
+    """Grava o progresso completo (início do envio ou retomada)"""
+    progress = {'current_email': '', 'current_name': '', 'error': '', **progress}
+    client = get_redis_connection_or_none()
+    if client is not None:
+        key = cache_key(progress_key(task_id))
+        pipe = client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=progress)
+        pipe.expire(key, PROGRESS_TIMEOUT)
+        pipe.execute()
+    else:
+        cache.set(progress_key(task_id), progress, timeout=PROGRESS_TIMEOUT)
+
+
+def read_progress(task_id):
+    """Progresso no formato de check_broadcast_status, ou None se não existe"""
+    client = get_redis_connection_or_none()
+    if client is not None:
+        raw = client.hgetall(cache_key(progress_key(task_id)))
+        return _decode(raw) if raw else None
+    progress = cache.get(progress_key(task_id))
+    return _decode(progress) if progress else None
+
+
+class ProgressReporter:
+    """
+    Acumula o progresso de um envio e grava em lote.
+
+    record() é chamado a cada email; a gravação acontece quando há
+    `flush_every` resultados acumulados ou passaram `flush_interval_ms`
+    desde a última gravação.
+    """
+
+    def __init__(self, task_id, flush_every=PROGRESS_FLUSH_EVERY, flush_interval_ms=PROGRESS_FLUSH_INTERVAL_MS, clock=time.monotonic):
+        self.task_id = task_id
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval_ms / 1000
+        self.clock = clock
+        self.flushes = 0
+        self._sent = 0
+        self._failed = 0
+        self._current = None
+        self._last_flush = clock()
+
+    def record(self, recipient, ok):
+        if ok:
+            self._sent += 1
+        else:
+            self._failed += 1
+        self._current = recipient
+        if self._sent + self._failed >= self.flush_every or self.clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, status=None, error=None):
+        fields = {}
+        if self._current is not None:
+            fields['current_email'] = self._current['email']
+            fields['current_name'] = self._current['full_name']
+        if status is not None:
+            fields['status'] = status
+        if error is not None:
+            fields['error'] = error
+
+        if self._sent or self._failed or fields:
+            try:
+                self._write(fields)
+                self.flushes += 1
+            except Exception as e:
+                print(f"Erro ao gravar progresso do envio {self.task_id}: {e}")
+
+        self._sent = 0
+        self._failed = 0
+        self._current = None
+        self._last_flush = self.clock()
+
+    def finish(self, error=''):
+        self.flush(status='done', error=error)
+
+    def _write(self, fields):
+        client = get_redis_connection_or_none()
+        if client is not None:
+            key = cache_key(progress_key(self.task_id))
+            pipe = client.pipeline()
+            if self._sent:
+                pipe.hincrby(key, 'sent_count', self._sent)
+            if self._failed:
+                pipe.hincrby(key, 'failed_count', self._failed)
+            if fields:
+                pipe.hset(key, mapping=fields)
+            pipe.expire(key, PROGRESS_TIMEOUT)
+            pipe.execute()
+            return
+
+        progress = cache.get(progress_key(self.task_id)) or {}
+        progress['sent_count'] = progress.get('sent_count', 0) + self._sent
+        progress['failed_count'] = progress.get('failed_count', 0) + self._failed
+        progress.update(fields)
+        cache.set(progress_key(self.task_id), progress, timeout=PROGRESS_TIMEOUT)
@@ -0,0 +1,330 @@
+"""
+Motor de envio de email em massa.
+
+A API apenas grava o envio (Broadcast) e seus destinatários; o worker
+`run_broadcast_worker` faz o envio fora do processo web, distribuindo as
+mensagens entre N conexões SMTP com um teto de mensagens por segundo.
+O status de cada destinatário fica no banco, então um envio interrompido
+é retomado de onde parou (apenas destinatários PENDING são enviados).
+"""
+import queue
+import threading
+import time
+import uuid
+from datetime import timedelta
+from email.header import Header
+from email.utils import formataddr
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .broadcast_progress import ProgressReporter, read_progress, write_progress
+from .tracing import span
+
+FLUSH_EVERY = 50
+STALE_AFTER = timedelta(minutes=2)
+
+
+class RateLimiter:
+    """
+    Limita a taxa global de envios entre as threads.
+
+    Cada chamada a wait() reserva o próximo horário livre e dorme até ele;
+    max_rate <= 0 desativa o limite.
+    """
+
+    def __init__(self, max_rate: float):
+        self.interval = 1.0 / max_rate if max_rate and max_rate > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def create_broadcast(subject_text, message_body, registrations):
+    """
+    Grava o envio e um destinatário por inscrição, numa única transação.
+    """
+    from .models import Broadcast, BroadcastRecipient
+
+    with transaction.atomic():
+        broadcast = Broadcast.objects.create(subject=subject_text, message=message_body)
+        recipients = [
+            BroadcastRecipient(
+                broadcast=broadcast,
+                registration_id=reg['id'],
+                email=reg['email'],
+                full_name=reg['full_name'],
+            )
+            for reg in registrations.values('id', 'email', 'full_name').iterator(chunk_size=2000)
+        ]
+        BroadcastRecipient.objects.bulk_create(recipients, batch_size=1000)
+        broadcast.total = len(recipients)
+        broadcast.save(update_fields=['total'])
+
+    publish_progress(broadcast)
+    return broadcast
+
+
+def _count_recipients(broadcast):
+    from .models import BroadcastRecipient
+
+    return broadcast.recipients.aggregate(
+        sent=Count('id', filter=Q(status=BroadcastRecipient.STATUS_SENT)),
+        failed=Count('id', filter=Q(status=BroadcastRecipient.STATUS_FAILED)),
+    )
+
+
+def publish_progress(broadcast):
+    """
+    Grava no cache o progresso completo lido do banco (início ou retomada do
+    envio), no formato de check_broadcast_status.
+    """
+    counts = _count_recipients(broadcast)
+    progress = {
+        'status': 'done' if broadcast.status == broadcast.STATUS_DONE else 'running',
+        'total': broadcast.total,
+        'sent_count': counts['sent'],
+        'failed_count': counts['failed'],
+        'error': broadcast.error,
+    }
+    write_progress(broadcast.id, progress)
+    if not progress['error']:
+        progress.pop('error')
+    return {**progress, 'current_email': '', 'current_name': ''}
+
+
+def get_broadcast_progress(task_id):
+    """
+    Progresso do envio: cache primeiro, banco se o cache expirou.
+    Retorna None se o envio não existe.
+    """
+    from .models import Broadcast
+
+    progress = read_progress(task_id)
+    if progress and 'total' in progress:
+        return progress
+    try:
+        broadcast = Broadcast.objects.get(id=uuid.UUID(str(task_id)))
+    except (ValueError, Broadcast.DoesNotExist):
+        return None
+    return publish_progress(broadcast)
+
+
+def list_broadcast_failures(broadcast_id, after: int | None = None, limit: int = 100):
+    """
+    Página de destinatários que falharam, ordenada por id (keyset).
+    Retorna (linhas, próximo cursor ou None).
+    """
+    from .models import BroadcastRecipient
+
+    failures = BroadcastRecipient.objects.filter(
+        broadcast_id=broadcast_id,
+        status=BroadcastRecipient.STATUS_FAILED,
+    ).order_by('id')
+    if after is not None:
+        failures = failures.filter(id__gt=after)
+    rows = list(failures.values('id', 'registration_id', 'email', 'full_name', 'error')[:limit + 1])
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def claim_next_broadcast(stale_after: timedelta = STALE_AFTER):
+    """
+    Pega o próximo envio na fila, ou um envio 'running' cujo worker parou
+    de dar sinal (caiu no meio do envio).
+    """
+    from .models import Broadcast
+
+    now = timezone.now()
+    with transaction.atomic():
+        broadcast = (
+            Broadcast.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Broadcast.STATUS_QUEUED)
+                | Q(status=Broadcast.STATUS_RUNNING, heartbeat_at__lt=now - stale_after)
+                | Q(status=Broadcast.STATUS_RUNNING, heartbeat_at__isnull=True)
+            )
+            .order_by('created_at')
+            .first()
+        )
+        if broadcast is None:
+            return None
+        broadcast.status = Broadcast.STATUS_RUNNING
+        broadcast.heartbeat_at = now
+        if not broadcast.started_at:
+            broadcast.started_at = now
+        broadcast.save(update_fields=['status', 'heartbeat_at', 'started_at'])
+    return broadcast
+
+
+def _render(broadcast):
+    subject = str(Header(broadcast.subject, 'utf-8'))
+    friendly_from = formataddr((str(Header('Equipe Ad-moving', 'utf-8')), settings.DEFAULT_FROM_EMAIL))
+    html_body = f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; border-radius: 8px 8px 0 0; text-align: center;">
+                <h1 style="color: #fff; margin: 0; font-size: 24px;">Corrida Ad-moving</h1>
+            </div>
+            <div style="padding: 20px; background: #f9fafb; border: 1px solid #e5e7eb; border-top: none; border-radius: 0 0 8px 8px;">
+                {broadcast.message.replace(chr(10), '<br>')}
+            </div>
+            <p style="text-align: center; margin-top: 20px; font-size: 12px; color: #6b7280;">
+                Equipe Ad-moving &bull; admoving@addirceu.com.br
+            </p>
+        </body>
+        </html>
+        """
+    return subject, friendly_from, html_body
+
+
+def _sender(broadcast, pending, results, limiter):
+    """
+    Thread de envio: uma conexão SMTP própria, consome destinatários da fila
+    e devolve (destinatário, erro) para a thread principal gravar no banco.
+
+    Todo destinatário retirado da fila gera um resultado (a thread principal
+    espera exatamente um por destinatário), inclusive se a preparação falhar.
+    """
+    try:
+        subject, friendly_from, html_body = _render(broadcast)
+        connection = get_connection()
+    except Exception as e:
+        print(f"Erro ao preparar o envio em massa {broadcast.id}: {e}")
+        error = str(e)[:1000] or e.__class__.__name__
+        while True:
+            try:
+                recipient = pending.get_nowait()
+            except queue.Empty:
+                return
+            results.put((recipient, error))
+
+    try:
+        while True:
+            try:
+                recipient = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                limiter.wait()
+                connection.open()
+                email = EmailMultiAlternatives(
+                    subject=subject,
+                    body=broadcast.message,
+                    from_email=friendly_from,
+                    to=[recipient['email']],
+                    connection=connection,
+                )
+                email.encoding = 'utf-8'
+                email.attach_alternative(html_body, 'text/html; charset=utf-8')
+                with span('smtp'):
+                    email.send(fail_silently=False)
+                results.put((recipient, None))
+            except Exception as e:
+                print(f"Erro ao enviar email para {recipient['email']}: {e}")
+                results.put((recipient, str(e)[:1000] or e.__class__.__name__))
+                # A conexão pode ter caído; a próxima mensagem reabre
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def _flush(broadcast, sent, failed):
+    """Grava em lote o status dos destinatários processados"""
+    from .models import BroadcastRecipient
+
+    now = timezone.now()
+    if sent:
+        BroadcastRecipient.objects.filter(id__in=[r['id'] for r in sent]).update(
+            status=BroadcastRecipient.STATUS_SENT,
+            sent_at=now,
+        )
+    if failed:
+        BroadcastRecipient.objects.bulk_update(
+            [
+                BroadcastRecipient(id=r['id'], status=BroadcastRecipient.STATUS_FAILED, error=error)
+                for r, error in failed
+            ],
+            ['status', 'error'],
+        )
+    broadcast.heartbeat_at = now
+    broadcast.save(update_fields=['heartbeat_at'])
+
+
+def run_broadcast(broadcast, connections: int | None = None, max_rate: float | None = None, flush_every: int = FLUSH_EVERY) -> dict:
+    """
+    Envia para todos os destinatários PENDING do envio.
+
+    As threads só falam SMTP; a thread principal grava os resultados no
+    banco a cada `flush_every` mensagens. Retorna {'sent': n, 'failed': n}.
+    """
+    from .models import Broadcast, BroadcastRecipient
+
+    connections = connections or settings.BROADCAST_SMTP_CONNECTIONS
+    max_rate = settings.BROADCAST_MAX_RATE if max_rate is None else max_rate
+
+    pending = queue.Queue()
+    recipients = broadcast.recipients.filter(status=BroadcastRecipient.STATUS_PENDING).values('id', 'email', 'full_name')
+    for recipient in recipients.iterator(chunk_size=2000):
+        pending.put(recipient)
+    remaining = pending.qsize()
+
+    results = queue.Queue()
+    limiter = RateLimiter(max_rate)
+    threads = [
+        threading.Thread(target=_sender, args=(broadcast, pending, results, limiter), daemon=True)
+        for _ in range(max(1, min(connections, remaining)))
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Progresso: contadores somados em lote (a cada N mensagens ou T ms)
+    publish_progress(broadcast)
+    reporter = ProgressReporter(broadcast.id)
+
+    totals = {'sent': 0, 'failed': 0}
+    sent, failed = [], []
+    for _ in range(remaining):
+        recipient, error = results.get()
+        if error is None:
+            sent.append(recipient)
+        else:
+            failed.append((recipient, error))
+        reporter.record(recipient, error is None)
+        if len(sent) + len(failed) >= flush_every:
+            totals['sent'] += len(sent)
+            totals['failed'] += len(failed)
+            _flush(broadcast, sent, failed)
+            sent, failed = [], []
+
+    for thread in threads:
+        thread.join()
+
+    totals['sent'] += len(sent)
+    totals['failed'] += len(failed)
+    _flush(broadcast, sent, failed)
+
+    broadcast.status = Broadcast.STATUS_DONE
+    broadcast.finished_at = timezone.now()
+    broadcast.save(update_fields=['status', 'finished_at'])
+    reporter.finish()
+    return totals
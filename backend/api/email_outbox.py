@@ -0,0 +1,164 @@
+"""
+Envio dos emails enfileirados em EmailOutbox.
+
+O fluxo de pagamento apenas grava uma linha no outbox dentro da transação
+que marca a inscrição como paga. Este módulo drena a fila em lotes,
+reaproveitando uma única conexão SMTP, com retentativas e backoff
+exponencial para falhas transitórias.
+"""
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .tracing import span
+
+DEFAULT_BATCH_SIZE = 50
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+# Prazo da reserva de um lote; depois dele outro worker pode reenviar
+CLAIM_TIMEOUT_SECONDS = 600
+
+
+def compute_backoff(attempts: int) -> timedelta:
+    """
+    Atraso até a próxima tentativa: 30s, 60s, 120s... limitado a 1h, com
+    até 10% de jitter para não reenviar tudo no mesmo instante.
+    """
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay + random.uniform(0, delay * 0.1))
+
+
+def _build_message(item, connection):
+    from .services import build_payment_confirmation_email
+
+    if item.kind == item.KIND_PAYMENT_CONFIRMATION:
+        return build_payment_confirmation_email(item.registration, connection=connection)
+    raise ValueError(f'Tipo de email desconhecido: {item.kind}')
+
+
+def claim_outbox_batch(batch_size: int = DEFAULT_BATCH_SIZE) -> list:
+    """
+    Reserva um lote de emails vencidos numa transação curta.
+
+    As linhas são travadas com skip_locked, marcadas como SENDING com o
+    horário da tentativa e recebem um prazo (CLAIM_TIMEOUT_SECONDS) em
+    next_attempt_at: se o worker morrer no meio do envio, o email volta a
+    ser elegível quando o prazo vencer.
+    """
+    from .models import EmailOutbox
+
+    now = timezone.now()
+    with transaction.atomic():
+        items = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('registration')
+            .filter(
+                status__in=[EmailOutbox.STATUS_PENDING, EmailOutbox.STATUS_SENDING],
+                next_attempt_at__lte=now,
+            )
+            .order_by('id')[:batch_size]
+        )
+        if items:
+            EmailOutbox.objects.filter(id__in=[item.id for item in items]).update(
+                status=EmailOutbox.STATUS_SENDING,
+                last_attempt_at=now,
+                next_attempt_at=now + timedelta(seconds=CLAIM_TIMEOUT_SECONDS),
+            )
+    for item in items:
+        item.status = EmailOutbox.STATUS_SENDING
+        item.last_attempt_at = now
+    return items
+
+
+def process_outbox_batch(connection, batch_size: int = DEFAULT_BATCH_SIZE, max_attempts: int = MAX_ATTEMPTS) -> dict:
+    """
+    Envia um lote de emails vencidos usando a conexão informada.
+
+    O lote é reservado por claim_outbox_batch e os envios SMTP acontecem
+    fora de qualquer transação, então vários workers podem rodar ao mesmo
+    tempo sem segurar locks no banco enquanto o servidor SMTP responde. Os
+    resultados são gravados depois (outbox e payment_email_sent); uma falha
+    só é registrada se a reserva ainda for deste worker.
+    Retorna {'sent': n, 'retried': n, 'failed': n}.
+    """
+    from .models import EmailOutbox, RaceRegistration
+
+    result = {'sent': 0, 'retried': 0, 'failed': 0}
+    items = claim_outbox_batch(batch_size)
+    if not items:
+        return result
+
+    sent_ids = []
+    sent_registration_ids = set()
+    failed_items = []
+
+    def fail(item, error):
+        item.attempts += 1
+        item.last_error = str(error)[:1000]
+        if item.attempts >= max_attempts:
+            item.status = EmailOutbox.STATUS_FAILED
+            result['failed'] += 1
+        else:
+            item.status = EmailOutbox.STATUS_PENDING
+            item.next_attempt_at = timezone.now() + compute_backoff(item.attempts)
+            result['retried'] += 1
+        failed_items.append(item)
+
+    # Sem conexão SMTP, os emails restantes do lote contam como tentativa falha
+    connection_error = None
+    try:
+        try:
+            connection.open()
+        except Exception as e:
+            print(f"Erro ao abrir a conexão SMTP do outbox: {e}")
+            connection_error = e
+
+        for item in items:
+            if connection_error is not None:
+                fail(item, connection_error)
+                continue
+            try:
+                with span('smtp'):
+                    _build_message(item, connection).send(fail_silently=False)
+            except Exception as e:
+                print(f"Erro ao enviar email do outbox #{item.id}: {e}")
+                fail(item, e)
+                # A conexão pode ter caído; reabre para o restante do lote
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception as e:
+                    print(f"Erro ao reabrir a conexão SMTP do outbox: {e}")
+                    connection_error = e
+                continue
+
+            sent_ids.append(item.id)
+            if item.kind == EmailOutbox.KIND_PAYMENT_CONFIRMATION:
+                sent_registration_ids.add(item.registration_id)
+    finally:
+        # Grava sempre o que já foi enviado, para não reenviar após o prazo da reserva
+        with transaction.atomic():
+            if sent_ids:
+                EmailOutbox.objects.filter(id__in=sent_ids).update(
+                    status=EmailOutbox.STATUS_SENT,
+                    sent_at=timezone.now(),
+                    last_error='',
+                )
+                result['sent'] = len(sent_ids)
+            if sent_registration_ids:
+                RaceRegistration.objects.filter(id__in=sent_registration_ids).update(payment_email_sent=True)
+            for item in failed_items:
+                # Reserva expirada e retomada por outro worker: o resultado dele prevalece
+                EmailOutbox.objects.filter(
+                    id=item.id, status=EmailOutbox.STATUS_SENDING, last_attempt_at=item.last_attempt_at
+                ).update(
+                    attempts=item.attempts,
+                    last_error=item.last_error,
+                    status=item.status,
+                    next_attempt_at=item.next_attempt_at,
+                )
+
+    return result
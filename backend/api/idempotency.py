@@ -0,0 +1,190 @@
+"""
+Suporte ao header Idempotency-Key nos POSTs que criam inscrição/pagamento.
+
+A primeira resposta (status < 500) de uma chave fica no Redis por
+IDEMPOTENCY_TTL segundos; repetições com a mesma chave recebem a mesma
+resposta (header Idempotent-Replayed: true) sem chegar na view, ou seja,
+sem tocar no banco nem no Stripe/AbacatePay.
+
+Enquanto a primeira requisição está em andamento, a chave fica travada e
+duplicatas concorrentes esperam o resultado em vez de processar em
+paralelo. A mesma chave com outro corpo recebe 422.
+
+Sem Redis (ex.: LocMemCache nos testes) a trava usa cache.add.
+
+Views assíncronas (api/async_views.py) também podem ser decoradas: a espera
+usa asyncio.sleep e o cache/Redis roda em thread, sem bloquear o event loop.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .redis_utils import cache_key, get_redis_connection_or_none
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+# Remove a trava apenas se ainda pertence a quem a criou
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _acquire(lock_key, owner):
+    client = get_redis_connection_or_none()
+    if client is not None:
+        return bool(client.set(cache_key(lock_key), owner, nx=True, ex=settings.IDEMPOTENCY_LOCK_TIMEOUT))
+    return cache.add(lock_key, owner, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+
+
+def _release(lock_key, owner):
+    client = get_redis_connection_or_none()
+    if client is not None:
+        client.eval(_RELEASE_LUA, 1, cache_key(lock_key), owner)
+    elif cache.get(lock_key) == owner:
+        cache.delete(lock_key)
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response({
+            'success': False,
+            'error': f'{HEADER} já utilizada com outro conteúdo'
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(json.loads(stored['body']), status=stored['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _invalid_key(key):
+    if len(key) > MAX_KEY_LENGTH:
+        return Response({
+            'success': False,
+            'error': f'{HEADER} deve ter no máximo {MAX_KEY_LENGTH} caracteres'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+
+def _in_progress():
+    return Response({
+        'success': False,
+        'error': 'Requisição com a mesma Idempotency-Key ainda em andamento'
+    }, status=status.HTTP_409_CONFLICT)
+
+
+def _store(result_key, fingerprint, response):
+    # Erros 5xx não são guardados: o cliente pode tentar de novo
+    if response.status_code < 500:
+        cache.set(result_key, {
+            'fingerprint': fingerprint,
+            'status': response.status_code,
+            'body': json.dumps(response.data, cls=JSONEncoder),
+        }, timeout=settings.IDEMPOTENCY_TTL)
+
+
+def idempotent(scope):
+    """
+    Decorator para views de função do DRF (em métodos de ViewSet, usar com
+    method_decorator). `scope` separa as chaves de endpoints diferentes.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_idempotent(scope, view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(request, *args, **kwargs)
+            invalid = _invalid_key(key)
+            if invalid is not None:
+                return invalid
+
+            result_key = f'idempotency:{scope}:{key}'
+            lock_key = f'{result_key}:lock'
+            fingerprint = hashlib.sha256(request.body).hexdigest()
+
+            stored = cache.get(result_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+            # Duplicata concorrente: espera a primeira terminar
+            owner = uuid.uuid4().hex
+            deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+            while not _acquire(lock_key, owner):
+                if time.monotonic() >= deadline:
+                    return _in_progress()
+                time.sleep(POLL_INTERVAL)
+                stored = cache.get(result_key)
+                if stored is not None:
+                    return _replay(stored, fingerprint)
+
+            try:
+                # Pode ter terminado entre a leitura e a trava
+                stored = cache.get(result_key)
+                if stored is not None:
+                    return _replay(stored, fingerprint)
+
+                response = view(request, *args, **kwargs)
+                _store(result_key, fingerprint, response)
+                return response
+            finally:
+                _release(lock_key, owner)
+        return wrapper
+    return decorator
+
+
+def _async_idempotent(scope, view):
+    """Mesmo fluxo do idempotent() para views `async def`"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return await view(request, *args, **kwargs)
+        invalid = _invalid_key(key)
+        if invalid is not None:
+            return invalid
+
+        result_key = f'idempotency:{scope}:{key}'
+        lock_key = f'{result_key}:lock'
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+
+        stored = await cache.aget(result_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        while not await sync_to_async(_acquire)(lock_key, owner):
+            if time.monotonic() >= deadline:
+                return _in_progress()
+            await asyncio.sleep(POLL_INTERVAL)
+            stored = await cache.aget(result_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+        try:
+            stored = await cache.aget(result_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+            response = await view(request, *args, **kwargs)
+            await sync_to_async(_store)(result_key, fingerprint, response)
+            return response
+        finally:
+            await sync_to_async(_release)(lock_key, owner)
+    return wrapper
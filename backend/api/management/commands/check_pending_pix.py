@@ -5,19 +5,46 @@ Consulta a API do AbacatePay para cada inscrição PENDING que tenha
 um abacatepay_pix_id e, se o pagamento foi confirmado, marca como PAID,
 gera número de inscrição e envia email.
 
+Os pagamentos são confirmados pelo webhook do AbacatePay; este comando é a
+reconciliação lenta para webhooks que não chegaram.
+
+Só são consultados os PIX cuja próxima verificação (next_check_at) já
+venceu: PIX novos com frequência, antigos com backoff exponencial e
+expirados ficam estacionados (ver api/pix_schedule.py).
+
+As consultas podem rodar em paralelo (--concurrency) num pool de threads
+que usa o cliente compartilhado do AbacatePay (api/abacatepay_client.py),
+reaproveitando as conexões HTTP; ABACATEPAY_POOL_SIZE deve ser >= a
+concorrência. A gravação no banco continua na thread principal.
+
+Com --interval o comando repete a verificação no mesmo processo em vez de
+ser reiniciado a cada passada (check_pix_loop.sh): o Django sobe uma vez e a
+conexão com o banco (pool do psycopg, ver DB_POOL) e a sessão HTTP do
+AbacatePay são reaproveitadas entre as passadas.
+
 Uso:
-    python manage.py check_pending_pix          # verifica todos os pendentes
+    python manage.py check_pending_pix          # verifica os pendentes agendados
+    python manage.py check_pending_pix --all    # ignora o agendamento (reconciliação completa)
     python manage.py check_pending_pix --dry-run  # apenas mostra o que faria
+    python manage.py check_pending_pix --concurrency 8
+    python manage.py check_pending_pix --interval 30  # roda continuamente
 
 Pode ser agendado via cron, ex: a cada 5 minutos
     */5 * * * * cd /app && python manage.py check_pending_pix >> /var/log/check_pix.log 2>&1
 """
 
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections
 from django.utils import timezone
 
+from api import abacatepay_client
 from api.models import RaceRegistration
+from api.pix_schedule import due_pix_checks, next_check_after, parse_expires_at
 from api.services import check_abacatepay_payment_status, mark_registration_paid_atomic
+from api.tracing import percentile
 
 
 class Command(BaseCommand):
@@ -29,61 +56,161 @@ class Command(BaseCommand):
             action='store_true',
             help='Apenas mostra o que seria feito, sem alterar nada.',
         )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Consultas simultâneas ao AbacatePay (padrão: 1).',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Verifica todos os PIX pendentes, inclusive os não agendados ou estacionados.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help='Repete a verificação a cada N segundos no mesmo processo (padrão: uma passada).',
+        )
 
     def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is None:
+            self.check_pending(options)
+            return
+
+        try:
+            while True:
+                # Como em uma requisição: descarta a conexão quebrada antes e
+                # a devolve ao pool depois, em vez de segurá-la durante a espera
+                close_old_connections()
+                try:
+                    self.check_pending(options)
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'Erro na verificação: {e}'))
+                close_old_connections()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def check_pending(self, options):
+        """Uma passada de verificação dos PIX pendentes"""
         dry_run = options['dry_run']
+        concurrency = max(1, options['concurrency'])
 
         # Buscar inscrições PENDING que possuem pix_id (ou seja, geraram QR Code)
-        pending = RaceRegistration.objects.filter(
-            payment_status='PENDING',
-            abacatepay_pix_id__isnull=False,
-        ).exclude(
-            abacatepay_pix_id='',
+        if options['all']:
+            queryset = RaceRegistration.objects.filter(
+                payment_status='PENDING',
+                abacatepay_pix_id__isnull=False,
+            ).exclude(
+                abacatepay_pix_id='',
+            )
+        else:
+            queryset = due_pix_checks()
+        pending = list(
+            queryset.order_by('next_check_at').values_list(
+                'id', 'full_name', 'abacatepay_pix_id', 'check_attempts', 'pix_expires_at'
+            )
         )
 
-        total = pending.count()
+        total = len(pending)
         if total == 0:
             self.stdout.write(self.style.SUCCESS('Nenhum pagamento PIX pendente para verificar.'))
             return
 
-        self.stdout.write(f'[{timezone.now():%Y-%m-%d %H:%M:%S}] Verificando {total} pagamento(s) PIX pendente(s)...')
+        self.stdout.write(
+            f'[{timezone.now():%Y-%m-%d %H:%M:%S}] Verificando {total} pagamento(s) PIX pendente(s) '
+            f'(concorrência {concurrency})...'
+        )
+
+        if concurrency > abacatepay_client.POOL_SIZE:
+            self.stdout.write(self.style.WARNING(
+                f'Concorrência {concurrency} maior que ABACATEPAY_POOL_SIZE '
+                f'({abacatepay_client.POOL_SIZE}): conexões excedentes não serão reaproveitadas.'
+            ))
+
+        def check(pix_id):
+            started = time.perf_counter()
+            try:
+                result = check_abacatepay_payment_status(pix_id)
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+            return result, (time.perf_counter() - started) * 1000
 
         updated = 0
         errors = 0
+        latencies = []
+        rescheduled = []
+        pass_started = time.perf_counter()
 
-        for reg in pending:
-            pix_id = reg.abacatepay_pix_id
-            self.stdout.write(f'  -> #{reg.id} {reg.full_name} | PIX: {pix_id}', ending='')
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(check, row[2]): row for row in pending}
 
-            try:
-                result = check_abacatepay_payment_status(pix_id)
+            for future in as_completed(futures):
+                reg_id, name, pix_id, attempts, expires_at = futures[future]
+                self.stdout.write(f'  -> #{reg_id} {name} | PIX: {pix_id}', ending='')
 
-                if not result.get('success'):
-                    self.stdout.write(self.style.WARNING(f' | ERRO: {result.get("error", "?")}'))
-                    errors += 1
-                    continue
+                try:
+                    result, elapsed_ms = future.result()
+                    latencies.append(elapsed_ms)
 
-                status_pix = result.get('status')
-                self.stdout.write(f' | Status: {status_pix}', ending='')
+                    if not result.get('success'):
+                        self.stdout.write(self.style.WARNING(f' | ERRO: {result.get("error", "?")}'))
+                        errors += 1
+                        rescheduled.append(self._reschedule(reg_id, attempts, expires_at))
+                        continue
 
-                if status_pix == 'PAID':
-                    if dry_run:
-                        self.stdout.write(self.style.SUCCESS(' | [DRY-RUN] Seria marcado como PAGO'))
-                    else:
-                        changed = mark_registration_paid_atomic(reg.id)
-                        if changed:
-                            self.stdout.write(self.style.SUCCESS(' | ✅ MARCADO COMO PAGO'))
-                            updated += 1
+                    status_pix = result.get('status')
+                    self.stdout.write(f' | Status: {status_pix}', ending='')
+
+                    if status_pix == 'PAID':
+                        if dry_run:
+                            self.stdout.write(self.style.SUCCESS(' | [DRY-RUN] Seria marcado como PAGO'))
                         else:
-                            self.stdout.write(self.style.SUCCESS(' | (já estava pago)'))
-                else:
-                    self.stdout.write(f' | Ainda {status_pix}')
+                            changed = mark_registration_paid_atomic(reg_id)
+                            if changed:
+                                self.stdout.write(self.style.SUCCESS(' | ✅ MARCADO COMO PAGO'))
+                                updated += 1
+                            else:
+                                self.stdout.write(self.style.SUCCESS(' | (já estava pago)'))
+                    else:
+                        self.stdout.write(f' | Ainda {status_pix}')
+                        expires_at = expires_at or parse_expires_at(result.get('expires_at'))
+                        rescheduled.append(self._reschedule(
+                            reg_id, attempts, expires_at, park=status_pix in ('EXPIRED', 'CANCELLED', 'REFUNDED')
+                        ))
+
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f' | EXCEÇÃO: {e}'))
+                    errors += 1
 
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f' | EXCEÇÃO: {e}'))
-                errors += 1
+        elapsed = time.perf_counter() - pass_started
+
+        parked = sum(1 for reg in rescheduled if reg.next_check_at is None)
+        if rescheduled and not dry_run:
+            RaceRegistration.objects.bulk_update(
+                rescheduled, ['next_check_at', 'check_attempts', 'pix_expires_at'], batch_size=500
+            )
 
         self.stdout.write('')
         self.stdout.write(self.style.SUCCESS(
-            f'Concluído: {updated} atualizado(s), {errors} erro(s), {total} verificado(s).'
+            f'Concluído: {updated} atualizado(s), {errors} erro(s), {total} verificado(s), '
+            f'{parked} estacionado(s).'
         ))
+        self.stdout.write(
+            f'Tempo: {elapsed:.2f}s | {total / elapsed if elapsed else 0:.1f} verificações/s | '
+            f'latência p95: {percentile(latencies, 95):.0f}ms'
+        )
+
+    @staticmethod
+    def _reschedule(reg_id, attempts, expires_at, park=False):
+        """Inscrição com o agendamento da próxima verificação (para bulk_update)"""
+        attempts += 1
+        return RaceRegistration(
+            id=reg_id,
+            check_attempts=attempts,
+            pix_expires_at=expires_at,
+            next_check_at=None if park else next_check_after(attempts, expires_at),
+        )
@@ -0,0 +1,57 @@
+"""
+Management command para remontar o conjunto de CPFs pagos no Redis.
+
+Lê os CPFs com inscrição paga no banco, compara com o conjunto atual e o
+substitui de uma vez, informando os CPFs que faltavam ou sobravam.
+
+Uso:
+    python manage.py rebuild_paid_cpfs            # remonta o conjunto
+    python manage.py rebuild_paid_cpfs --dry-run  # apenas mostra a divergência
+"""
+
+from django.core.management.base import BaseCommand
+
+from api.paid_cpfs import paid_cpfs_from_db, rebuild_paid_cpf_set, redis_available, stored_paid_cpfs
+
+
+class Command(BaseCommand):
+    help = 'Remonta o conjunto de CPFs pagos no Redis a partir do banco e informa divergências.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas mostra a divergência, sem alterar o conjunto.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if not redis_available():
+            self.stdout.write(self.style.WARNING(
+                'Cache não é Redis; validate_cpf consulta o banco diretamente.'
+            ))
+            return
+
+        expected = paid_cpfs_from_db()
+        stored = stored_paid_cpfs()
+
+        if stored is None:
+            self.stdout.write(self.style.WARNING('Conjunto ainda não montado.'))
+        else:
+            missing = len(expected - stored)
+            extra = len(stored - expected)
+            if missing or extra:
+                self.stdout.write(self.style.WARNING(
+                    f'Divergência: {missing} CPF(s) pago(s) ausente(s), {extra} CPF(s) sobrando.'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS('Nenhuma divergência encontrada.'))
+
+        if dry_run:
+            self.stdout.write('[DRY-RUN] Conjunto não foi alterado.')
+            return
+
+        # Relê o banco dentro da remontagem (inclusões concorrentes não se perdem)
+        count = rebuild_paid_cpf_set()
+        self.stdout.write(self.style.SUCCESS(f'Conjunto remontado: {count} CPF(s) pago(s).'))
@@ -0,0 +1,66 @@
+"""
+Management command para recalcular os contadores de estatísticas no Redis.
+
+Calcula as contagens a partir do banco (uma consulta), compara com os
+contadores atuais e grava os valores corretos, informando a divergência
+encontrada em cada contador.
+
+Uso:
+    python manage.py rebuild_stats_counters            # recalcula e grava
+    python manage.py rebuild_stats_counters --dry-run  # apenas mostra a divergência
+"""
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from api.statistics import (
+    READY_KEY,
+    aggregate_race_counts,
+    counter_names,
+    seed_race_counts,
+)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores de estatísticas a partir do banco e informa divergências.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas mostra a divergência, sem gravar os contadores.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        counts = aggregate_race_counts()
+        names = counter_names()
+        stored = cache.get_many([READY_KEY, *names.values()])
+
+        if READY_KEY not in stored:
+            self.stdout.write(self.style.WARNING('Contadores ainda não inicializados.'))
+
+        drift = 0
+        for stat, name in names.items():
+            expected = counts.get(stat, 0)
+            current = stored.get(name)
+            if current != expected and not (current is None and expected == 0):
+                drift += 1
+                self.stdout.write(f'  -> {stat}: contador={current} banco={expected}')
+
+        if drift:
+            self.stdout.write(self.style.WARNING(f'{drift} contador(es) divergente(s).'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Nenhuma divergência encontrada.'))
+
+        if dry_run:
+            self.stdout.write('[DRY-RUN] Contadores não foram alterados.')
+            return
+
+        # Reagrega sob a trava da inicialização: deltas concorrentes não se perdem
+        counts = seed_race_counts()
+        if counts is None:
+            self.stdout.write(self.style.WARNING('Outra inicialização dos contadores em andamento; nada gravado.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Contadores recalculados: {counts.get("total", 0)} inscrição(ões).'))
@@ -0,0 +1,79 @@
+"""
+Management command que executa os envios de email em massa.
+
+Pega o próximo envio na fila (ou um envio cujo worker caiu no meio) e
+distribui as mensagens entre várias conexões SMTP, respeitando o teto de
+mensagens por segundo. Destinatários já enviados não são reenviados.
+
+Uso:
+    python manage.py run_broadcast_worker                    # roda continuamente
+    python manage.py run_broadcast_worker --once             # processa a fila e sai
+    python manage.py run_broadcast_worker --connections 8 --max-rate 20
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.broadcasts import claim_next_broadcast, run_broadcast
+
+
+class Command(BaseCommand):
+    help = 'Envia os emails em massa enfileirados usando várias conexões SMTP com limite de taxa.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Processa os envios na fila e sai.',
+        )
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=settings.BROADCAST_SMTP_CONNECTIONS,
+            help=f'Conexões SMTP simultâneas (padrão: {settings.BROADCAST_SMTP_CONNECTIONS}).',
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=float,
+            default=settings.BROADCAST_MAX_RATE,
+            help=f'Máximo de emails por segundo, 0 = sem limite (padrão: {settings.BROADCAST_MAX_RATE}).',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Segundos de espera quando não há envios na fila (padrão: 5).',
+        )
+
+    def handle(self, *args, **options):
+        once = options['once']
+        connections = options['connections']
+        max_rate = options['max_rate']
+        interval = options['interval']
+
+        try:
+            while True:
+                broadcast = claim_next_broadcast()
+                if broadcast is None:
+                    if once:
+                        break
+                    time.sleep(interval)
+                    continue
+
+                self.stdout.write(
+                    f'[{timezone.now():%Y-%m-%d %H:%M:%S}] Envio {broadcast.id}: "{broadcast.subject}" '
+                    f'({broadcast.total} destinatário(s))'
+                )
+                started = time.monotonic()
+                result = run_broadcast(broadcast, connections=connections, max_rate=max_rate)
+                elapsed = time.monotonic() - started
+                rate = (result['sent'] + result['failed']) / elapsed if elapsed else 0.0
+                self.stdout.write(self.style.SUCCESS(
+                    f'  -> {result["sent"]} enviado(s), {result["failed"]} falho(s) '
+                    f'em {elapsed:.1f}s ({rate:.1f} emails/s)'
+                ))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,97 @@
+"""
+Management command que envia os emails enfileirados em EmailOutbox.
+
+Mantém uma única conexão SMTP aberta entre os lotes e reenvia falhas
+transitórias com backoff exponencial.
+
+Uso:
+    python manage.py run_email_worker                 # roda continuamente
+    python manage.py run_email_worker --once          # drena a fila e sai
+    python manage.py run_email_worker --batch-size 100 --interval 5
+"""
+
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api.email_outbox import DEFAULT_BATCH_SIZE, MAX_ATTEMPTS, process_outbox_batch
+
+
+class Command(BaseCommand):
+    help = 'Envia os emails pendentes do outbox em lotes, reaproveitando a conexão SMTP.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drena os emails vencidos e sai (sem ficar aguardando novos).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Quantidade de emails por lote (padrão: {DEFAULT_BATCH_SIZE}).',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Segundos de espera quando a fila está vazia (padrão: 5).',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=MAX_ATTEMPTS,
+            help=f'Tentativas antes de marcar o email como falho (padrão: {MAX_ATTEMPTS}).',
+        )
+
+    def handle(self, *args, **options):
+        once = options['once']
+        batch_size = options['batch_size']
+        interval = options['interval']
+        max_attempts = options['max_attempts']
+
+        totals = {'sent': 0, 'retried': 0, 'failed': 0}
+        connection = get_connection()
+
+        try:
+            while True:
+                try:
+                    result = process_outbox_batch(connection, batch_size=batch_size, max_attempts=max_attempts)
+                except Exception as e:
+                    # Banco ou SMTP fora do ar: registra e tenta de novo no próximo ciclo
+                    self.stdout.write(self.style.ERROR(f'Erro no lote do outbox: {e}'))
+                    close_old_connections()
+                    if once:
+                        break
+                    time.sleep(interval)
+                    continue
+
+                for key, value in result.items():
+                    totals[key] += value
+
+                if any(result.values()):
+                    self.stdout.write(
+                        f'[{timezone.now():%Y-%m-%d %H:%M:%S}] Lote: {result["sent"]} enviado(s), '
+                        f'{result["retried"]} para retentar, {result["failed"]} falho(s)'
+                    )
+
+                # Lote cheio: provavelmente há mais emails esperando
+                if sum(result.values()) >= batch_size:
+                    continue
+                if once:
+                    break
+                # Fila vazia: libera a conexão SMTP enquanto espera
+                connection.close()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Concluído: {totals["sent"]} enviado(s), {totals["retried"]} para retentar, {totals["failed"]} falho(s).'
+        ))
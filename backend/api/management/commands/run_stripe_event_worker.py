@@ -0,0 +1,81 @@
+"""
+Management command que processa os eventos de webhook do Stripe gravados
+em StripeEvent.
+
+Os eventos são processados em ordem de criação no Stripe; falhas são
+retentadas com backoff exponencial até --max-attempts.
+
+Uso:
+    python manage.py run_stripe_event_worker          # roda continuamente
+    python manage.py run_stripe_event_worker --once   # drena a fila e sai
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.stripe_events import DEFAULT_BATCH_SIZE, MAX_ATTEMPTS, process_stripe_event_batch
+
+
+class Command(BaseCommand):
+    help = 'Processa os eventos de webhook do Stripe recebidos, em ordem.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drena os eventos vencidos e sai (sem ficar aguardando novos).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Quantidade de eventos por lote (padrão: {DEFAULT_BATCH_SIZE}).',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Segundos de espera quando a fila está vazia (padrão: 1).',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=MAX_ATTEMPTS,
+            help=f'Tentativas antes de marcar o evento como falho (padrão: {MAX_ATTEMPTS}).',
+        )
+
+    def handle(self, *args, **options):
+        once = options['once']
+        batch_size = options['batch_size']
+        interval = options['interval']
+        max_attempts = options['max_attempts']
+
+        totals = {'processed': 0, 'retried': 0, 'failed': 0}
+
+        try:
+            while True:
+                result = process_stripe_event_batch(batch_size=batch_size, max_attempts=max_attempts)
+                for key, value in result.items():
+                    totals[key] += value
+
+                if any(result.values()):
+                    self.stdout.write(
+                        f'[{timezone.now():%Y-%m-%d %H:%M:%S}] Lote: {result["processed"]} processado(s), '
+                        f'{result["retried"]} para retentar, {result["failed"]} falho(s)'
+                    )
+
+                # Lote cheio: provavelmente há mais eventos esperando
+                if sum(result.values()) >= batch_size:
+                    continue
+                if once:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Concluído: {totals["processed"]} processado(s), {totals["retried"]} para retentar, '
+            f'{totals["failed"]} falho(s).'
+        ))
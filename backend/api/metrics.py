@@ -0,0 +1,98 @@
+"""
+Métricas no formato do Prometheus (GET /api/metrics/)
+
+O MetricsMiddleware registra, por rota (nome da view, ex.:
+'api:verify_payment_status') e método:
+
+- http_requests_total: requisições por status;
+- http_request_duration_seconds: histograma de latência;
+- http_request_db_queries: histograma de consultas SQL por requisição;
+- http_requests_in_progress: requisições em andamento por worker (pid).
+
+E, por alvo, outbound_call_duration_seconds: latência das chamadas ao
+Stripe, AbacatePay, SMTP e das consultas SQL (spans de api/tracing.py).
+
+O cliente do AbacatePay (api/abacatepay_client.py) registra, por endpoint e
+status da última tentativa ('error' em falha de rede), a latência total da
+chamada com repetições (abacatepay_request_duration_seconds) e as repetições
+(abacatepay_retries_total).
+
+Com vários workers do gunicorn cada processo grava suas métricas em arquivos
+em PROMETHEUS_MULTIPROC_DIR (ver gunicorn.conf.py) e a exportação soma todos
+os processos. Sem a variável (runserver, testes), vale apenas o processo atual.
+
+A exportação inclui também os contadores do cache de sessões do Stripe
+(stripe_sessions.session_cache_stats), que já são compartilhados no Redis.
+"""
+import os
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+OUTBOUND_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUESTS = Counter(
+    'http_requests_total', 'Requisições HTTP por rota, método e status',
+    ['route', 'method', 'status'],
+)
+LATENCY = Histogram(
+    'http_request_duration_seconds', 'Latência das requisições HTTP',
+    ['route', 'method'], buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Consultas SQL por requisição HTTP',
+    ['route', 'method'], buckets=QUERY_BUCKETS,
+)
+OUTBOUND_LATENCY = Histogram(
+    'outbound_call_duration_seconds', 'Latência das chamadas ao Stripe, AbacatePay, SMTP e banco',
+    ['target'], buckets=OUTBOUND_BUCKETS,
+)
+ABACATEPAY_LATENCY = Histogram(
+    'abacatepay_request_duration_seconds', 'Latência das chamadas ao AbacatePay, incluindo repetições',
+    ['endpoint', 'status'], buckets=OUTBOUND_BUCKETS,
+)
+ABACATEPAY_RETRIES = Counter(
+    'abacatepay_retries_total', 'Repetições de chamadas ao AbacatePay',
+    ['endpoint'],
+)
+IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Requisições HTTP em andamento por worker',
+    multiprocess_mode='liveall',
+)
+
+
+class StripeSessionCacheCollector:
+    """Contadores do cache de status das sessões do Stripe, lidos na exportação"""
+
+    def collect(self):
+        from .stripe_sessions import session_cache_stats
+
+        family = CounterMetricFamily(
+            'stripe_session_status', 'Consultas de status de sessão do Stripe por origem', labels=['source'],
+        )
+        try:
+            for source, count in session_cache_stats().items():
+                family.add_metric([source], count)
+        except Exception as e:
+            print(f"Erro ao ler contadores do cache de sessões: {e}")
+        yield family
+
+
+def _registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics():
+    """Texto de exportação de todas as métricas (todos os workers)"""
+    registry = _registry()
+    output = generate_latest(registry)
+    extra = CollectorRegistry(auto_describe=False)
+    extra.register(StripeSessionCacheCollector())
+    return output + generate_latest(extra)
@@ -1,5 +1,80 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.urls import Resolver404, resolve
 from django.utils.deprecation import MiddlewareMixin
 
+from .metrics import DB_QUERIES, IN_PROGRESS, LATENCY, REQUESTS
+from .rate_limit import client_ip, route_scope, take_token
+from .tracing import end_trace, start_trace
+
+
+class MetricsMiddleware:
+    """
+    Latência, status, consultas SQL e requisições em andamento por rota (api/metrics.py).
+
+    Abre o trace da requisição (api/tracing.py) e devolve os spans no header
+    Server-Timing quando SERVER_TIMING_ENABLED.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Sob ASGI a cadeia inteira fica assíncrona e as views async_views
+        # não ocupam uma thread durante a chamada ao gateway
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        trace, token = start_trace()
+        started = time.perf_counter()
+        IN_PROGRESS.inc()
+        try:
+            response = self.get_response(request)
+        finally:
+            IN_PROGRESS.dec()
+            end_trace(token)
+        return self.observe(request, response, trace, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        trace, token = start_trace()
+        started = time.perf_counter()
+        IN_PROGRESS.inc()
+        try:
+            response = await self.get_response(request)
+        finally:
+            IN_PROGRESS.dec()
+            end_trace(token)
+        return self.observe(request, response, trace, time.perf_counter() - started)
+
+    def observe(self, request, response, trace, elapsed):
+        route = self.route_name(request)
+        REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+        LATENCY.labels(route, request.method).observe(elapsed)
+        DB_QUERIES.labels(route, request.method).observe(trace.count('db'))
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = trace.server_timing(elapsed)
+        return response
+
+    @staticmethod
+    def route_name(request):
+        # Nome da view, não o caminho: IDs na URL não viram séries novas
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # Resposta antes da resolução da URL (ex.: 429 do rate limiting)
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                return 'unmatched'
+        return match.view_name or 'unmatched'
+
 
 class SecurityHeadersMiddleware(MiddlewareMixin):
     """
@@ -19,6 +94,37 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
         if request.path.startswith('/api/'):
             response['Access-Control-Allow-Origin'] = '*'
             response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-            response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+            response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Idempotency-Key'
         
-        return response
\ No newline at end of file
+        return response
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Aplica os limites de RATE_LIMITS por rota e IP do cliente (api/rate_limit.py)
+    """
+
+    def process_request(self, request):
+        if not settings.RATE_LIMIT_ENABLED:
+            return None
+        scope = route_scope(request)
+        if scope is None:
+            return None
+
+        ip = client_ip(request)
+        allowed, remaining, retry_after = take_token(scope, ip)
+        request.rate_limit = (settings.RATE_LIMITS[scope], remaining)
+        if allowed:
+            return None
+
+        from .views import rate_limit_exceeded
+        print(f"Rate limit excedido para IP {ip} em {request.path} ({scope})")
+        return rate_limit_exceeded(request, retry_after=retry_after)
+
+    def process_response(self, request, response):
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            limit, remaining = rate_limit
+            response['X-RateLimit-Limit'] = limit
+            response['X-RateLimit-Remaining'] = str(remaining)
+        return response
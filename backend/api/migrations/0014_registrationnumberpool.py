@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 01:19
+
+from django.db import migrations, models
+
+
+def fill_pool(apps, schema_editor):
+    from api.registration_numbers import fill_registration_number_pool
+
+    fill_registration_number_pool(
+        apps.get_model('api', 'RegistrationNumberPool'),
+        apps.get_model('api', 'RaceRegistration'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_safe_fix_abacatepay_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationNumberPool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=5, unique=True, verbose_name='Número de Inscrição')),
+            ],
+            options={
+                'verbose_name': 'Número de Inscrição Disponível',
+                'verbose_name_plural': 'Números de Inscrição Disponíveis',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(fill_pool, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:03
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('subject', models.CharField(max_length=255, verbose_name='Assunto')),
+                ('message', models.TextField(verbose_name='Mensagem')),
+                ('status', models.CharField(choices=[('queued', 'Na fila'), ('running', 'Enviando'), ('done', 'Concluído')], default='queued', max_length=10, verbose_name='Status')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total de destinatários')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Erro')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='Último sinal do worker')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado em')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Concluído em')),
+            ],
+            options={
+                'verbose_name': 'Envio em Massa',
+                'verbose_name_plural': 'Envios em Massa',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BroadcastRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('full_name', models.CharField(max_length=200, verbose_name='Nome')),
+                ('status', models.CharField(choices=[('PENDING', 'Pendente'), ('SENT', 'Enviado'), ('FAILED', 'Falhou')], default='PENDING', max_length=10, verbose_name='Status')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Erro')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+                ('broadcast', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='api.broadcast', verbose_name='Envio')),
+                ('registration', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcast_deliveries', to='api.raceregistration', verbose_name='Inscrição')),
+            ],
+            options={
+                'verbose_name': 'Destinatário do Envio',
+                'verbose_name_plural': 'Destinatários do Envio',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['broadcast', 'status'], name='broadcastrecipient_status_idx')],
+            },
+        ),
+    ]
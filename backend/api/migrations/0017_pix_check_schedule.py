@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:40
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_pending_pix(apps, schema_editor):
+    """PIX pendentes já existentes entram na próxima passada do verificador"""
+    RaceRegistration = apps.get_model('api', 'RaceRegistration')
+    RaceRegistration.objects.filter(
+        payment_status='PENDING',
+        abacatepay_pix_id__isnull=False,
+    ).exclude(
+        abacatepay_pix_id='',
+    ).update(next_check_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_broadcast_broadcastrecipient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='raceregistration',
+            name='pix_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Expiração do PIX'),
+        ),
+        migrations.AddField(
+            model_name='raceregistration',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Próxima verificação do PIX'),
+        ),
+        migrations.AddField(
+            model_name='raceregistration',
+            name='check_attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Verificações do PIX realizadas'),
+        ),
+        migrations.RunPython(schedule_pending_pix, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_pix_check_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbacatePayWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='ID do Evento')),
+                ('event_type', models.CharField(max_length=100, verbose_name='Tipo do Evento')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Recebido em')),
+                ('registration', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='abacatepay_events', to='api.raceregistration', verbose_name='Inscrição')),
+            ],
+            options={
+                'verbose_name': 'Evento de Webhook AbacatePay',
+                'verbose_name_plural': 'Eventos de Webhook AbacatePay',
+                'ordering': ['-received_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_abacatepaywebhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='ID do Evento')),
+                ('event_type', models.CharField(max_length=100, verbose_name='Tipo do Evento')),
+                ('payload', models.JSONField(verbose_name='Evento')),
+                ('stripe_created', models.DateTimeField(blank=True, null=True, verbose_name='Criado no Stripe')),
+                ('status', models.CharField(choices=[('PENDING', 'Pendente'), ('PROCESSED', 'Processado'), ('FAILED', 'Falhou')], default='PENDING', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Último erro')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Recebido em')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Processado em')),
+            ],
+            options={
+                'verbose_name': 'Evento de Webhook Stripe',
+                'verbose_name_plural': 'Eventos de Webhook Stripe',
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='stripeevent_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Índices criados com CONCURRENTLY para não travar as inscrições
+    atomic = False
+
+    dependencies = [
+        ('api', '0019_stripeevent'),
+    ]
+
+    operations = [
+        # A coluna já existe (RunSQL da 0013); registra o campo apenas no estado
+        # das migrações para poder indexá-lo
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='raceregistration',
+                    name='abacatepay_pix_id',
+                    field=models.CharField(blank=True, max_length=255, null=True, verbose_name='ID do PIX no AbacatePay'),
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name='raceregistration',
+            index=models.Index(fields=['abacatepay_pix_id'], name='reg_pix_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='raceregistration',
+            index=models.Index(fields=['cpf', 'payment_status'], name='reg_cpf_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='raceregistration',
+            index=models.Index(fields=['payment_status', '-created_at'], name='reg_status_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='raceregistration',
+            index=models.Index(fields=['-created_at'], name='reg_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='raceregistration',
+            index=models.Index(condition=models.Q(('stripe_checkout_session_id__isnull', False)), fields=['stripe_checkout_session_id'], name='reg_stripe_session_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='raceregistration',
+            index=models.Index(condition=models.Q(('abacatepay_pix_id__isnull', False), ('payment_status', 'PENDING')), fields=['next_check_at'], name='reg_pix_due_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='raceregistration',
+            index=models.Index(condition=models.Q(('registration_number__isnull', False)), fields=['full_name', 'id'], name='reg_numbered_name_idx'),
+        ),
+        # Substituído pelo índice parcial reg_pix_due_idx
+        migrations.AlterField(
+            model_name='raceregistration',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Próxima verificação do PIX'),
+        ),
+    ]
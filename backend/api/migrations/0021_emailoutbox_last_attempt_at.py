@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_raceregistration_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='last_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Última tentativa'),
+        ),
+        migrations.AlterField(
+            model_name='emailoutbox',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pendente'), ('SENDING', 'Enviando'), ('SENT', 'Enviado'), ('FAILED', 'Falhou')], default='PENDING', max_length=10, verbose_name='Status'),
+        ),
+    ]
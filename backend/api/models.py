@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
+import uuid
 
 
 class RaceRegistration(models.Model):
@@ -127,6 +129,21 @@ class RaceRegistration(models.Model):
         null=True,
         verbose_name="ID do PIX no AbacatePay"
     )
+    pix_expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Expiração do PIX"
+    )
+    # Agendamento da verificação do PIX (check_pending_pix); vazio = não verificar
+    next_check_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Próxima verificação do PIX"
+    )
+    check_attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Verificações do PIX realizadas"
+    )
     payment_amount = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -180,6 +197,34 @@ class RaceRegistration(models.Model):
         verbose_name = "Inscrição de Corrida"
         verbose_name_plural = "Inscrições de Corrida"
         ordering = ['-created_at']
+        indexes = [
+            # Webhook, simulate e check-status do PIX buscam pelo ID do AbacatePay
+            models.Index(fields=['abacatepay_pix_id'], name='reg_pix_id_idx'),
+            # validate_cpf: CPF já pago
+            models.Index(fields=['cpf', 'payment_status'], name='reg_cpf_status_idx'),
+            # Filtro por status ordenado pelos mais recentes (admin)
+            models.Index(fields=['payment_status', '-created_at'], name='reg_status_created_idx'),
+            # Listagem padrão (-created_at) e contagem de inscrições do dia
+            models.Index(fields=['-created_at'], name='reg_created_idx'),
+            # verify-status: sessão de checkout já paga
+            models.Index(
+                fields=['stripe_checkout_session_id'],
+                name='reg_stripe_session_idx',
+                condition=Q(stripe_checkout_session_id__isnull=False),
+            ),
+            # check_pending_pix: apenas PIX pendentes entram no índice
+            models.Index(
+                fields=['next_check_at'],
+                name='reg_pix_due_idx',
+                condition=Q(payment_status='PENDING', abacatepay_pix_id__isnull=False),
+            ),
+            # paid-registrations: inscrições numeradas em ordem alfabética (keyset)
+            models.Index(
+                fields=['full_name', 'id'],
+                name='reg_numbered_name_idx',
+                condition=Q(registration_number__isnull=False),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.full_name} - {self.cpf} - {self.get_payment_status_display()}"
@@ -211,3 +256,213 @@ class RaceRegistration(models.Model):
             adult_choices = dict(self.SHIRT_SIZE_CHOICES)
             return adult_choices.get(self.shirt_size, self.shirt_size)
 
+
+
+class RegistrationNumberPool(models.Model):
+    """
+    Pool pré-embaralhado de números de inscrição ainda disponíveis.
+
+    A ordem de inserção (id) já é aleatória, então alocar um número é apenas
+    remover a linha de menor id.
+    """
+    number = models.CharField(max_length=5, unique=True, verbose_name="Número de Inscrição")
+
+    class Meta:
+        verbose_name = "Número de Inscrição Disponível"
+        verbose_name_plural = "Números de Inscrição Disponíveis"
+        ordering = ['id']
+
+    def __str__(self):
+        return self.number
+
+
+class EmailOutbox(models.Model):
+    """
+    Fila transacional de emails.
+
+    A linha é gravada na mesma transação que muda o estado da inscrição e o
+    worker `run_email_worker` faz o envio fora do request.
+    """
+    KIND_PAYMENT_CONFIRMATION = 'PAYMENT_CONFIRMATION'
+    KIND_CHOICES = [
+        (KIND_PAYMENT_CONFIRMATION, 'Confirmação de pagamento'),
+    ]
+
+    STATUS_PENDING = 'PENDING'
+    STATUS_SENDING = 'SENDING'
+    STATUS_SENT = 'SENT'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendente'),
+        (STATUS_SENDING, 'Enviando'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    registration = models.ForeignKey(
+        RaceRegistration,
+        on_delete=models.CASCADE,
+        related_name='email_outbox',
+        verbose_name="Inscrição"
+    )
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, default=KIND_PAYMENT_CONFIRMATION, verbose_name="Tipo")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Status")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Próxima tentativa")
+    last_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name="Última tentativa")
+    last_error = models.TextField(blank=True, default='', verbose_name="Último erro")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Enviado em")
+
+    class Meta:
+        verbose_name = "Email na Fila"
+        verbose_name_plural = "Emails na Fila"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='emailoutbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.registration_id} ({self.status})"
+
+
+class Broadcast(models.Model):
+    """
+    Envio de email em massa.
+
+    O id é o task_id devolvido pela API; o worker `run_broadcast_worker`
+    envia para os destinatários e pode retomar após uma queda.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Na fila'),
+        (STATUS_RUNNING, 'Enviando'),
+        (STATUS_DONE, 'Concluído'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    subject = models.CharField(max_length=255, verbose_name="Assunto")
+    message = models.TextField(verbose_name="Mensagem")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name="Status")
+    total = models.PositiveIntegerField(default=0, verbose_name="Total de destinatários")
+    error = models.TextField(blank=True, default='', verbose_name="Erro")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Último sinal do worker")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Iniciado em")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Concluído em")
+
+    class Meta:
+        verbose_name = "Envio em Massa"
+        verbose_name_plural = "Envios em Massa"
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
+
+
+class BroadcastRecipient(models.Model):
+    """Status de entrega de um destinatário do envio em massa"""
+    STATUS_PENDING = 'PENDING'
+    STATUS_SENT = 'SENT'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendente'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, related_name='recipients', verbose_name="Envio")
+    registration = models.ForeignKey(
+        RaceRegistration,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='broadcast_deliveries',
+        verbose_name="Inscrição"
+    )
+    email = models.EmailField(verbose_name="Email")
+    full_name = models.CharField(max_length=200, verbose_name="Nome")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Status")
+    error = models.TextField(blank=True, default='', verbose_name="Erro")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Enviado em")
+
+    class Meta:
+        verbose_name = "Destinatário do Envio"
+        verbose_name_plural = "Destinatários do Envio"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['broadcast', 'status'], name='broadcastrecipient_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.status})"
+
+
+class AbacatePayWebhookEvent(models.Model):
+    """
+    Eventos de webhook do AbacatePay já recebidos.
+
+    O id do evento é único: reenvios do mesmo evento são ignorados sem
+    reprocessar o pagamento.
+    """
+    event_id = models.CharField(max_length=255, unique=True, verbose_name="ID do Evento")
+    event_type = models.CharField(max_length=100, verbose_name="Tipo do Evento")
+    registration = models.ForeignKey(
+        RaceRegistration,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='abacatepay_events',
+        verbose_name="Inscrição"
+    )
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Recebido em")
+
+    class Meta:
+        verbose_name = "Evento de Webhook AbacatePay"
+        verbose_name_plural = "Eventos de Webhook AbacatePay"
+        ordering = ['-received_at']
+
+    def __str__(self):
+        return f"{self.event_type} - {self.event_id}"
+
+
+class StripeEvent(models.Model):
+    """
+    Eventos de webhook do Stripe recebidos.
+
+    O webhook apenas verifica a assinatura, grava o evento bruto e responde;
+    o worker `run_stripe_event_worker` processa os eventos em ordem. O id do
+    evento é único, então reenvios do Stripe não são processados de novo.
+    """
+    STATUS_PENDING = 'PENDING'
+    STATUS_PROCESSED = 'PROCESSED'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendente'),
+        (STATUS_PROCESSED, 'Processado'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True, verbose_name="ID do Evento")
+    event_type = models.CharField(max_length=100, verbose_name="Tipo do Evento")
+    payload = models.JSONField(verbose_name="Evento")
+    stripe_created = models.DateTimeField(null=True, blank=True, verbose_name="Criado no Stripe")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Status")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Próxima tentativa")
+    last_error = models.TextField(blank=True, default='', verbose_name="Último erro")
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Recebido em")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Processado em")
+
+    class Meta:
+        verbose_name = "Evento de Webhook Stripe"
+        verbose_name_plural = "Eventos de Webhook Stripe"
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='stripeevent_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} - {self.event_id} ({self.status})"
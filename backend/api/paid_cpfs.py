@@ -0,0 +1,145 @@
+"""
+Conjunto de CPFs com inscrição paga, no Redis
+
+validate_cpf responde com um SISMEMBER em vez de consultar o banco a cada
+tentativa de inscrição adulta. O conjunto é mantido pelos signals de
+RaceRegistration (api/signals.py) após o commit e montado a partir do banco
+por `manage.py rebuild_paid_cpfs` (roda ao subir o container).
+
+Durante a remontagem os CPFs incluídos e removidos pelos signals também vão
+para conjuntos auxiliares, aplicados ao novo conjunto na troca: nenhuma
+alteração feita entre a leitura do banco e a troca se perde.
+
+Enquanto o conjunto não foi montado, sem Redis (ex.: LocMemCache nos testes)
+ou se ele falhar, a consulta vai ao banco.
+"""
+import uuid
+
+from .redis_utils import cache_key, get_redis_connection_or_none
+
+PAID_CPFS_KEY = 'paid_cpfs'
+READY_KEY = 'paid_cpfs:ready'
+BUILDING_KEY = 'paid_cpfs:building'
+ADDED_DURING_BUILD_KEY = 'paid_cpfs:added'
+REMOVED_DURING_BUILD_KEY = 'paid_cpfs:removed'
+# Expira a marca de remontagem se o processo morrer no meio
+BUILD_TIMEOUT = 600
+BUILD_CHUNK = 1000
+
+
+def redis_available():
+    """Se o conjunto é mantido (cache 'default' é Redis)"""
+    return get_redis_connection_or_none() is not None
+
+
+def paid_cpfs_from_db():
+    """CPFs com ao menos uma inscrição paga"""
+    from .models import RaceRegistration
+    return set(
+        RaceRegistration.objects.filter(payment_status='PAID')
+        .exclude(cpf__isnull=True).exclude(cpf='')
+        .values_list('cpf', flat=True).distinct()
+    )
+
+
+def _db_has_paid_registration(cpf):
+    from .models import RaceRegistration
+    return RaceRegistration.objects.filter(cpf=cpf, payment_status='PAID').exists()
+
+
+def stored_paid_cpfs():
+    """Conteúdo atual do conjunto, ou None se ainda não foi montado (ou sem Redis)"""
+    client = get_redis_connection_or_none()
+    if client is None or not client.exists(cache_key(READY_KEY)):
+        return None
+    return {cpf.decode() for cpf in client.smembers(cache_key(PAID_CPFS_KEY))}
+
+
+def rebuild_paid_cpf_set(cpfs=None):
+    """
+    Monta o conjunto a partir do banco (ou de `cpfs`) e troca o atual de uma vez.
+    Retorna o número de CPFs, ou None sem Redis.
+    """
+    client = get_redis_connection_or_none()
+    if client is None:
+        return None
+
+    # A partir daqui add_paid_cpf e discard_paid_cpf também gravam nos conjuntos
+    # auxiliares. Uma alteração que não viu a marca roda após o commit, que veio
+    # antes da leitura
+    added_key = cache_key(ADDED_DURING_BUILD_KEY)
+    removed_key = cache_key(REMOVED_DURING_BUILD_KEY)
+    pipe = client.pipeline(transaction=True)
+    pipe.set(cache_key(BUILDING_KEY), 1, ex=BUILD_TIMEOUT)
+    pipe.delete(added_key, removed_key)
+    pipe.execute()
+
+    cpfs = sorted(paid_cpfs_from_db() if cpfs is None else cpfs)
+
+    # Monta em uma chave temporária para o conjunto nunca ficar parcial
+    temp_key = cache_key(f'{PAID_CPFS_KEY}:build:{uuid.uuid4().hex}')
+    pipe = client.pipeline(transaction=False)
+    for start in range(0, len(cpfs), BUILD_CHUNK):
+        pipe.sadd(temp_key, *cpfs[start:start + BUILD_CHUNK])
+    pipe.execute()
+
+    live_key = cache_key(PAID_CPFS_KEY)
+    pipe = client.pipeline(transaction=True)
+    pipe.sunionstore(live_key, [temp_key, added_key])
+    pipe.sdiffstore(live_key, [live_key, removed_key])
+    pipe.delete(temp_key, added_key, removed_key, cache_key(BUILDING_KEY))
+    pipe.set(cache_key(READY_KEY), 1)
+    pipe.execute()
+    return len(cpfs)
+
+
+def is_cpf_paid(cpf):
+    """Se já existe inscrição paga com este CPF (Redis; banco como reserva)"""
+    client = get_redis_connection_or_none()
+    if client is None:
+        return _db_has_paid_registration(cpf)
+
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.exists(cache_key(READY_KEY))
+        pipe.sismember(cache_key(PAID_CPFS_KEY), cpf)
+        ready, member = pipe.execute()
+        if ready:
+            return bool(member)
+    except Exception as e:
+        print(f"Erro ao consultar CPFs pagos no Redis: {e}")
+
+    # Conjunto ainda não montado (rebuild_paid_cpfs) ou Redis com erro
+    return _db_has_paid_registration(cpf)
+
+
+def _record_during_build(client, cpf, key, opposite_key):
+    # A alteração mais recente vence na troca
+    pipe = client.pipeline(transaction=True)
+    pipe.sadd(cache_key(key), cpf)
+    pipe.srem(cache_key(opposite_key), cpf)
+    pipe.execute()
+
+
+def add_paid_cpf(cpf):
+    """Inclui o CPF (inscrição marcada como paga)"""
+    try:
+        client = get_redis_connection_or_none()
+        if client is not None:
+            client.sadd(cache_key(PAID_CPFS_KEY), cpf)
+            if client.exists(cache_key(BUILDING_KEY)):
+                _record_during_build(client, cpf, ADDED_DURING_BUILD_KEY, REMOVED_DURING_BUILD_KEY)
+    except Exception as e:
+        print(f"Erro ao incluir CPF pago no Redis: {e}")
+
+
+def discard_paid_cpf(cpf):
+    """Remove o CPF se não restar nenhuma inscrição paga com ele"""
+    try:
+        client = get_redis_connection_or_none()
+        if client is not None and not _db_has_paid_registration(cpf):
+            client.srem(cache_key(PAID_CPFS_KEY), cpf)
+            if client.exists(cache_key(BUILDING_KEY)):
+                _record_during_build(client, cpf, REMOVED_DURING_BUILD_KEY, ADDED_DURING_BUILD_KEY)
+    except Exception as e:
+        print(f"Erro ao remover CPF pago do Redis: {e}")
@@ -0,0 +1,121 @@
+"""
+Criação da sessão de pagamento fora do request de inscrição.
+
+Com PAYMENT_SESSION_ASYNC ligado, o POST de inscrição grava a inscrição,
+agenda create_stripe_checkout_session num pool de threads do processo e
+responde 201 com um token. O cliente consulta
+/api/payment/session-status/<token>/ (apenas leitura no cache) até receber
+o checkout_url.
+
+Um job que não terminou em PAYMENT_SESSION_JOB_TIMEOUT segundos (ex.: o
+worker do gunicorn foi reciclado) é informado como 'failed'; o cliente
+então usa /api/payment/create-session/, que reaproveita a sessão se ela
+chegou a ser criada.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+JOB_KEY_PREFIX = 'payment_job:'
+JOB_TTL = 3600
+
+STATUS_PENDING = 'pending'
+STATUS_READY = 'ready'
+STATUS_AUTO_PAID = 'auto_paid'
+STATUS_FAILED = 'failed'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Pool de threads do processo (criado na primeira inscrição)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PAYMENT_SESSION_WORKERS,
+                    thread_name_prefix='payment-session',
+                )
+    return _executor
+
+
+def _job_key(token):
+    return f'{JOB_KEY_PREFIX}{token}'
+
+
+def _with_db_cleanup(func, *args):
+    # Cada thread do pool abre a própria conexão com o banco; fecha ao final
+    try:
+        func(*args)
+    finally:
+        connection.close()
+
+
+def _submit(func, *args):
+    get_executor().submit(_with_db_cleanup, func, *args)
+
+
+def run_checkout_job(token, registration_id, base_url, coupon_code):
+    """Cria a sessão de checkout e grava o resultado do job no cache"""
+    from .models import RaceRegistration
+    from .services import create_stripe_checkout_session
+
+    job = {'registration_id': registration_id}
+    try:
+        registration = RaceRegistration.objects.get(id=registration_id)
+        result = create_stripe_checkout_session(registration, base_url=base_url, coupon_code=coupon_code)
+    except Exception as e:
+        print(f"Erro no job de pagamento {token}: {e}")
+        result = {'success': False, 'error': f'Erro interno: {str(e)}'}
+
+    if not result['success']:
+        job.update(status=STATUS_FAILED, error=result['error'])
+    elif result.get('auto_paid'):
+        job.update(status=STATUS_AUTO_PAID, amount=0.0)
+    else:
+        job.update(
+            status=STATUS_READY,
+            checkout_url=result['checkout_url'],
+            session_id=result['session_id'],
+            amount=result['amount'],
+        )
+    cache.set(_job_key(token), job, timeout=JOB_TTL)
+
+
+def submit_checkout_session(registration_id, base_url=None, coupon_code=None):
+    """
+    Agenda a criação da sessão de checkout e retorna o token do job.
+
+    O job só é enviado ao pool depois do commit, para a thread enxergar a
+    inscrição recém criada.
+    """
+    token = uuid.uuid4().hex
+    cache.set(_job_key(token), {
+        'status': STATUS_PENDING,
+        'registration_id': registration_id,
+        'submitted_at': time.time(),
+    }, timeout=JOB_TTL)
+    transaction.on_commit(lambda: _submit(run_checkout_job, token, registration_id, base_url, coupon_code))
+    return token
+
+
+def get_payment_job(token):
+    """Estado do job ({'status': ..., ...}) ou None se o token não existe"""
+    job = cache.get(_job_key(token))
+    if job is None:
+        return None
+    if job['status'] == STATUS_PENDING and time.time() - job['submitted_at'] > settings.PAYMENT_SESSION_JOB_TIMEOUT:
+        return {
+            'status': STATUS_FAILED,
+            'registration_id': job['registration_id'],
+            'error': 'Tempo esgotado ao criar a sessão de pagamento; use /api/payment/create-session/',
+        }
+    job.pop('submitted_at', None)
+    return job
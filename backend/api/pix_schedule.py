@@ -0,0 +1,87 @@
+"""
+Agendamento das verificações de PIX pendentes.
+
+Cada inscrição com PIX guarda `next_check_at` e `check_attempts`. PIX recém
+criados são verificados com frequência; depois o intervalo cresce
+exponencialmente. Passada a expiração do QR Code (com uma folga para
+pagamentos feitos no último minuto), a verificação é estacionada
+(`next_check_at` vazio) e o PIX sai da fila do check_pending_pix.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+PIX_EXPIRES_IN = 3600  # segundos, enviado ao AbacatePay na criação do QR Code
+
+FIRST_CHECK_DELAY = timedelta(seconds=30)
+FRESH_ATTEMPTS = 10
+FRESH_INTERVAL = timedelta(minutes=1)
+BACKOFF_BASE = timedelta(minutes=2)
+BACKOFF_MAX = timedelta(hours=6)
+EXPIRY_GRACE = timedelta(minutes=10)
+# PIX sem data de expiração conhecida (anteriores a este agendamento)
+MAX_ATTEMPTS_WITHOUT_EXPIRY = 20
+
+
+def parse_expires_at(value):
+    """Converte o expiresAt do AbacatePay (ISO 8601) em datetime, ou None"""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def initial_schedule(now=None, expires_at=None):
+    """Campos para um PIX recém criado"""
+    now = now or timezone.now()
+    return {
+        'pix_expires_at': expires_at or now + timedelta(seconds=PIX_EXPIRES_IN),
+        'next_check_at': now + FIRST_CHECK_DELAY,
+        'check_attempts': 0,
+    }
+
+
+def next_check_after(attempts, expires_at, now=None):
+    """
+    Horário da próxima verificação depois de `attempts` verificações sem
+    pagamento confirmado, ou None se o PIX deve ser estacionado.
+    """
+    now = now or timezone.now()
+
+    if expires_at is not None:
+        deadline = expires_at + EXPIRY_GRACE
+        if now >= deadline:
+            return None
+    elif attempts >= MAX_ATTEMPTS_WITHOUT_EXPIRY:
+        return None
+
+    if attempts < FRESH_ATTEMPTS:
+        delay = FRESH_INTERVAL
+    else:
+        delay = min(BACKOFF_BASE * (2 ** (attempts - FRESH_ATTEMPTS)), BACKOFF_MAX)
+    next_check = now + delay
+
+    # Sempre uma última verificação logo após a expiração
+    if expires_at is not None:
+        next_check = min(next_check, expires_at + EXPIRY_GRACE)
+    return next_check
+
+
+def due_pix_checks(now=None):
+    """Inscrições pendentes cujo PIX deve ser verificado agora"""
+    from .models import RaceRegistration
+
+    now = now or timezone.now()
+    return RaceRegistration.objects.filter(
+        payment_status='PENDING',
+        abacatepay_pix_id__isnull=False,
+        next_check_at__lte=now,
+    ).exclude(
+        abacatepay_pix_id='',
+    )
@@ -0,0 +1,144 @@
+"""
+Rate limiting por rota e IP do cliente (token bucket)
+
+Cada rota limitada tem um escopo em RATE_LIMITS (ex.: 'registration': '10/h'):
+o balde de cada IP comporta até N requisições seguidas e se recompõe
+continuamente a N por período. No Redis, a verificação é uma única chamada
+atômica (script Lua que lê, recompõe, consome e grava o balde, usando o
+relógio do próprio Redis para todos os workers concordarem).
+
+Sem Redis (ex.: LocMemCache nos testes) o balde fica no cache do processo.
+Se o Redis falhar, a requisição passa: o limite não derruba a API.
+
+O IP vem de RATE_LIMIT_CLIENT_IP_HEADER (ex.: X-Forwarded-For), contando
+RATE_LIMIT_PROXY_COUNT proxies confiáveis a partir da direita, como o
+SECURE_PROXY_SSL_HEADER; sem proxies configurados usa REMOTE_ADDR.
+"""
+import functools
+import ipaddress
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .redis_utils import cache_key, get_redis_connection_or_none
+
+KEY_PREFIX = 'rate_limit:'
+
+# (método, caminho) -> escopo em settings.RATE_LIMITS. Os webhooks de pagamento
+# ficam de fora: chegam dos poucos IPs dos gateways e um 429 atrasaria o PAID
+RATE_LIMITED_ROUTES = {
+    ('POST', '/api/race-registrations/'): 'registration',
+    ('POST', '/api/payment/create-session/'): 'payment',
+    ('POST', '/api/payment/pix/create/'): 'pix',
+    ('GET', '/api/payment/verify-status/'): 'verify_payment',
+    ('GET', '/api/payment/pix/check-status/'): 'pix_status',
+    ('GET', '/api/race-statistics/'): 'statistics',
+}
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# KEYS[1] = balde; ARGV[1] = capacidade; ARGV[2] = fichas por segundo
+# Retorna {permitido (0/1), fichas restantes, segundos até a próxima ficha}
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+
+local retry_after = 0
+if allowed == 0 then
+    retry_after = math.ceil((1 - tokens) / rate)
+end
+return {allowed, math.floor(tokens), retry_after}
+"""
+
+_script = None
+_local_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'10/h' -> (10, 3600); períodos aceitos: s, m, h, d"""
+    count, period = rate.split('/')
+    return int(count), _PERIODS[period.strip().lower()[0]]
+
+
+def route_scope(request):
+    """Escopo do limite da rota, ou None se a rota não é limitada"""
+    return RATE_LIMITED_ROUTES.get((request.method, request.path_info))
+
+
+def client_ip(request):
+    """IP do cliente, considerando os proxies confiáveis à frente da API"""
+    header = settings.RATE_LIMIT_CLIENT_IP_HEADER
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    if header and proxies > 0:
+        forwarded = [ip.strip() for ip in request.META.get(header, '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            candidate = forwarded[-proxies]
+            try:
+                return str(ipaddress.ip_address(candidate))
+            except ValueError:
+                pass
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _token_bucket_script(client):
+    global _script
+    if _script is None:
+        _script = client.register_script(_TOKEN_BUCKET_LUA)
+    return _script
+
+
+def _take_token_cache(key, capacity, per_second):
+    # Mesmo algoritmo do script, com o balde no cache do processo
+    with _local_lock:
+        now = time.time()
+        state = cache.get(key)
+        tokens, ts = state if isinstance(state, tuple) else (capacity, now)
+        tokens = min(capacity, tokens + max(0.0, now - ts) * per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(key, (tokens, now), timeout=math.ceil(capacity / per_second) + 1)
+    retry_after = 0 if allowed else math.ceil((1 - tokens) / per_second)
+    return allowed, math.floor(tokens), retry_after
+
+
+def take_token(scope, ip):
+    """
+    Consome uma ficha do balde (escopo, IP).
+    Retorna (permitido, fichas restantes, segundos até a próxima ficha).
+    """
+    capacity, period = parse_rate(settings.RATE_LIMITS[scope])
+    per_second = capacity / period
+    key = f'{KEY_PREFIX}{scope}:{ip}'
+
+    client = get_redis_connection_or_none()
+    if client is None:
+        return _take_token_cache(key, capacity, per_second)
+
+    try:
+        allowed, remaining, retry_after = _token_bucket_script(client)(
+            keys=[cache_key(key)], args=[capacity, per_second], client=client,
+        )
+    except Exception as e:
+        print(f"Erro no rate limiting ({scope}): {e}")
+        return True, capacity, 0
+    return bool(allowed), remaining, retry_after
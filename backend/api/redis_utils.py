@@ -0,0 +1,22 @@
+"""
+Acesso ao Redis por trás do cache padrão do Django
+
+Algumas estruturas (contadores, hashes, scripts Lua) precisam do cliente Redis
+cru. Quando o cache configurado não é Redis (ex.: LocMemCache nos testes), as
+funções retornam None e o chamador usa a API genérica de cache.
+"""
+from django.core.cache import cache
+
+
+def get_redis_connection_or_none():
+    """Cliente Redis do cache 'default', ou None se o backend não for Redis"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def cache_key(name):
+    """Chave completa (com KEY_PREFIX e versão) usada pelo cache para 'name'"""
+    return cache.make_key(name)
@@ -0,0 +1,79 @@
+"""
+Alocador de números de inscrição baseado em um pool pré-embaralhado.
+
+Em vez de sortear um número e consultar o banco até achar um livre, todos os
+números de 5 dígitos ainda não usados ficam numa tabela (RegistrationNumberPool)
+inserida em ordem aleatória. Alocar é remover a primeira linha disponível com
+SELECT ... FOR UPDATE SKIP LOCKED: uma operação atômica, sem sorteio e sem retry.
+"""
+import random
+
+from django.db import transaction
+
+NUMBER_MIN = 10000
+NUMBER_MAX = 99999
+FILL_BATCH_SIZE = 5000
+
+
+class RegistrationNumberPoolExhausted(Exception):
+    """Não há mais números de inscrição disponíveis no pool."""
+
+
+def fill_registration_number_pool(pool_model, registration_model) -> int:
+    """
+    Preenche o pool com todos os números ainda não usados, em ordem aleatória.
+
+    Recebe as classes de modelo para poder ser usada também em migrações
+    (com os modelos históricos). Retorna quantos números foram inseridos.
+    """
+    used = set(
+        registration_model.objects.exclude(registration_number__isnull=True)
+        .exclude(registration_number='')
+        .values_list('registration_number', flat=True)
+    )
+    used.update(pool_model.objects.values_list('number', flat=True))
+
+    numbers = [str(n) for n in range(NUMBER_MIN, NUMBER_MAX + 1) if str(n) not in used]
+    random.shuffle(numbers)
+
+    pool_model.objects.bulk_create(
+        [pool_model(number=n) for n in numbers],
+        batch_size=FILL_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return len(numbers)
+
+
+def _pop():
+    from .models import RegistrationNumberPool
+
+    with transaction.atomic():
+        slot = (
+            RegistrationNumberPool.objects.select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'number')
+            .first()
+        )
+        if slot is None:
+            return None
+        RegistrationNumberPool.objects.filter(id=slot[0]).delete()
+        return slot[1]
+
+
+def allocate_registration_number() -> str:
+    """
+    Retira um número do pool de forma atômica.
+
+    Se o pool nunca foi preenchido (ex.: banco de testes sem migrações), ele é
+    preenchido uma única vez antes de tentar novamente.
+    """
+    number = _pop()
+    if number is not None:
+        return number
+
+    from .models import RaceRegistration, RegistrationNumberPool
+    if fill_registration_number_pool(RegistrationNumberPool, RaceRegistration):
+        number = _pop()
+    if number is None:
+        raise RegistrationNumberPoolExhausted('Todos os números de inscrição já foram utilizados.')
+    return number
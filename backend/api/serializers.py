@@ -92,13 +92,9 @@ class RaceRegistrationSerializer(serializers.ModelSerializer):
             return cpf
         
         # Para ADULTO, verificar se já existe inscrição PAGA com este CPF
-        from .models import RaceRegistration
-        existing_paid = RaceRegistration.objects.filter(
-            cpf=cpf, 
-            payment_status='PAID'
-        ).exists()
-        
-        if existing_paid:
+        # (conjunto de CPFs pagos no Redis; banco se o Redis não estiver disponível)
+        from .paid_cpfs import is_cpf_paid
+        if is_cpf_paid(cpf):
             raise serializers.ValidationError(
                 "Já existe uma inscrição paga com este CPF. "
                 "Se você não completou o pagamento anterior, pode tentar novamente."
@@ -7,20 +7,52 @@ from django.db import transaction, IntegrityError
 from decouple import config
 from email.header import Header
 from email.utils import formataddr
+import asyncio
+import base64
+import hashlib
+import hmac
+import httpx
+import weakref
 import stripe
-import random
 import requests
+from asgiref.sync import sync_to_async
+
+from . import abacatepay_client
+from .tracing import span
+from .registration_numbers import allocate_registration_number
+from .pix_schedule import PIX_EXPIRES_IN, initial_schedule, parse_expires_at
+from .stripe_sessions import find_reusable_checkout_session, remember_checkout_session
 
 # Configurar Stripe com a chave secreta
 stripe.api_key = settings.STRIPE_SECRET_KEY
+if settings.STRIPE_API_BASE:
+    # Stripe falso (testes/fake_stripe.py) em testes de carga offline
+    stripe.api_base = settings.STRIPE_API_BASE
+
+# Clientes HTTP assíncronos do Stripe, um por event loop (as conexões do
+# httpx não podem ser usadas em outro loop)
+_stripe_async_http_clients = weakref.WeakKeyDictionary()
+
+
+def get_stripe_async_client():
+    """
+    StripeClient para as chamadas *_async das views assíncronas
+
+    Usa a mesma chave, api_base e política de repetição da API global
+    (stripe.api_key etc.), lidas a cada chamada.
+    """
+    loop = asyncio.get_running_loop()
+    http_client = _stripe_async_http_clients.get(loop)
+    if http_client is None:
+        http_client = stripe.HTTPXClient()
+        _stripe_async_http_clients[loop] = http_client
+    return stripe.StripeClient(
+        stripe.api_key,
+        base_addresses={'api': stripe.api_base},
+        max_network_retries=stripe.max_network_retries,
+        http_client=http_client,
+    )
 
-# Configuração AbacatePay
-ABACATEPAY_API_KEY = config('ABACATEPAY_API_KEY', default='abc_dev_B56yaqbnxKKqUat1hM1qTX4y')
-ABACATEPAY_BASE_URL = config('ABACATEPAY_BASE_URL', default='https://api.abacatepay.com/v1')
-ABACATEPAY_HEADERS = {
-    "Authorization": f"Bearer {ABACATEPAY_API_KEY}",
-    "Content-Type": "application/json",
-}
 
 # Cupons de desconto configurados no código
 AVAILABLE_COUPONS = {
@@ -182,47 +214,39 @@ def validate_coupon_code(coupon_code, modality=None):
 
 def generate_unique_registration_number():
     """
-    Gera um número único de 5 dígitos para inscrição
+    Retira um número único de 5 dígitos do pool pré-embaralhado
     """
-    from .models import RaceRegistration
-    
-    max_attempts = 100  # Evitar loop infinito
-    attempts = 0
-    
-    while attempts < max_attempts:
-        # Gera número de 5 dígitos (10000 a 99999)
-        number = str(random.randint(10000, 99999))
-        
-        # Verifica se já existe
-        if not RaceRegistration.objects.filter(registration_number=number).exists():
-            return number
-        
-        attempts += 1
-    
-    # Se não conseguir gerar um número único, usar timestamp
-    return str(int(timezone.now().timestamp()))[-5:].zfill(5)
+    return allocate_registration_number()
+
 
+def _assign_registration_number_with_retry(registration, update_fields=()) -> None:
+    """
+    Atribui registration_number retirado do pool e salva junto com update_fields.
 
-def _assign_registration_number_with_retry(registration) -> None:
-    """Atribui registration_number com retry defensivo contra colisão."""
+    O pool nunca entrega o mesmo número duas vezes; o retry só cobre números
+    atribuídos manualmente (admin) que ainda estavam no pool.
+    """
+    fields = ['registration_number', *update_fields]
     max_retries = 3
     for _ in range(max_retries):
-        registration.registration_number = generate_unique_registration_number()
+        registration.registration_number = allocate_registration_number()
         try:
-            registration.save(update_fields=['registration_number'])
+            # savepoint: uma IntegrityError não invalida a transação externa
+            with transaction.atomic():
+                registration.save(update_fields=fields)
             return
         except IntegrityError:
-            # colisão rara: tentar outro número
+            # número já usado fora do pool: descartado, tentar o próximo
             continue
     # última tentativa fora do loop; se falhar, propaga
-    registration.registration_number = generate_unique_registration_number()
-    registration.save(update_fields=['registration_number'])
+    registration.registration_number = allocate_registration_number()
+    registration.save(update_fields=fields)
 
 ## Removido: envio de email de confirmação de inscrição (apenas email de pagamento é mantido)
 
-def send_payment_confirmation_email(registration):
+def build_payment_confirmation_email(registration, connection=None):
     """
-    Envia email de confirmação do pagamento (quando o pagamento é aprovado)
+    Monta o email de confirmação do pagamento (sem enviar)
     """
     # Gera número de inscrição único se ainda não existe
     if not registration.registration_number:
@@ -280,31 +304,44 @@ def send_payment_confirmation_email(registration):
     # Renderiza o template de texto plano
     text_message = render_to_string('api/emails/payment_confirmation.txt', context)
     
+    # Garante que as mensagens estão em UTF-8
+    subject = force_str(subject, encoding='utf-8')
+    text_message = force_str(text_message, encoding='utf-8')
+    html_message = force_str(html_message, encoding='utf-8')
+    
+    # Remetente simples, sem emoji
+    friendly_from = formataddr((str(Header('Equipe Ad-moving', 'utf-8')), settings.DEFAULT_FROM_EMAIL))
+    
+    # Cria a mensagem de email com encoding UTF-8 explícito
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=text_message,
+        from_email=friendly_from,
+        to=[registration.email],
+        connection=connection,
+    )
+    
+    # Define o encoding UTF-8
+    email.encoding = 'utf-8'
+    
+    # Adiciona a versão HTML com charset
+    email.attach_alternative(html_message, 'text/html; charset=utf-8')
+    return email
+
+
+def send_payment_confirmation_email(registration):
+    """
+    Envia email de confirmação do pagamento imediatamente (reenvios pelo admin).
+
+    O fluxo de pagamento não chama esta função: ele enfileira o email em
+    EmailOutbox e o worker `run_email_worker` faz o envio.
+    """
     try:
-        # Garante que as mensagens estão em UTF-8
-        subject = force_str(subject, encoding='utf-8')
-        text_message = force_str(text_message, encoding='utf-8')
-        html_message = force_str(html_message, encoding='utf-8')
-        
-        # Remetente simples, sem emoji
-        friendly_from = formataddr((str(Header('Equipe Ad-moving', 'utf-8')), settings.DEFAULT_FROM_EMAIL))
-        
-        # Cria a mensagem de email com encoding UTF-8 explícito
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_message,
-            from_email=friendly_from,
-            to=[registration.email]
-        )
-        
-        # Define o encoding UTF-8
-        email.encoding = 'utf-8'
-        
-        # Adiciona a versão HTML com charset
-        email.attach_alternative(html_message, 'text/html; charset=utf-8')
+        email = build_payment_confirmation_email(registration)
         
         # Envia o email
-        email.send(fail_silently=False)
+        with span('smtp'):
+            email.send(fail_silently=False)
         
         # Marca que o email de pagamento foi enviado
         registration.payment_email_sent = True
@@ -318,12 +355,28 @@ def send_payment_confirmation_email(registration):
         return False
 
 
+def enqueue_payment_confirmation_email(registration):
+    """
+    Enfileira o email de confirmação no outbox.
+
+    Deve ser chamada dentro da mesma transação que marca a inscrição como paga:
+    se a transação for desfeita, o email também não sai.
+    """
+    from .models import EmailOutbox
+    return EmailOutbox.objects.create(
+        registration=registration,
+        kind=EmailOutbox.KIND_PAYMENT_CONFIRMATION,
+    )
+
+
 def mark_registration_paid_atomic(registration_id: int, *, amount_reais: float | None = None, payment_intent_id: str | None = None) -> bool:
     """
     Marca inscrição como paga de forma transacional e idempotente.
     - Usa select_for_update para evitar condição de corrida
-    - Gera registration_number com retry em caso de colisão
-    - Envia email uma única vez
+    - Retira registration_number do pool de números (sem sorteio)
+    - Enfileira o email de confirmação (EmailOutbox) uma única vez, na mesma transação
+    - Contadores de estatísticas (pagos/pendentes) são ajustados pelo post_save
+      somente após o commit
     Retorna True se mudou o estado para PAID nesta chamada; False se já estava PAID.
     """
     from .models import RaceRegistration
@@ -346,197 +399,271 @@ def mark_registration_paid_atomic(registration_id: int, *, amount_reais: float |
             except Exception:
                 pass
 
+        update_fields = ['payment_status', 'payment_date', 'stripe_payment_intent_id', 'payment_amount']
         if not registration.registration_number:
-            _assign_registration_number_with_retry(registration)
+            _assign_registration_number_with_retry(registration, update_fields)
         else:
-            registration.save(update_fields=['payment_status', 'payment_date', 'stripe_payment_intent_id', 'payment_amount'])
+            registration.save(update_fields=update_fields)
 
-    # Enviar email fora do lock duro; ainda assim idempotente pelo flag
-    if not registration.payment_email_sent:
-        send_payment_confirmation_email(registration)
+        # Email vai para o outbox na mesma transação; o worker envia
+        if not registration.payment_email_sent:
+            enqueue_payment_confirmation_email(registration)
     return True
 
 
-def create_stripe_checkout_session(registration, base_url: str | None = None, coupon_code: str | None = None):
+def _prepare_stripe_checkout(registration, base_url=None, coupon_code=None):
     """
-    Cria uma sessão de checkout do Stripe para o pagamento da inscrição
+    Parte local da criação do checkout (cupom, valor, reaproveitamento e
+    parâmetros da sessão), comum às versões síncrona e assíncrona.
+
+    Retorna (resultado, None) quando não é preciso chamar o Stripe (valor
+    zero ou sessão reaproveitada) ou (None, (checkout_kwargs, amount, applied_coupon)).
     """
-    try:
-        # Determinar o valor baseado na modalidade
-        if registration.modality == 'INFANTIL':
-            amount = 7000  # R$ 70,00 em centavos
-            description = f"Inscrição Infantil - Corrida Ad-moving - {registration.full_name}"
-        else:
-            amount = 10000  # R$ 100,00 em centavos  
-            description = f"Inscrição Adulto - Corrida Ad-moving - {registration.full_name}"
-        
-        # Aplicar desconto do cupom se fornecido
-        coupon_discount = 0
-        if coupon_code:
-            print(f"DEBUG CUPOM: Cupom recebido: {coupon_code}")
-            print(f"DEBUG CUPOM: Modalidade: {registration.modality}")
-            print(f"DEBUG CUPOM: Valor original: R$ {amount/100:.2f}")
-            try:
-                is_valid, message, discount_amount = validate_coupon_code(coupon_code, registration.modality)
-                print(f"DEBUG CUPOM: Validação - válido={is_valid}, mensagem={message}, desconto={discount_amount}")
+    # Determinar o valor baseado na modalidade
+    if registration.modality == 'INFANTIL':
+        amount = 7000  # R$ 70,00 em centavos
+        description = f"Inscrição Infantil - Corrida Ad-moving - {registration.full_name}"
+    else:
+        amount = 10000  # R$ 100,00 em centavos  
+        description = f"Inscrição Adulto - Corrida Ad-moving - {registration.full_name}"
+    
+    # Aplicar desconto do cupom se fornecido
+    coupon_discount = 0
+    applied_coupon = ''
+    if coupon_code:
+        print(f"DEBUG CUPOM: Cupom recebido: {coupon_code}")
+        print(f"DEBUG CUPOM: Modalidade: {registration.modality}")
+        print(f"DEBUG CUPOM: Valor original: R$ {amount/100:.2f}")
+        try:
+            is_valid, message, discount_amount = validate_coupon_code(coupon_code, registration.modality)
+            print(f"DEBUG CUPOM: Validação - válido={is_valid}, mensagem={message}, desconto={discount_amount}")
+            
+            if is_valid and discount_amount > 0:
+                coupon_discount = int(discount_amount * 100)  # Converter para centavos
+                amount = max(amount - coupon_discount, 0)  # Não permitir valor negativo
+                applied_coupon = coupon_code.strip().upper()
+                print(f"DEBUG CUPOM: Valor com desconto: R$ {amount/100:.2f}")
                 
-                if is_valid and discount_amount > 0:
-                    coupon_discount = int(discount_amount * 100)  # Converter para centavos
-                    amount = max(amount - coupon_discount, 0)  # Não permitir valor negativo
-                    print(f"DEBUG CUPOM: Valor com desconto: R$ {amount/100:.2f}")
-                    
-                    # Salvar informações do cupom na inscrição (se o modelo tiver esses campos)
-                    try:
-                        registration.coupon_code = coupon_code.strip().upper()
-                        registration.coupon_discount = discount_amount
-                        registration.save(update_fields=['coupon_code', 'coupon_discount'])
-                        print(f"DEBUG CUPOM: Cupom salvo na inscrição")
-                    except Exception as ex:
-                        # Campos não existem no modelo, continuar sem salvar
-                        print(f"DEBUG CUPOM: Não foi possível salvar cupom: {ex}")
-                        pass
-                    
-                    description += f" (Desconto: R$ {discount_amount:.2f})"
-                else:
-                    print(f"DEBUG CUPOM: Cupom não aplicado - válido={is_valid}")
-                    
-            except Exception as e:
-                print(f"Erro ao aplicar cupom {coupon_code}: {e}")
-                import traceback
-                traceback.print_exc()
-                # Continuar sem o cupom em caso de erro
-        else:
-            print("DEBUG CUPOM: Nenhum cupom fornecido")
-        
-        # Se valor final for zero, marcar como pago e retornar fluxo de auto-confirmação
-        if amount == 0:
-            try:
-                # Garantir persistência do valor/infos no registro
-                registration.payment_amount = 0
-                registration.save(update_fields=['payment_amount'])
-            except Exception:
-                pass
-            # Marca como pago de forma idempotente
-            mark_registration_paid_atomic(registration.id, amount_reais=0.0)
-            return {
-                'success': True,
-                'auto_paid': True,
-                'amount': 0.0
-            }
+                # Salvar informações do cupom na inscrição (se o modelo tiver esses campos)
+                try:
+                    registration.coupon_code = coupon_code.strip().upper()
+                    registration.coupon_discount = discount_amount
+                    registration.save(update_fields=['coupon_code', 'coupon_discount'])
+                    print(f"DEBUG CUPOM: Cupom salvo na inscrição")
+                except Exception as ex:
+                    # Campos não existem no modelo, continuar sem salvar
+                    print(f"DEBUG CUPOM: Não foi possível salvar cupom: {ex}")
+                    pass
+                
+                description += f" (Desconto: R$ {discount_amount:.2f})"
+            else:
+                print(f"DEBUG CUPOM: Cupom não aplicado - válido={is_valid}")
+                
+        except Exception as e:
+            print(f"Erro ao aplicar cupom {coupon_code}: {e}")
+            import traceback
+            traceback.print_exc()
+            # Continuar sem o cupom em caso de erro
+    else:
+        print("DEBUG CUPOM: Nenhum cupom fornecido")
+    
+    # Se valor final for zero, marcar como pago e retornar fluxo de auto-confirmação
+    if amount == 0:
+        try:
+            # Garantir persistência do valor/infos no registro
+            registration.payment_amount = 0
+            registration.save(update_fields=['payment_amount'])
+        except Exception:
+            pass
+        # Marca como pago de forma idempotente
+        mark_registration_paid_atomic(registration.id, amount_reais=0.0)
+        return {
+            'success': True,
+            'auto_paid': True,
+            'amount': 0.0
+        }, None
 
-        # URLs de redirecionamento pós-checkout
-        # Regra:
-        #  - Produção: usar domínio do site
-        #  - Local: redirecionar para o frontend (por padrão :5173), não para o backend :8000
-        prod_frontend_base = 'https://admoving.addirceu.com.br'
-        # Permite sobrescrever via env
-        frontend_env_base = (config('FRONTEND_BASE_URL', default='') or '').rstrip('/') or None
-        public_env_base = (config('PUBLIC_BASE_URL', default='') or '').rstrip('/') or None
+    # Sessão ainda aberta com o mesmo valor e cupom: devolve sem chamar o Stripe
+    reusable = find_reusable_checkout_session(registration, amount, applied_coupon)
+    if reusable is not None:
+        return {
+            'success': True,
+            'checkout_url': reusable['checkout_url'],
+            'session_id': reusable['session_id'],
+            'amount': amount / 100,
+            'reused': True
+        }, None
 
-        frontend_base = prod_frontend_base
+    # URLs de redirecionamento pós-checkout
+    # Regra:
+    #  - Produção: usar domínio do site
+    #  - Local: redirecionar para o frontend (por padrão :5173), não para o backend :8000
+    prod_frontend_base = 'https://admoving.addirceu.com.br'
+    # Permite sobrescrever via env
+    frontend_env_base = (config('FRONTEND_BASE_URL', default='') or '').rstrip('/') or None
+    public_env_base = (config('PUBLIC_BASE_URL', default='') or '').rstrip('/') or None
 
-        # Se fornecido FRONTEND_BASE_URL, priorizar
-        if frontend_env_base:
-            frontend_base = frontend_env_base
-        else:
-            # Se request veio de localhost/127.0.0.1 (geralmente backend :8000), mapear para :5173
-            if base_url and ('localhost' in base_url or '127.0.0.1' in base_url):
-                # Tentar inferir protocolo para manter coerência
-                scheme = 'https' if base_url.startswith('https') else 'http'
-                frontend_base = f"{scheme}://localhost:8080"
-            elif public_env_base:
-                # Caso tenha PUBLIC_BASE_URL para site público, usar
-                frontend_base = public_env_base
-
-        success_url = config('STRIPE_SUCCESS_URL', default=f'{frontend_base}/pagamento/sucesso')
-        cancel_url = config('STRIPE_CANCEL_URL', default=f'{frontend_base}/pagamento/cancelado')
-
-        # Métodos de pagamento: cartão sempre, Pix opcional
-        enable_pix = getattr(settings, 'STRIPE_ENABLE_PIX', True)
-        payment_method_types = ['card']
-        if enable_pix:
-            payment_method_types.append('pix')
-
-        # Opções específicas do Pix (expiração do QR Code, opcional)
-        pix_expires = config('STRIPE_PIX_EXPIRES_AFTER_SECONDS', default=None)
-        if pix_expires:
-            pix_expires = int(pix_expires)
-        payment_method_options = {}
-        if enable_pix and pix_expires:
-            payment_method_options['pix'] = {
-                'expires_after_seconds': pix_expires
-            }
-        
-        # Configurar parcelamento para cartão de crédito (Brasil)
-        payment_method_options['card'] = {
-            'installments': {
-                'enabled': True
-            },
-            'request_three_d_secure': 'automatic'
+    frontend_base = prod_frontend_base
+
+    # Se fornecido FRONTEND_BASE_URL, priorizar
+    if frontend_env_base:
+        frontend_base = frontend_env_base
+    else:
+        # Se request veio de localhost/127.0.0.1 (geralmente backend :8000), mapear para :5173
+        if base_url and ('localhost' in base_url or '127.0.0.1' in base_url):
+            # Tentar inferir protocolo para manter coerência
+            scheme = 'https' if base_url.startswith('https') else 'http'
+            frontend_base = f"{scheme}://localhost:8080"
+        elif public_env_base:
+            # Caso tenha PUBLIC_BASE_URL para site público, usar
+            frontend_base = public_env_base
+
+    success_url = config('STRIPE_SUCCESS_URL', default=f'{frontend_base}/pagamento/sucesso')
+    cancel_url = config('STRIPE_CANCEL_URL', default=f'{frontend_base}/pagamento/cancelado')
+
+    # Métodos de pagamento: cartão sempre, Pix opcional
+    enable_pix = getattr(settings, 'STRIPE_ENABLE_PIX', True)
+    payment_method_types = ['card']
+    if enable_pix:
+        payment_method_types.append('pix')
+
+    # Opções específicas do Pix (expiração do QR Code, opcional)
+    pix_expires = config('STRIPE_PIX_EXPIRES_AFTER_SECONDS', default=None)
+    if pix_expires:
+        pix_expires = int(pix_expires)
+    payment_method_options = {}
+    if enable_pix and pix_expires:
+        payment_method_options['pix'] = {
+            'expires_after_seconds': pix_expires
         }
-        
-        # Monta dados do PaymentIntent (metadados sempre + Connect opcional)
-        payment_intent_data = {
-            'metadata': {
-                'registration_id': registration.id,
-                'registration_cpf': registration.cpf,
-            }
+    
+    # Configurar parcelamento para cartão de crédito (Brasil)
+    payment_method_options['card'] = {
+        'installments': {
+            'enabled': True
+        },
+        'request_three_d_secure': 'automatic'
+    }
+    
+    # Monta dados do PaymentIntent (metadados sempre + Connect opcional)
+    payment_intent_data = {
+        'metadata': {
+            'registration_id': registration.id,
+            'registration_cpf': registration.cpf,
         }
+    }
+
+    # Suporte opcional a Stripe Connect (destino dos fundos)
+    connect_account = getattr(settings, 'STRIPE_CONNECT_ACCOUNT_ID', '')
+    application_fee_amount = getattr(settings, 'STRIPE_APPLICATION_FEE_AMOUNT', 0)
+    if connect_account:
+        transfer_data = { 'destination': connect_account }
+        payment_intent_data['transfer_data'] = transfer_data
+        if application_fee_amount and application_fee_amount > 0:
+            payment_intent_data['application_fee_amount'] = application_fee_amount
 
-        # Suporte opcional a Stripe Connect (destino dos fundos)
-        connect_account = getattr(settings, 'STRIPE_CONNECT_ACCOUNT_ID', '')
-        application_fee_amount = getattr(settings, 'STRIPE_APPLICATION_FEE_AMOUNT', 0)
-        if connect_account:
-            transfer_data = { 'destination': connect_account }
-            payment_intent_data['transfer_data'] = transfer_data
-            if application_fee_amount and application_fee_amount > 0:
-                payment_intent_data['application_fee_amount'] = application_fee_amount
-
-        # Criar a sessão de checkout
-        checkout_kwargs = dict(
-            payment_method_types=payment_method_types,
-            line_items=[
-                {
-                    'price_data': {
-                        'currency': 'brl',
-                        'product_data': {
-                            'name': f'Corrida Ad-moving - {registration.get_modality_display()}',
-                            'description': description,
-                        },
-                        'unit_amount': amount,
+    # Criar a sessão de checkout
+    checkout_kwargs = dict(
+        payment_method_types=payment_method_types,
+        line_items=[
+            {
+                'price_data': {
+                    'currency': 'brl',
+                    'product_data': {
+                        'name': f'Corrida Ad-moving - {registration.get_modality_display()}',
+                        'description': description,
                     },
-                    'quantity': 1,
+                    'unit_amount': amount,
                 },
-            ],
-            mode='payment',
-            success_url=f"{success_url}?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{cancel_url}?registration_id={registration.id}",
-            metadata={
-                'registration_id': registration.id,
-                'registration_cpf': registration.cpf,
-                'registration_email': registration.email,
-                'modality': registration.modality,
+                'quantity': 1,
             },
-            customer_email=registration.email,
-            locale='pt-BR',
-            payment_intent_data=payment_intent_data
-        )
-        if payment_method_options:
-            checkout_kwargs['payment_method_options'] = payment_method_options
-        checkout_session = stripe.checkout.Session.create(**checkout_kwargs)
-        
+        ],
+        mode='payment',
+        success_url=f"{success_url}?session_id={{CHECKOUT_SESSION_ID}}",
+        cancel_url=f"{cancel_url}?registration_id={registration.id}",
+        metadata={
+            'registration_id': registration.id,
+            'registration_cpf': registration.cpf,
+            'registration_email': registration.email,
+            'modality': registration.modality,
+            'coupon_code': applied_coupon,
+        },
+        customer_email=registration.email,
+        locale='pt-BR',
+        payment_intent_data=payment_intent_data
+    )
+    if payment_method_options:
+        checkout_kwargs['payment_method_options'] = payment_method_options
+    return None, (checkout_kwargs, amount, applied_coupon)
+
+
+def _save_stripe_checkout(registration, checkout_session, amount, applied_coupon):
+    """Grava a sessão criada na inscrição e no cache de reaproveitamento"""
+    registration.stripe_checkout_session_id = checkout_session.id
+    registration.payment_amount = amount / 100  # Converter centavos para reais
+    registration.save(update_fields=['stripe_checkout_session_id', 'payment_amount'])
+    remember_checkout_session(registration.id, checkout_session, amount, applied_coupon)
+
+    return {
+        'success': True,
+        'checkout_url': checkout_session.url,
+        'session_id': checkout_session.id,
+        'amount': amount / 100,
+        'reused': False
+    }
+
+
+def create_stripe_checkout_session(registration, base_url: str | None = None, coupon_code: str | None = None):
+    """
+    Cria uma sessão de checkout do Stripe para o pagamento da inscrição
+
+    Se a sessão aberta da inscrição tem o mesmo valor e cupom, ela é
+    devolvida (`reused`) em vez de criar outra no Stripe.
+    """
+    try:
+        result, checkout = _prepare_stripe_checkout(registration, base_url, coupon_code)
+        if result is not None:
+            return result
+        checkout_kwargs, amount, applied_coupon = checkout
+
+        with span('stripe'):
+            checkout_session = stripe.checkout.Session.create(**checkout_kwargs)
+
         # Salvar o ID da sessão na inscrição
-        registration.stripe_checkout_session_id = checkout_session.id
-        registration.payment_amount = amount / 100  # Converter centavos para reais
-        registration.save(update_fields=['stripe_checkout_session_id', 'payment_amount'])
-        
+        return _save_stripe_checkout(registration, checkout_session, amount, applied_coupon)
+
+    except stripe.error.StripeError as e:
+        print(f"Erro do Stripe: {e}")
         return {
-            'success': True,
-            'checkout_url': checkout_session.url,
-            'session_id': checkout_session.id,
-            'amount': amount / 100
+            'success': False,
+            'error': f'Erro no Stripe: {str(e)}'
         }
-        
+    except Exception as e:
+        print(f"Erro geral ao criar sessão de checkout: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }
+
+
+async def acreate_stripe_checkout_session(registration, base_url: str | None = None, coupon_code: str | None = None):
+    """
+    Versão assíncrona de create_stripe_checkout_session: o banco e o cache
+    rodam em thread (sync_to_async) e a chamada ao Stripe no event loop
+    """
+    try:
+        result, checkout = await sync_to_async(_prepare_stripe_checkout)(registration, base_url, coupon_code)
+        if result is not None:
+            return result
+        checkout_kwargs, amount, applied_coupon = checkout
+
+        with span('stripe'):
+            checkout_session = await get_stripe_async_client().checkout.sessions.create_async(params=checkout_kwargs)
+
+        return await sync_to_async(_save_stripe_checkout)(registration, checkout_session, amount, applied_coupon)
+
     except stripe.error.StripeError as e:
         print(f"Erro do Stripe: {e}")
         return {
@@ -553,22 +680,51 @@ def create_stripe_checkout_session(registration, base_url: str | None = None, co
         }
 
 
+def _checkout_session_result(session):
+    return {
+        'success': True,
+        'session': session,
+        'payment_status': session.payment_status,
+        'amount_total': session.amount_total,
+        'customer_email': session.customer_email,
+        'metadata': session.metadata
+    }
+
+
 def verify_stripe_checkout_session(session_id):
     """
     Verifica o status de uma sessão de checkout do Stripe
     """
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        with span('stripe'):
+            session = stripe.checkout.Session.retrieve(session_id)
+        
+        return _checkout_session_result(session)
         
+    except stripe.error.StripeError as e:
+        print(f"Erro do Stripe ao verificar sessão: {e}")
         return {
-            'success': True,
-            'session': session,
-            'payment_status': session.payment_status,
-            'amount_total': session.amount_total,
-            'customer_email': session.customer_email,
-            'metadata': session.metadata
+            'success': False,
+            'error': f'Erro no Stripe: {str(e)}'
         }
-        
+    except Exception as e:
+        print(f"Erro geral ao verificar sessão: {e}")
+        return {
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }
+
+
+async def averify_stripe_checkout_session(session_id):
+    """
+    Versão assíncrona de verify_stripe_checkout_session
+    """
+    try:
+        with span('stripe'):
+            session = await get_stripe_async_client().checkout.sessions.retrieve_async(session_id)
+
+        return _checkout_session_result(session)
+
     except stripe.error.StripeError as e:
         print(f"Erro do Stripe ao verificar sessão: {e}")
         return {
@@ -599,36 +755,13 @@ def process_stripe_webhook_event(event):
             
             if registration_id:
                 try:
-                    registration = RaceRegistration.objects.get(id=registration_id)
-                    
-                    # Atualizar o status do pagamento
-                    registration.payment_status = 'PAID'
-                    registration.payment_date = timezone.now()
-                    try:
-                        amt_total = session.get('amount_total')
-                        if amt_total is not None:
-                            registration.payment_amount = (amt_total or 0) / 100.0
-                    except Exception:
-                        pass
-                    
-                    # Salvar o Payment Intent ID se disponível
-                    if session.get('payment_intent'):
-                        registration.stripe_payment_intent_id = session['payment_intent']
-                    
-                    # Gerar número de inscrição único se ainda não existe
-                    if not registration.registration_number:
-                        registration.registration_number = generate_unique_registration_number()
-                    
-                    registration.save(update_fields=[
-                        'payment_status', 
-                        'payment_date', 
-                        'stripe_payment_intent_id',
-                        'registration_number',
-                        'payment_amount'
-                    ])
-                    
-                    # Enviar email de confirmação de pagamento
-                    send_payment_confirmation_email(registration)
+                    amt_total = session.get('amount_total')
+                    # Marca como paga e enfileira o email na mesma transação
+                    mark_registration_paid_atomic(
+                        int(registration_id),
+                        amount_reais=(amt_total or 0) / 100.0 if amt_total is not None else None,
+                        payment_intent_id=session.get('payment_intent'),
+                    )
                     
                     return {
                         'success': True,
@@ -702,140 +835,158 @@ def get_race_prices():
 
 # ============== AbacatePay Integration ==============
 
-def create_abacatepay_pix(registration, coupon_code: str | None = None):
+def _prepare_abacatepay_pix(registration, coupon_code=None):
     """
-    Cria um QR Code PIX usando a API AbacatePay
+    Parte local da criação do PIX (cupom, valor e payload), comum às versões
+    síncrona e assíncrona.
+
+    Retorna (resultado, None) quando não é preciso chamar o AbacatePay (valor
+    zero ou CPF inválido) ou (None, (payload, amount)).
     """
-    try:
-        # Determinar o valor baseado na modalidade
-        if registration.modality == 'INFANTIL':
-            amount = 7000  # R$ 70,00 em centavos
-            description = f"Inscrição Infantil - Corrida Ad-moving - {registration.full_name}"
-        else:
-            amount = 10000  # R$ 100,00 em centavos
-            description = f"Inscrição Adulto - Corrida Ad-moving - {registration.full_name}"
-        
-        # Aplicar desconto do cupom se fornecido
-        if coupon_code:
-            print(f"DEBUG ABACATE CUPOM: Cupom recebido: {coupon_code}")
-            try:
-                is_valid, message, discount_amount = validate_coupon_code(coupon_code, registration.modality)
-                print(f"DEBUG ABACATE CUPOM: Validação - válido={is_valid}, mensagem={message}, desconto={discount_amount}")
+    # Determinar o valor baseado na modalidade
+    if registration.modality == 'INFANTIL':
+        amount = 7000  # R$ 70,00 em centavos
+        description = f"Inscrição Infantil - Corrida Ad-moving - {registration.full_name}"
+    else:
+        amount = 10000  # R$ 100,00 em centavos
+        description = f"Inscrição Adulto - Corrida Ad-moving - {registration.full_name}"
+    
+    # Aplicar desconto do cupom se fornecido
+    if coupon_code:
+        print(f"DEBUG ABACATE CUPOM: Cupom recebido: {coupon_code}")
+        try:
+            is_valid, message, discount_amount = validate_coupon_code(coupon_code, registration.modality)
+            print(f"DEBUG ABACATE CUPOM: Validação - válido={is_valid}, mensagem={message}, desconto={discount_amount}")
+            
+            if is_valid and discount_amount > 0:
+                coupon_discount = int(discount_amount * 100)  # Converter para centavos
+                amount = max(amount - coupon_discount, 0)  # Não permitir valor negativo
+                print(f"DEBUG ABACATE CUPOM: Valor com desconto: R$ {amount/100:.2f}")
                 
-                if is_valid and discount_amount > 0:
-                    coupon_discount = int(discount_amount * 100)  # Converter para centavos
-                    amount = max(amount - coupon_discount, 0)  # Não permitir valor negativo
-                    print(f"DEBUG ABACATE CUPOM: Valor com desconto: R$ {amount/100:.2f}")
-                    
-                    # Salvar informações do cupom na inscrição
-                    try:
-                        registration.coupon_code = coupon_code.strip().upper()
-                        registration.coupon_discount = discount_amount
-                        registration.save(update_fields=['coupon_code', 'coupon_discount'])
-                        print(f"DEBUG ABACATE CUPOM: Cupom salvo na inscrição")
-                    except Exception as ex:
-                        print(f"DEBUG ABACATE CUPOM: Não foi possível salvar cupom: {ex}")
-                        pass
-                    
-                    description += f" (Desconto: R$ {discount_amount:.2f})"
-            except Exception as e:
-                print(f"Erro ao aplicar cupom {coupon_code}: {e}")
-                import traceback
-                traceback.print_exc()
-        
-        # Se valor final for zero, marcar como pago e retornar fluxo de auto-confirmação
-        if amount == 0:
-            try:
-                registration.payment_amount = 0
-                registration.save(update_fields=['payment_amount'])
-            except Exception:
-                pass
-            mark_registration_paid_atomic(registration.id, amount_reais=0.0)
-            return {
-                'success': True,
-                'auto_paid': True,
-                'amount': 0.0
-            }
+                # Salvar informações do cupom na inscrição
+                try:
+                    registration.coupon_code = coupon_code.strip().upper()
+                    registration.coupon_discount = discount_amount
+                    registration.save(update_fields=['coupon_code', 'coupon_discount'])
+                    print(f"DEBUG ABACATE CUPOM: Cupom salvo na inscrição")
+                except Exception as ex:
+                    print(f"DEBUG ABACATE CUPOM: Não foi possível salvar cupom: {ex}")
+                    pass
+                
+                description += f" (Desconto: R$ {discount_amount:.2f})"
+        except Exception as e:
+            print(f"Erro ao aplicar cupom {coupon_code}: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    # Se valor final for zero, marcar como pago e retornar fluxo de auto-confirmação
+    if amount == 0:
+        try:
+            registration.payment_amount = 0
+            registration.save(update_fields=['payment_amount'])
+        except Exception:
+            pass
+        mark_registration_paid_atomic(registration.id, amount_reais=0.0)
+        return {
+            'success': True,
+            'auto_paid': True,
+            'amount': 0.0
+        }, None
 
-        # Preparar payload para AbacatePay
-        # Determinar CPF a ser utilizado (responsável para KIDS, atleta para demais)
-        raw_tax_id = (
-            getattr(registration, 'responsible_cpf', None) if registration.modality == 'INFANTIL' else registration.cpf
-        ) or ""
-        sanitized_tax_id = ''.join(ch for ch in str(raw_tax_id) if ch.isdigit())[:11]
+    # Preparar payload para AbacatePay
+    # Determinar CPF a ser utilizado (responsável para KIDS, atleta para demais)
+    raw_tax_id = (
+        getattr(registration, 'responsible_cpf', None) if registration.modality == 'INFANTIL' else registration.cpf
+    ) or ""
+    sanitized_tax_id = ''.join(ch for ch in str(raw_tax_id) if ch.isdigit())[:11]
 
-        # Validar CPF antes de chamar AbacatePay
-        if len(sanitized_tax_id) != 11:
-            return {
-                'success': False,
-                'error': 'CPF inválido para pagamento. Verifique os dados da inscrição.'
-            }
+    # Validar CPF antes de chamar AbacatePay
+    if len(sanitized_tax_id) != 11:
+        return {
+            'success': False,
+            'error': 'CPF inválido para pagamento. Verifique os dados da inscrição.'
+        }, None
 
-        payload = {
-            "amount": amount,  # em centavos
-            "expiresIn": 3600,  # 1 hora
-            "description": description,
-            "customer": {
-                "name": registration.full_name,
-                "cellphone": registration.phone,
-                "email": registration.email,
-                "taxId": sanitized_tax_id
-            },
-            "metadata": {
-                "externalId": f"registration-{registration.id}",
-                "registration_id": str(registration.id),
-                "modality": registration.modality
-            }
+    payload = {
+        "amount": amount,  # em centavos
+        "expiresIn": PIX_EXPIRES_IN,  # 1 hora
+        "description": description,
+        "customer": {
+            "name": registration.full_name,
+            "cellphone": registration.phone,
+            "email": registration.email,
+            "taxId": sanitized_tax_id
+        },
+        "metadata": {
+            "externalId": f"registration-{registration.id}",
+            "registration_id": str(registration.id),
+            "modality": registration.modality
         }
-        
+    }
+    return None, (payload, amount)
+
+
+def _save_abacatepay_pix(registration, response, amount):
+    """Interpreta a resposta do /pixQrCode/create e grava o PIX na inscrição"""
+    print(f"DEBUG ABACATE: Status da resposta: {response.status_code}")
+    print(f"DEBUG ABACATE: Resposta: {response.text}")
+    
+    if response.status_code >= 400:
+        return {
+            'success': False,
+            'error': f'Erro AbacatePay: {response.text}'
+        }
+    
+    result = response.json()
+    
+    if result.get('error'):
+        return {
+            'success': False,
+            'error': f'Erro AbacatePay: {result.get("error")}'
+        }
+    
+    data = result.get('data', {})
+    
+    # Salvar dados do PIX na inscrição (não bloquear retorno se falhar)
+    try:
+        registration.abacatepay_pix_id = data.get('id')
+        registration.payment_amount = amount / 100  # Converter centavos para reais
+        # Agenda as verificações do check_pending_pix para o novo QR Code
+        schedule = initial_schedule(expires_at=parse_expires_at(data.get('expiresAt')))
+        for field, value in schedule.items():
+            setattr(registration, field, value)
+        registration.save(update_fields=['abacatepay_pix_id', 'payment_amount', *schedule])
+    except Exception as save_err:
+        print(f"WARN ABACATE: Falha ao salvar pix_id no banco: {save_err}")
+    
+    return {
+        'success': True,
+        'pix_id': data.get('id'),
+        'br_code': data.get('brCode'),
+        'br_code_base64': data.get('brCodeBase64'),
+        'amount': amount / 100,
+        'expires_at': data.get('expiresAt'),
+        'status': data.get('status')
+    }
+
+
+def create_abacatepay_pix(registration, coupon_code: str | None = None):
+    """
+    Cria um QR Code PIX usando a API AbacatePay
+    """
+    try:
+        result, pix = _prepare_abacatepay_pix(registration, coupon_code)
+        if result is not None:
+            return result
+        payload, amount = pix
+
         # Fazer requisição para criar QR Code
-        url = f"{ABACATEPAY_BASE_URL}/pixQrCode/create"
-        print(f"DEBUG ABACATE: Criando PIX QR Code - URL: {url}")
+        print(f"DEBUG ABACATE: Criando PIX QR Code - URL: {abacatepay_client.ABACATEPAY_BASE_URL}/pixQrCode/create")
         print(f"DEBUG ABACATE: Payload: {payload}")
         
-        response = requests.post(
-            url,
-            json=payload,
-            headers=ABACATEPAY_HEADERS,
-            timeout=10
-        )
-        
-        print(f"DEBUG ABACATE: Status da resposta: {response.status_code}")
-        print(f"DEBUG ABACATE: Resposta: {response.text}")
-        
-        if response.status_code >= 400:
-            return {
-                'success': False,
-                'error': f'Erro AbacatePay: {response.text}'
-            }
-        
-        result = response.json()
-        
-        if result.get('error'):
-            return {
-                'success': False,
-                'error': f'Erro AbacatePay: {result.get("error")}'
-            }
-        
-        data = result.get('data', {})
-        
-        # Salvar dados do PIX na inscrição (não bloquear retorno se falhar)
-        try:
-            registration.abacatepay_pix_id = data.get('id')
-            registration.payment_amount = amount / 100  # Converter centavos para reais
-            registration.save(update_fields=['abacatepay_pix_id', 'payment_amount'])
-        except Exception as save_err:
-            print(f"WARN ABACATE: Falha ao salvar pix_id no banco: {save_err}")
-        
-        return {
-            'success': True,
-            'pix_id': data.get('id'),
-            'br_code': data.get('brCode'),
-            'br_code_base64': data.get('brCodeBase64'),
-            'amount': amount / 100,
-            'expires_at': data.get('expiresAt'),
-            'status': data.get('status')
-        }
+        # Não idempotente: 5xx não é repetido para não gerar dois QR Codes
+        response = abacatepay_client.post('/pixQrCode/create', json=payload, idempotent=False)
+        return _save_abacatepay_pix(registration, response, amount)
         
     except requests.exceptions.RequestException as e:
         print(f"Erro de conexão com AbacatePay: {e}")
@@ -853,24 +1004,47 @@ def create_abacatepay_pix(registration, coupon_code: str | None = None):
         }
 
 
+async def acreate_abacatepay_pix(registration, coupon_code: str | None = None):
+    """
+    Versão assíncrona de create_abacatepay_pix: o banco roda em thread
+    (sync_to_async) e a chamada ao AbacatePay no event loop
+    """
+    try:
+        result, pix = await sync_to_async(_prepare_abacatepay_pix)(registration, coupon_code)
+        if result is not None:
+            return result
+        payload, amount = pix
+
+        # Não idempotente: 5xx não é repetido para não gerar dois QR Codes
+        response = await abacatepay_client.apost('/pixQrCode/create', json=payload, idempotent=False)
+        return await sync_to_async(_save_abacatepay_pix)(registration, response, amount)
+
+    except httpx.HTTPError as e:
+        print(f"Erro de conexão com AbacatePay: {e}")
+        return {
+            'success': False,
+            'error': f'Erro de conexão: {str(e)}'
+        }
+    except Exception as e:
+        print(f"Erro geral ao criar PIX AbacatePay: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }
+
 def simulate_abacatepay_payment(pix_id: str):
     """
     Simula o pagamento de um PIX (apenas em dev/teste)
     """
     try:
-        url = f"{ABACATEPAY_BASE_URL}/pixQrCode/simulate-payment"
         params = {"id": pix_id}
         body = {"metadata": {}}
         
         print(f"DEBUG ABACATE: Simulando pagamento - PIX ID: {pix_id}")
         
-        response = requests.post(
-            url,
-            params=params,
-            json=body,
-            headers=ABACATEPAY_HEADERS,
-            timeout=10
-        )
+        response = abacatepay_client.post('/pixQrCode/simulate-payment', params=params, json=body)
         
         print(f"DEBUG ABACATE: Status simulação: {response.status_code}")
         
@@ -897,44 +1071,63 @@ def simulate_abacatepay_payment(pix_id: str):
         }
 
 
+def _pix_status_result(response):
+    """Interpreta a resposta do /pixQrCode/check"""
+    print(f"DEBUG ABACATE CHECK: Status HTTP: {response.status_code}")
+    print(f"DEBUG ABACATE CHECK: Resposta: {response.text[:500]}")
+    
+    if response.status_code >= 400:
+        return {
+            'success': False,
+            'error': f'Erro ao verificar status: {response.text}'
+        }
+    
+    result = response.json()
+    data = result.get('data') or {}
+    
+    pix_status = data.get('status')
+    print(f"DEBUG ABACATE CHECK: Status do PIX: {pix_status}")
+    
+    return {
+        'success': True,
+        'status': pix_status,
+        'expires_at': data.get('expiresAt')
+    }
+
+
 def check_abacatepay_payment_status(pix_id: str):
     """
     Verifica o status de um pagamento PIX
     """
     try:
-        url = f"{ABACATEPAY_BASE_URL}/pixQrCode/check"
         params = {"id": pix_id}
         
         print(f"DEBUG ABACATE CHECK: Verificando status - PIX ID: {pix_id}")
         
-        response = requests.get(
-            url,
-            params=params,
-            headers=ABACATEPAY_HEADERS,
-            timeout=10
-        )
-        
-        print(f"DEBUG ABACATE CHECK: Status HTTP: {response.status_code}")
-        print(f"DEBUG ABACATE CHECK: Resposta: {response.text[:500]}")
-        
-        if response.status_code >= 400:
-            return {
-                'success': False,
-                'error': f'Erro ao verificar status: {response.text}'
-            }
-        
-        result = response.json()
-        data = result.get('data') or {}
+        response = abacatepay_client.get('/pixQrCode/check', params=params)
         
-        pix_status = data.get('status')
-        print(f"DEBUG ABACATE CHECK: Status do PIX: {pix_status}")
+        return _pix_status_result(response)
         
+    except Exception as e:
+        print(f"Erro ao verificar status: {e}")
+        import traceback
+        traceback.print_exc()
         return {
-            'success': True,
-            'status': pix_status,
-            'expires_at': data.get('expiresAt')
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
         }
-        
+
+
+async def acheck_abacatepay_payment_status(pix_id: str):
+    """
+    Versão assíncrona de check_abacatepay_payment_status
+    """
+    try:
+        print(f"DEBUG ABACATE CHECK: Verificando status - PIX ID: {pix_id}")
+
+        response = await abacatepay_client.aget('/pixQrCode/check', params={"id": pix_id})
+        return _pix_status_result(response)
+
     except Exception as e:
         print(f"Erro ao verificar status: {e}")
         import traceback
@@ -945,117 +1138,109 @@ def check_abacatepay_payment_status(pix_id: str):
         }
 
 
-def send_custom_broadcast_email(subject_text, message_body, registrations):
+def verify_abacatepay_webhook(raw_body: bytes, webhook_secret: str | None, signature: str | None) -> bool:
     """
-    Inicia o envio de emails em background (thread) e salva progresso no cache Redis.
-    Retorna o task_id para acompanhamento.
+    Confere a autenticidade de um webhook do AbacatePay.
+
+    - ABACATEPAY_WEBHOOK_SECRET: segredo enviado na query string (?webhookSecret=)
+    - ABACATEPAY_WEBHOOK_HMAC_KEY: HMAC-SHA256 do corpo, em base64, no header X-Webhook-Signature
+    Sem nenhum dos dois configurado o webhook é recusado.
     """
-    import threading
-    import uuid
-    from django.core.cache import cache
-
-    task_id = str(uuid.uuid4())
-
-    # Materializa a queryset antes de passar pra thread
-    reg_list = list(registrations.values('id', 'email', 'full_name'))
-    total = len(reg_list)
-
-    # Salva estado inicial no cache (expira em 30 min)
-    cache.set(f'broadcast_{task_id}', {
-        'status': 'running',
-        'total': total,
-        'sent_count': 0,
-        'failed_count': 0,
-        'current_email': '',
-        'current_name': '',
-    }, timeout=1800)
-
-    def _send_emails():
-        from email.header import Header
-        from email.utils import formataddr
-        from django.core.mail import get_connection
-
-        sent_count = 0
-        failed_count = 0
-
-        subject = str(Header(subject_text, 'utf-8'))
-        friendly_from = formataddr((str(Header('Equipe Ad-moving', 'utf-8')), settings.DEFAULT_FROM_EMAIL))
-
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; border-radius: 8px 8px 0 0; text-align: center;">
-                <h1 style="color: #fff; margin: 0; font-size: 24px;">Corrida Ad-moving</h1>
-            </div>
-            <div style="padding: 20px; background: #f9fafb; border: 1px solid #e5e7eb; border-top: none; border-radius: 0 0 8px 8px;">
-                {message_body.replace(chr(10), '<br>')}
-            </div>
-            <p style="text-align: center; margin-top: 20px; font-size: 12px; color: #6b7280;">
-                Equipe Ad-moving &bull; admoving@addirceu.com.br
-            </p>
-        </body>
-        </html>
-        """
-
-        connection = get_connection(fail_silently=True)
-        try:
-            connection.open()
-        except Exception as e:
-            print(f"Erro ao abrir conexão SMTP: {e}")
-            cache.set(f'broadcast_{task_id}', {
-                'status': 'done',
-                'total': total,
-                'sent_count': 0,
-                'failed_count': total,
-                'current_email': '',
-                'current_name': '',
-                'error': f'Erro SMTP: {str(e)}',
-            }, timeout=1800)
-            return
+    secret = settings.ABACATEPAY_WEBHOOK_SECRET
+    hmac_key = settings.ABACATEPAY_WEBHOOK_HMAC_KEY
+    if not secret and not hmac_key:
+        return False
 
-        for reg in reg_list:
-            # Atualiza progresso antes de enviar
-            cache.set(f'broadcast_{task_id}', {
-                'status': 'running',
-                'total': total,
-                'sent_count': sent_count,
-                'failed_count': failed_count,
-                'current_email': reg['email'],
-                'current_name': reg['full_name'],
-            }, timeout=1800)
+    if secret and not hmac.compare_digest((webhook_secret or '').encode(), secret.encode()):
+        return False
 
-            try:
-                email = EmailMultiAlternatives(
-                    subject=subject,
-                    body=message_body,
-                    from_email=friendly_from,
-                    to=[reg['email']],
-                    connection=connection,
-                )
-                email.encoding = 'utf-8'
-                email.attach_alternative(html_body, 'text/html; charset=utf-8')
-                email.send(fail_silently=False)
-                sent_count += 1
-            except Exception as e:
-                print(f"Erro ao enviar email para {reg['email']}: {e}")
-                failed_count += 1
+    if hmac_key:
+        expected = base64.b64encode(
+            hmac.new(hmac_key.encode(), raw_body, hashlib.sha256).digest()
+        ).decode()
+        if not hmac.compare_digest((signature or '').encode(), expected.encode()):
+            return False
 
-        try:
-            connection.close()
-        except Exception:
-            pass
+    return True
+
+
+def process_abacatepay_webhook_event(event):
+    """
+    Processa um evento de webhook do AbacatePay.
+
+    O registro do evento (dedupe pelo id) e a confirmação do pagamento acontecem
+    na mesma transação: se a confirmação falhar, o evento não fica registrado e o
+    reenvio do AbacatePay é processado normalmente.
+    """
+    from .models import RaceRegistration, AbacatePayWebhookEvent
+
+    event_id = event.get('id')
+    event_type = event.get('event') or ''
+    if not event_id:
+        return {
+            'success': False,
+            'error': 'Evento sem id'
+        }
+
+    with transaction.atomic():
+        webhook_event, created = AbacatePayWebhookEvent.objects.get_or_create(
+            event_id=event_id,
+            defaults={'event_type': event_type},
+        )
+        if not created:
+            return {
+                'success': True,
+                'duplicate': True,
+                'message': f'Evento {event_id} já processado'
+            }
+
+        if event_type != 'billing.paid':
+            return {
+                'success': True,
+                'message': f'Evento {event_type} ignorado'
+            }
+
+        data = event.get('data') or {}
+        pix = data.get('pixQrCode') or {}
+        pix_id = pix.get('id')
+        registration_id = (pix.get('metadata') or {}).get('registration_id')
+
+        registration = None
+        if pix_id:
+            registration = RaceRegistration.objects.filter(abacatepay_pix_id=pix_id).only('id').first()
+        if registration is None and registration_id:
+            registration = RaceRegistration.objects.filter(id=registration_id).only('id').first()
+        if registration is None:
+            # Responde 200 mesmo assim: reenviar não vai encontrar a inscrição
+            print(f"WARN ABACATE WEBHOOK: inscrição não encontrada para PIX {pix_id}")
+            return {
+                'success': True,
+                'message': f'Inscrição não encontrada para o PIX {pix_id}'
+            }
+
+        amount = pix.get('amount')
+        changed = mark_registration_paid_atomic(
+            registration.id,
+            amount_reais=amount / 100 if amount is not None else None,
+        )
+        webhook_event.registration = registration
+        webhook_event.save(update_fields=['registration'])
 
-        # Marca como concluído
-        cache.set(f'broadcast_{task_id}', {
-            'status': 'done',
-            'total': total,
-            'sent_count': sent_count,
-            'failed_count': failed_count,
-            'current_email': '',
-            'current_name': '',
-        }, timeout=1800)
+    return {
+        'success': True,
+        'registration_id': registration.id,
+        'registration_updated': changed,
+        'message': f'Pagamento processado para inscrição {registration.id}'
+    }
 
-    thread = threading.Thread(target=_send_emails, daemon=True)
-    thread.start()
 
-    return task_id
+def send_custom_broadcast_email(subject_text, message_body, registrations):
+    """
+    Enfileira um envio de email em massa e salva o progresso inicial no cache Redis.
+    O envio é feito pelo worker `run_broadcast_worker`, fora do processo web.
+    Retorna o task_id para acompanhamento.
+    """
+    from .broadcasts import create_broadcast
+
+    broadcast = create_broadcast(subject_text, message_body, registrations)
+    return str(broadcast.id)
@@ -0,0 +1,89 @@
+"""
+Signals de RaceRegistration que mantêm os contadores de estatísticas e o
+conjunto de CPFs pagos (api/paid_cpfs.py)
+
+Cada instância guarda, ao ser carregada ou salva, os valores dos campos
+contabilizados. Em post_save/post_delete a diferença vira deltas de contadores
+e inclusões/remoções de CPFs pagos, aplicados no Redis somente após o commit
+da transação.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import RaceRegistration
+from .paid_cpfs import add_paid_cpf, discard_paid_cpf
+from .statistics import stat_dimensions, stat_key, registration_counter_names, apply_counter_deltas, COUNTER_PREFIX
+
+
+def _snapshot(instance):
+    """Valores atuais dos campos contabilizados (ignora campos adiados)"""
+    values = {field: instance.__dict__[field] for field in stat_dimensions() if field in instance.__dict__}
+    created_at = instance.__dict__.get('created_at')
+    values['created'] = created_at.date() if created_at else None
+    if 'cpf' in instance.__dict__:
+        values['cpf'] = instance.__dict__['cpf']
+    return values
+
+
+def _paid_cpf(values):
+    """CPF que a inscrição mantém no conjunto de pagos (None se não está paga)"""
+    if values.get('payment_status') == 'PAID':
+        return values.get('cpf') or None
+    return None
+
+
+def _sync_paid_cpf(old, new):
+    old_cpf, new_cpf = _paid_cpf(old), _paid_cpf(new)
+    if new_cpf and new_cpf != old_cpf:
+        transaction.on_commit(partial(add_paid_cpf, new_cpf), robust=True)
+    if old_cpf and old_cpf != new_cpf:
+        transaction.on_commit(partial(discard_paid_cpf, old_cpf), robust=True)
+
+
+def _schedule(deltas):
+    if deltas:
+        transaction.on_commit(partial(apply_counter_deltas, deltas), robust=True)
+
+
+@receiver(post_init, sender=RaceRegistration)
+def remember_counted_values(sender, instance, **kwargs):
+    instance._stats_snapshot = _snapshot(instance)
+
+
+@receiver(post_save, sender=RaceRegistration)
+def update_counters_on_save(sender, instance, created, update_fields=None, **kwargs):
+    old = getattr(instance, '_stats_snapshot', {})
+    new = _snapshot(instance)
+    deltas = {}
+
+    if created:
+        for name in registration_counter_names(new):
+            deltas[name] = deltas.get(name, 0) + 1
+    else:
+        for field in stat_dimensions():
+            if update_fields is not None and field not in update_fields:
+                continue
+            if field not in old or field not in new or old[field] == new[field]:
+                continue
+            if old[field] is not None:
+                name = f'{COUNTER_PREFIX}{stat_key(field, old[field])}'
+                deltas[name] = deltas.get(name, 0) - 1
+            if new[field] is not None:
+                name = f'{COUNTER_PREFIX}{stat_key(field, new[field])}'
+                deltas[name] = deltas.get(name, 0) + 1
+
+    _schedule(deltas)
+    if update_fields is not None:
+        new = {**old, **{f: v for f, v in new.items() if f in update_fields}}
+    _sync_paid_cpf({} if created else old, new)
+    instance._stats_snapshot = new
+
+
+@receiver(post_delete, sender=RaceRegistration)
+def update_counters_on_delete(sender, instance, **kwargs):
+    values = getattr(instance, '_stats_snapshot', None) or _snapshot(instance)
+    _schedule({name: -1 for name in registration_counter_names(values)})
+    _sync_paid_cpf(values, {})
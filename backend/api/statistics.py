@@ -0,0 +1,273 @@
+"""
+Estatísticas das inscrições de corrida
+
+As contagens do dashboard ficam em contadores no Redis, mantidos pelos signals
+de RaceRegistration (api/signals.py) e lidos com um único MGET. Quando os
+contadores ainda não existem, são calculados em uma única consulta com
+agregação condicional (COUNT ... FILTER) e gravados no cache.
+
+A inicialização roda em um processo por vez (trava com SET NX; os demais
+respondem pelo banco). Os deltas que chegam enquanto ela agrega ficam em um
+hash e são somados ao gravar, para não se perderem. O marcador de contadores
+prontos expira em STATS_READY_TTL: qualquer divergência restante se corrige
+na próxima inicialização.
+
+`manage.py rebuild_stats_counters` recalcula os contadores a partir do banco
+e informa qualquer divergência.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import RaceRegistration
+from .redis_utils import get_redis_connection_or_none, cache_key
+
+COUNTER_PREFIX = 'stats:'
+READY_KEY = 'stats:ready'
+SEEDING_KEY = 'stats:seeding'
+PENDING_KEY = 'stats:pending'
+CREATED_COUNTER_TTL = 2 * 24 * 3600  # contadores diários expiram após 2 dias
+STATS_READY_TTL = 6 * 3600  # contadores reconferidos com o banco a cada 6h
+SEED_TIMEOUT = 60  # trava da inicialização, se o processo morrer no meio
+
+# Aplica os deltas se os contadores já foram inicializados; durante a
+# inicialização, acumula-os no hash de pendentes (somados ao gravar)
+# (KEYS[1] = marcador, KEYS[2] = trava, KEYS[3] = pendentes, KEYS[4..] = contadores;
+#  ARGV[1] = TTL dos contadores diários, ARGV[2..] = deltas)
+_APPLY_DELTAS_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        return 0
+    end
+    for i = 4, #KEYS do
+        redis.call('HINCRBY', KEYS[3], KEYS[i], ARGV[i - 2])
+    end
+    return 2
+end
+for i = 4, #KEYS do
+    redis.call('INCRBY', KEYS[i], ARGV[i - 2])
+    if string.find(KEYS[i], ':created_', 1, true) and redis.call('TTL', KEYS[i]) == -1 then
+        redis.call('EXPIRE', KEYS[i], ARGV[1])
+    end
+end
+return 1
+"""
+
+# Grava as contagens agregadas somando os deltas pendentes e libera a trava
+# (KEYS[1] = marcador, KEYS[2] = trava, KEYS[3] = pendentes, KEYS[4] = contador
+#  do dia, KEYS[5..] = demais; ARGV[1] = TTL do marcador, ARGV[2] = TTL do
+#  contador do dia, ARGV[3..] = contagens na ordem de KEYS[4..])
+_STORE_SEED_LUA = """
+for i = 4, #KEYS do
+    local value = tonumber(ARGV[i - 1]) + tonumber(redis.call('HGET', KEYS[3], KEYS[i]) or 0)
+    if i == 4 then
+        redis.call('SET', KEYS[i], value, 'EX', ARGV[2])
+    else
+        redis.call('SET', KEYS[i], value)
+    end
+end
+redis.call('SET', KEYS[1], 1, 'EX', ARGV[1])
+redis.call('DEL', KEYS[2], KEYS[3])
+return 1
+"""
+
+
+def stat_dimensions():
+    """Campos contabilizados e suas opções (lidas a cada chamada)"""
+    return {
+        'gender': RaceRegistration.GENDER_CHOICES,
+        'payment_status': RaceRegistration.PAYMENT_STATUS_CHOICES,
+        'modality': RaceRegistration.MODALITY_CHOICES,
+        'course': RaceRegistration.COURSE_CHOICES,
+        'shirt_size': RaceRegistration.SHIRT_SIZE_CHOICES + RaceRegistration.INFANT_SHIRT_SIZE_CHOICES,
+    }
+
+
+def stat_key(field, code):
+    """Nome da contagem de um valor de campo (ex.: 'gender_M')"""
+    return f'{field}_{code}'
+
+
+def created_on(day):
+    """
+    Filtro das inscrições criadas no dia (UTC, como os contadores diários).
+
+    Intervalo em created_at em vez de created_at__date, que converte a
+    coluna e impede o uso do índice reg_created_idx.
+    """
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    return Q(created_at__gte=start, created_at__lt=start + timedelta(days=1))
+
+
+def aggregate_race_counts():
+    """
+    Retorna {'total': n, 'today': n, '<campo>_<código>': n, ...} em uma consulta
+    """
+    today = timezone.now().date()
+    aggregates = {
+        'total': Count('id'),
+        'today': Count('id', filter=created_on(today)),
+    }
+    for field, choices in stat_dimensions().items():
+        for code, _ in choices:
+            aggregates[stat_key(field, code)] = Count('id', filter=Q(**{field: code}))
+    return RaceRegistration.objects.aggregate(**aggregates)
+
+
+def build_statistics_payload(counts):
+    """Monta a resposta de /api/race-statistics/ a partir das contagens"""
+    def by_code(field, choices):
+        return {code.lower(): counts.get(stat_key(field, code), 0) for code, _ in choices}
+
+    def by_name(field, choices):
+        return {name: counts.get(stat_key(field, code), 0) for code, name in choices}
+
+    return {
+        'total_inscriptions': counts.get('total', 0),
+        'male_count': counts.get(stat_key('gender', 'M'), 0),
+        'female_count': counts.get(stat_key('gender', 'F'), 0),
+        'inscriptions_today': counts.get('today', 0),
+        'payment_stats': by_code('payment_status', RaceRegistration.PAYMENT_STATUS_CHOICES),
+        'modality_stats': by_code('modality', RaceRegistration.MODALITY_CHOICES),
+        'course_stats': by_code('course', RaceRegistration.COURSE_CHOICES),
+        'shirt_size_stats': by_name('shirt_size', RaceRegistration.SHIRT_SIZE_CHOICES),
+        'infant_shirt_size_stats': by_name('shirt_size', RaceRegistration.INFANT_SHIRT_SIZE_CHOICES),
+    }
+
+
+# ============== Contadores no Redis ==============
+
+def counter_names(today=None):
+    """Mapeia cada contagem ('total', 'today', 'gender_M', ...) para sua chave no cache"""
+    today = today or timezone.now().date()
+    names = {
+        'total': f'{COUNTER_PREFIX}total',
+        'today': f'{COUNTER_PREFIX}created_{today.isoformat()}',
+    }
+    for field, choices in stat_dimensions().items():
+        for code, _ in choices:
+            names[stat_key(field, code)] = f'{COUNTER_PREFIX}{stat_key(field, code)}'
+    return names
+
+
+def registration_counter_names(values):
+    """Chaves dos contadores dos quais uma inscrição faz parte"""
+    names = [f'{COUNTER_PREFIX}total']
+    for field in stat_dimensions():
+        if values.get(field) is not None:
+            names.append(f'{COUNTER_PREFIX}{stat_key(field, values[field])}')
+    if values.get('created'):
+        names.append(f"{COUNTER_PREFIX}created_{values['created'].isoformat()}")
+    return names
+
+
+def apply_counter_deltas(deltas):
+    """
+    Soma os deltas ({chave: n}) aos contadores de forma atômica.
+
+    Não faz nada enquanto os contadores não forem inicializados, para não criar
+    contadores parciais; a primeira leitura (ou o rebuild) os inicializa. Durante
+    a inicialização os deltas ficam pendentes e entram na gravação.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    try:
+        client = get_redis_connection_or_none()
+        if client is not None:
+            keys = [cache_key(READY_KEY), cache_key(SEEDING_KEY), cache_key(PENDING_KEY)]
+            keys += [cache_key(name) for name in deltas]
+            client.eval(_APPLY_DELTAS_LUA, len(keys), *keys, CREATED_COUNTER_TTL, *deltas.values())
+            return
+
+        if cache.get(READY_KEY) is None:
+            return
+        for name, delta in deltas.items():
+            try:
+                cache.incr(name, delta)
+            except ValueError:
+                cache.set(name, delta, timeout=None)
+    except Exception as e:
+        print(f"Erro ao atualizar contadores de estatísticas: {e}")
+
+
+def store_race_counts(counts, today=None):
+    """Grava as contagens nos contadores e marca-os como inicializados (sem Redis)"""
+    names = counter_names(today)
+    today_name = names.pop('today')
+    cache.set_many({name: counts.get(stat, 0) for stat, name in names.items()}, timeout=None)
+    cache.set(today_name, counts.get('today', 0), timeout=CREATED_COUNTER_TTL)
+    cache.set(READY_KEY, 1, timeout=STATS_READY_TTL)
+
+
+def seed_race_counts():
+    """
+    Agrega as contagens no banco e inicializa os contadores com elas.
+
+    Retorna as contagens, ou None se outro processo já está inicializando
+    (o chamador responde pelo banco). Os contadores deixam de valer durante a
+    inicialização; os deltas do período são somados ao resultado.
+    """
+    client = get_redis_connection_or_none()
+    if client is None:
+        counts = aggregate_race_counts()
+        store_race_counts(counts)
+        return counts
+
+    seeding = cache_key(SEEDING_KEY)
+    if not client.set(seeding, 1, nx=True, ex=SEED_TIMEOUT):
+        return None
+    try:
+        # A partir daqui os deltas vão para os pendentes. Um delta que não viu
+        # a trava roda após o seu commit, anterior à agregação abaixo
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(cache_key(READY_KEY), cache_key(PENDING_KEY))
+        pipe.execute()
+
+        today = timezone.now().date()
+        counts = aggregate_race_counts()
+        names = counter_names(today)
+        stats = ['today'] + [stat for stat in names if stat != 'today']
+        keys = [cache_key(READY_KEY), seeding, cache_key(PENDING_KEY)]
+        keys += [cache_key(names[stat]) for stat in stats]
+        client.eval(
+            _STORE_SEED_LUA, len(keys), *keys,
+            STATS_READY_TTL, CREATED_COUNTER_TTL, *[counts.get(stat, 0) for stat in stats],
+        )
+        return counts
+    except Exception:
+        client.delete(seeding)
+        raise
+
+
+def read_stored_counts(today=None):
+    """Lê os contadores em um único MGET; None se ainda não foram inicializados"""
+    names = counter_names(today)
+    stored = cache.get_many([READY_KEY, *names.values()])
+    if READY_KEY not in stored:
+        return None
+    return {stat: stored.get(name, 0) for stat, name in names.items()}
+
+
+def read_race_counts():
+    """
+    Contagens para o dashboard: dos contadores no Redis, ou do banco (uma
+    consulta) quando os contadores não existem ou o Redis está indisponível
+    """
+    try:
+        counts = read_stored_counts()
+        if counts is not None:
+            return counts
+    except Exception as e:
+        print(f"Erro ao ler contadores de estatísticas: {e}")
+        return aggregate_race_counts()
+
+    try:
+        counts = seed_race_counts()
+        if counts is not None:
+            return counts
+    except Exception as e:
+        print(f"Erro ao gravar contadores de estatísticas: {e}")
+    return aggregate_race_counts()
@@ -0,0 +1,97 @@
+"""
+Fila de eventos de webhook do Stripe.
+
+O webhook só verifica a assinatura e grava o evento (record_stripe_event),
+respondendo 200 na hora; assim um SMTP ou banco lento não faz o Stripe
+acumular retentativas. O worker `run_stripe_event_worker` processa os
+eventos pendentes em ordem de criação no Stripe, com retentativas e backoff
+para falhas.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .email_outbox import compute_backoff
+
+DEFAULT_BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+
+
+def record_stripe_event(event) -> bool:
+    """
+    Grava o evento recebido. Retorna False se ele já existia (reenvio do
+    Stripe), o que custa apenas uma consulta no índice único de event_id.
+    """
+    from .models import StripeEvent
+
+    if StripeEvent.objects.filter(event_id=event['id']).exists():
+        return False
+
+    created = event.get('created')
+    try:
+        with transaction.atomic():
+            StripeEvent.objects.create(
+                event_id=event['id'],
+                event_type=event.get('type', ''),
+                payload=event,
+                stripe_created=datetime.fromtimestamp(created, tz=dt_timezone.utc) if created else None,
+            )
+    except IntegrityError:
+        # Reenvio concorrente gravou o mesmo evento primeiro
+        return False
+    return True
+
+
+def process_stripe_event_batch(batch_size: int = DEFAULT_BATCH_SIZE, max_attempts: int = MAX_ATTEMPTS) -> dict:
+    """
+    Processa um lote de eventos vencidos, na ordem em que o Stripe os criou.
+
+    As linhas são travadas com skip_locked, então dois workers não processam
+    o mesmo evento. Retorna {'processed': n, 'retried': n, 'failed': n}.
+    """
+    from .models import StripeEvent
+    from .services import process_stripe_webhook_event
+
+    result = {'processed': 0, 'retried': 0, 'failed': 0}
+    now = timezone.now()
+
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=StripeEvent.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('stripe_created', 'id')[:batch_size]
+        )
+        if not events:
+            return result
+
+        processed_ids = []
+        failed_events = []
+        for event in events:
+            outcome = process_stripe_webhook_event(event.payload)
+            if outcome['success']:
+                processed_ids.append(event.id)
+                continue
+
+            print(f"Erro ao processar evento Stripe {event.event_id}: {outcome['error']}")
+            event.attempts += 1
+            event.last_error = str(outcome['error'])[:1000]
+            if event.attempts >= max_attempts:
+                event.status = StripeEvent.STATUS_FAILED
+                result['failed'] += 1
+            else:
+                event.next_attempt_at = now + compute_backoff(event.attempts)
+                result['retried'] += 1
+            failed_events.append(event)
+
+        if processed_ids:
+            StripeEvent.objects.filter(id__in=processed_ids).update(
+                status=StripeEvent.STATUS_PROCESSED,
+                processed_at=timezone.now(),
+                last_error='',
+            )
+            result['processed'] = len(processed_ids)
+        if failed_events:
+            StripeEvent.objects.bulk_update(failed_events, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    return result
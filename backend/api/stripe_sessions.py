@@ -0,0 +1,177 @@
+"""
+Status das sessões de checkout do Stripe com cache.
+
+A página de sucesso consulta /api/payment/verify-status/ repetidamente.
+Para não chamar stripe.checkout.Session.retrieve a cada consulta:
+
+- inscrição já PAID com essa sessão: o banco responde, sem Stripe;
+- resumo da sessão fica no cache por STRIPE_SESSION_CACHE_TTL segundos,
+  ou sem expiração depois que o Stripe informa 'paid' (não muda mais).
+  Resumo 'paid' que não veio do banco ainda leva a view a marcar a
+  inscrição: se a marcação falhar, a próxima consulta tenta de novo.
+
+Acertos e falhas do cache ficam em contadores (session_cache_stats).
+
+A criação de sessões também é reaproveitada: a última sessão aberta de cada
+inscrição fica no cache até pouco antes de expirar no Stripe e é devolvida
+enquanto valor e cupom forem os mesmos (find_reusable_checkout_session).
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+SESSION_KEY_PREFIX = 'stripe_session:'
+STATS_KEY_PREFIX = 'stripe_session_cache:'
+STATS_FIELDS = ('db', 'hits', 'misses')
+
+CHECKOUT_KEY_PREFIX = 'stripe_checkout:'
+# Não reaproveita sessão que expira em menos tempo que isso (tempo para pagar)
+REUSE_MIN_REMAINING = 15 * 60
+
+
+def _count(name):
+    key = f'{STATS_KEY_PREFIX}{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def session_cache_stats():
+    """Contadores {'db': n, 'hits': n, 'misses': n} de respostas por origem"""
+    values = cache.get_many([f'{STATS_KEY_PREFIX}{name}' for name in STATS_FIELDS])
+    return {name: int(values.get(f'{STATS_KEY_PREFIX}{name}', 0)) for name in STATS_FIELDS}
+
+
+def summarize_session(session):
+    """Campos da sessão usados pelo verify-status (serializáveis no cache)"""
+    metadata = session.metadata or {}
+    return {
+        'payment_status': session.payment_status,
+        'amount_total': session.amount_total,
+        'customer_email': session.customer_email,
+        'registration_id': metadata.get('registration_id'),
+        'payment_intent': session.payment_intent,
+    }
+
+
+def _paid_registration_summary(session_id):
+    """Resumo montado do banco se a inscrição desta sessão já está paga"""
+    from .models import RaceRegistration
+
+    registration = (
+        RaceRegistration.objects.filter(stripe_checkout_session_id=session_id, payment_status='PAID')
+        .only('id', 'email', 'payment_amount', 'stripe_payment_intent_id')
+        .first()
+    )
+    if registration is None:
+        return None
+    return {
+        'payment_status': 'paid',
+        'amount_total': int(round(registration.payment_amount * 100)) if registration.payment_amount is not None else None,
+        'customer_email': registration.email,
+        'registration_id': str(registration.id),
+        'payment_intent': registration.stripe_payment_intent_id,
+    }
+
+
+def _local_session_status(session_id):
+    """Status vindo do banco ou do cache; None (falha de cache contada) se for preciso consultar o Stripe"""
+    summary = _paid_registration_summary(session_id)
+    if summary is not None:
+        _count('db')
+        return {'success': True, 'source': 'db', 'session': summary}
+
+    summary = cache.get(f'{SESSION_KEY_PREFIX}{session_id}')
+    if summary is not None:
+        _count('hits')
+        return {'success': True, 'source': 'cache', 'session': summary}
+
+    _count('misses')
+    return None
+
+
+def _store_session_status(session_id, session):
+    """Guarda o resumo da sessão consultada no Stripe"""
+    summary = summarize_session(session)
+    timeout = None if summary['payment_status'] == 'paid' else settings.STRIPE_SESSION_CACHE_TTL
+    cache.set(f'{SESSION_KEY_PREFIX}{session_id}', summary, timeout=timeout)
+    return {'success': True, 'source': 'stripe', 'session': summary}
+
+
+def get_checkout_session_status(session_id):
+    """
+    Status da sessão de checkout: banco, cache ou Stripe, nessa ordem.
+
+    Retorna {'success': True, 'source': 'db'|'cache'|'stripe', 'session': resumo}
+    ou {'success': False, 'error': ...} se o Stripe recusar a consulta.
+    """
+    from .services import verify_stripe_checkout_session
+
+    status = _local_session_status(session_id)
+    if status is not None:
+        return status
+
+    result = verify_stripe_checkout_session(session_id)
+    if not result['success']:
+        return result
+    return _store_session_status(session_id, result['session'])
+
+
+async def aget_checkout_session_status(session_id):
+    """
+    Versão assíncrona de get_checkout_session_status: banco e cache em
+    thread (sync_to_async), consulta ao Stripe no event loop
+    """
+    from .services import averify_stripe_checkout_session
+
+    status = await sync_to_async(_local_session_status)(session_id)
+    if status is not None:
+        return status
+
+    result = await averify_stripe_checkout_session(session_id)
+    if not result['success']:
+        return result
+    return await sync_to_async(_store_session_status)(session_id, result['session'])
+
+
+def remember_checkout_session(registration_id, session, amount, coupon_code):
+    """
+    Guarda a sessão recém criada para reaproveitamento enquanto ela ainda
+    tiver pelo menos REUSE_MIN_REMAINING segundos até expirar.
+    """
+    expires_at = session.expires_at
+    if not expires_at:
+        return
+    timeout = int(expires_at - time.time()) - REUSE_MIN_REMAINING
+    if timeout <= 0:
+        return
+    cache.set(f'{CHECKOUT_KEY_PREFIX}{registration_id}', {
+        'session_id': session.id,
+        'checkout_url': session.url,
+        'amount': amount,
+        'coupon_code': coupon_code,
+    }, timeout=timeout)
+
+
+def find_reusable_checkout_session(registration, amount, coupon_code):
+    """
+    Sessão aberta da inscrição com o mesmo valor (centavos) e cupom, ou None.
+
+    Só vale a sessão ainda gravada na inscrição (stripe_checkout_session_id);
+    uma sessão mais nova criada por outro caminho invalida a do cache.
+    """
+    if not registration.stripe_checkout_session_id:
+        return None
+    cached = cache.get(f'{CHECKOUT_KEY_PREFIX}{registration.id}')
+    if (
+        cached is None
+        or cached['session_id'] != registration.stripe_checkout_session_id
+        or cached['amount'] != amount
+        or cached['coupon_code'] != coupon_code
+    ):
+        return None
+    return cached
@@ -0,0 +1,102 @@
+"""
+Spans das chamadas externas (Stripe, AbacatePay, SMTP) e do banco
+
+`with span('stripe'):` mede o bloco e alimenta o histograma
+outbound_call_duration_seconds{target="stripe"} (api/metrics.py). Dentro de
+uma requisição, o tempo também é somado no trace da requisição, que o
+MetricsMiddleware abre e devolve no header Server-Timing:
+
+    Server-Timing: stripe;dur=312.5;desc="1x", db;dur=4.1;desc="3x", total;dur=330.2
+
+Fora de uma requisição (workers, threads do pool de pagamento) vale só o
+histograma. O custo é um perf_counter e uma observação de histograma por span.
+
+As consultas SQL ('db') são medidas por um execute_wrapper instalado em toda
+conexão do Django (install_query_tracing, ligado ao connection_created em
+apps.py) e só contam dentro de um trace. Um wrapper por requisição não
+serviria às views assíncronas: cada thread do sync_to_async tem a sua conexão.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .metrics import OUTBOUND_LATENCY
+
+_current_trace = ContextVar('trace', default=None)
+
+
+class Trace:
+    """Tempo total e número de spans por alvo em uma requisição"""
+
+    __slots__ = ('spans',)
+
+    def __init__(self):
+        self.spans = {}
+
+    def add(self, target, seconds):
+        total, count = self.spans.get(target, (0.0, 0))
+        self.spans[target] = (total + seconds, count + 1)
+
+    def count(self, target):
+        return self.spans.get(target, (0.0, 0))[1]
+
+    def server_timing(self, total_seconds):
+        """Valor do header Server-Timing (durações em ms)"""
+        parts = [
+            f'{target};dur={total * 1000:.1f};desc="{count}x"'
+            for target, (total, count) in self.spans.items()
+        ]
+        parts.append(f'total;dur={total_seconds * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def start_trace():
+    """Abre o trace da requisição; retorna (trace, token para end_trace)"""
+    trace = Trace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def record(target, seconds):
+    """Registra um span já medido"""
+    OUTBOUND_LATENCY.labels(target).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(target, seconds)
+
+
+@contextmanager
+def span(target):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(target, time.perf_counter() - started)
+
+
+def trace_query(execute, sql, params, many, context):
+    """execute_wrapper das conexões: mede a consulta se houver um trace aberto"""
+    if _current_trace.get() is None:
+        return execute(sql, params, many, context)
+    with span('db'):
+        return execute(sql, params, many, context)
+
+
+def install_query_tracing(sender, connection, **kwargs):
+    """Receptor do sinal connection_created"""
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_query)
+
+
+def percentile(values, pct):
+    """Percentil por interpolação linear (values não precisa estar ordenado)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
@@ -1,9 +1,16 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
 
 app_name = 'api'
 
+# Endpoints que esperam pelo Stripe/AbacatePay: views assíncronas sob ASGI
+if settings.ASYNC_GATEWAY_VIEWS:
+    from . import async_views as gateway_views
+else:
+    gateway_views = views
+
 # Configuração do router para ViewSets
 router = DefaultRouter()
 router.register(r'race-registrations', views.RaceRegistrationViewSet, basename='race-registration')
@@ -11,20 +18,23 @@ router.register(r'race-registrations', views.RaceRegistrationViewSet, basename='
 urlpatterns = [
     path('', views.api_root, name='api_root'),
     path('health/', views.health_check, name='health_check'),
+    path('metrics/', views.metrics, name='metrics'),
     path('race-statistics/', views.race_statistics, name='race_statistics'),
     path('payment-webhook/', views.payment_webhook, name='payment_webhook'),
     
     # Novos endpoints para pagamento com Stripe
-    path('payment/create-session/', views.create_payment_session, name='create_payment_session'),
-    path('payment/verify-status/', views.verify_payment_status, name='verify_payment_status'),
+    path('payment/create-session/', gateway_views.create_payment_session, name='create_payment_session'),
+    path('payment/session-status/<str:token>/', views.payment_session_status, name='payment_session_status'),
+    path('payment/verify-status/', gateway_views.verify_payment_status, name='verify_payment_status'),
     path('payment/stripe-webhook/', views.stripe_webhook, name='stripe_webhook'),
     path('payment/prices/', views.race_prices, name='race_prices'),
     path('payment/validate-coupon/', views.validate_coupon, name='validate_coupon'),
     
     # Novos endpoints para pagamento com AbacatePay (PIX)
-    path('payment/pix/create/', views.create_pix_payment, name='create_pix_payment'),
+    path('payment/pix/create/', gateway_views.create_pix_payment, name='create_pix_payment'),
     path('payment/pix/simulate/', views.simulate_pix_payment, name='simulate_pix_payment'),
-    path('payment/pix/check-status/', views.check_pix_status, name='check_pix_status'),
+    path('payment/pix/check-status/', gateway_views.check_pix_status, name='check_pix_status'),
+    path('payment/pix/webhook/', views.abacatepay_webhook, name='abacatepay_webhook'),
     
     # Endpoints administrativos
     path('admin/paid-registrations/', views.list_paid_registrations, name='list_paid_registrations'),
@@ -32,6 +42,7 @@ urlpatterns = [
     path('admin/update-registration/', views.update_registration, name='update_registration'),
     path('admin/enviar-notificacao/', views.send_broadcast_email, name='send_broadcast_email'),
     path('admin/status-notificacao/<str:task_id>/', views.check_broadcast_status, name='check_broadcast_status'),
+    path('admin/status-notificacao/<str:task_id>/falhas/', views.list_broadcast_failures, name='list_broadcast_failures'),
     
     path('', include(router.urls)),  # Inclui as URLs do router
 ] 
\ No newline at end of file
@@ -1,3 +1,6 @@
+import hmac
+import uuid
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
@@ -5,15 +8,26 @@ from rest_framework import status
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
 from drf_spectacular.utils import extend_schema, OpenApiExample
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST
+from django.conf import settings
 from django.utils import timezone
-from .models import RaceRegistration
+from django.utils.decorators import method_decorator
+from .idempotency import idempotent
+from .metrics import render_metrics
+from .models import RaceRegistration, EmailOutbox, Broadcast
 from .serializers import RaceRegistrationSerializer
+from .payment_jobs import get_payment_job, submit_checkout_session
+from .statistics import read_race_counts, build_statistics_payload
+from .stripe_events import record_stripe_event
+from .stripe_sessions import get_checkout_session_status
 from .services import (
     send_payment_confirmation_email,
     create_stripe_checkout_session,
-    verify_stripe_checkout_session,
-    process_stripe_webhook_event,
+    verify_abacatepay_webhook,
+    process_abacatepay_webhook_event,
     get_race_prices,
     validate_coupon_code,
     create_abacatepay_pix,
@@ -120,6 +134,37 @@ def health_check(request):
     }, status=status.HTTP_200_OK)
 
 
+@require_GET
+def metrics(request):
+    """
+    Métricas no formato de texto do Prometheus (api/metrics.py)
+
+    Exige o header `Authorization: Bearer <METRICS_TOKEN>`. Sem token
+    configurado só responde com DEBUG (desenvolvimento); em produção, 403.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse('METRICS_TOKEN não configurado', status=403, content_type='text/plain')
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+
+def rate_limit_exceeded(request, retry_after=60):
+    """
+    Resposta 429 do RateLimitMiddleware (api/middleware.py)
+    """
+    response = JsonResponse({
+        'error': 'Rate limit exceeded',
+        'message': 'Muitas requisições. Tente novamente em alguns minutos.',
+        'retry_after': retry_after,
+        'status_code': status.HTTP_429_TOO_MANY_REQUESTS,
+    }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
 class RaceRegistrationViewSet(ModelViewSet):
     """
     ViewSet para gerenciar inscrições de corrida
@@ -211,10 +256,14 @@ class RaceRegistrationViewSet(ModelViewSet):
             )
         ]
     )
+    @method_decorator(idempotent('race-registrations'))
     def create(self, request, *args, **kwargs):
         """
         Cria uma nova inscrição com status PENDING, envia email de confirmação
         e automaticamente cria uma sessão de pagamento Stripe.
+
+        Com PAYMENT_SESSION_ASYNC a sessão é criada em background e a resposta
+        traz `payment.token` para consultar /api/payment/session-status/<token>/.
         """
         try:
             print(f"DEBUG: Content-Type: {getattr(request, 'content_type', None)}")
@@ -275,6 +324,19 @@ class RaceRegistrationViewSet(ModelViewSet):
                     keys_list = []
                 print(f"DEBUG VIEW: Keys em request.data: {keys_list}")
                 print(f"DEBUG VIEW: Cupom recebido na view: '{coupon_code}' (tipo: {type(coupon_code)})")
+                
+                if settings.PAYMENT_SESSION_ASYNC:
+                    # Sessão criada em background; o cliente consulta o status pelo token
+                    token = submit_checkout_session(instance.id, base_url=derived_base, coupon_code=coupon_code)
+                    response_data = serializer.data
+                    response_data['payment'] = {
+                        'payment_pending': True,
+                        'token': token,
+                        'status_url': reverse('api:payment_session_status', kwargs={'token': token}, request=request)
+                    }
+                    headers = self.get_success_headers(serializer.data)
+                    return Response(response_data, status=status.HTTP_201_CREATED, headers=headers)
+                
                 payment_result = create_stripe_checkout_session(instance, base_url=derived_base, coupon_code=coupon_code)
                 print(f"DEBUG: Resultado do pagamento: {payment_result}")
                 
@@ -405,7 +467,8 @@ def payment_webhook(request):
     Webhook para processar confirmações de pagamento
     
     Recebe dados do gateway de pagamento e atualiza o status da inscrição.
-    Se o pagamento for confirmado, envia email de confirmação de pagamento.
+    Se o pagamento for confirmado, enfileira o email de confirmação de pagamento
+    (enviado pelo worker `run_email_worker`).
     """
     try:
         data = request.data
@@ -425,21 +488,14 @@ def payment_webhook(request):
         
         # Atualiza o status de pagamento
         old_status = registration.payment_status
-        registration.payment_status = payment_status
         
-        # Se o pagamento foi confirmado, gerar número de inscrição
-        if payment_status == 'PAID' and not registration.registration_number:
-            from .services import generate_unique_registration_number
-            registration.registration_number = generate_unique_registration_number()
-        
-        registration.save(update_fields=['payment_status', 'registration_number', 'updated_at'])
-        
-        # Se o pagamento foi confirmado e ainda não enviou email de pagamento
-        if payment_status == 'PAID' and not registration.payment_email_sent:
-            try:
-                send_payment_confirmation_email(registration)
-            except Exception as e:
-                print(f"Erro ao enviar email de confirmação de pagamento: {e}")
+        if payment_status == 'PAID':
+            # Gera número de inscrição e enfileira o email na mesma transação
+            mark_registration_paid_atomic(registration.id, amount_reais=amount)
+            registration.refresh_from_db()
+        else:
+            registration.payment_status = payment_status
+            registration.save(update_fields=['payment_status', 'updated_at'])
         
         return Response({
             'status': 'success',
@@ -447,7 +503,10 @@ def payment_webhook(request):
             'registration_id': registration_id,
             'payment_status': payment_status,
             'old_status': old_status,
-            'email_sent': registration.payment_email_sent if payment_status == 'PAID' else False
+            'email_sent': registration.payment_email_sent if payment_status == 'PAID' else False,
+            'email_queued': registration.email_outbox.filter(
+                status__in=[EmailOutbox.STATUS_PENDING, EmailOutbox.STATUS_SENDING]
+            ).exists() if payment_status == 'PAID' else False
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -479,6 +538,19 @@ def payment_webhook(request):
                             'infantil': 45,
                             'adulto': 105
                         },
+                        'course_stats': {
+                            'kids': 45,
+                            'run_5k': 60,
+                            'run_10k': 25,
+                            'walk_3k': 20
+                        },
+                        'infant_shirt_size_stats': {
+                            '4 anos': 5,
+                            '6 anos': 10,
+                            '8 anos': 12,
+                            '10 anos': 10,
+                            '12 anos': 8
+                        },
                         'shirt_size_stats': {
                             'PP': 10,
                             'P': 25,
@@ -499,47 +571,9 @@ def race_statistics(request):
     """
     Endpoint para estatísticas das inscrições de corrida
     """
-    from django.utils import timezone
-    
-    today = timezone.now().date()
-    
-    # Estatísticas gerais
-    total_inscriptions = RaceRegistration.objects.count()
-    male_count = RaceRegistration.objects.filter(gender='M').count()
-    female_count = RaceRegistration.objects.filter(gender='F').count()
-    
-    # Inscrições de hoje
-    inscriptions_today = RaceRegistration.objects.filter(
-        created_at__date=today
-    ).count()
-    
-    # Estatísticas de pagamento
-    payment_stats = {
-        'pending': RaceRegistration.objects.filter(payment_status='PENDING').count(),
-        'paid': RaceRegistration.objects.filter(payment_status='PAID').count(),
-    }
-    
-    # Estatísticas por modalidade
-    modality_stats = {
-        'infantil': RaceRegistration.objects.filter(modality='INFANTIL').count(),
-        'adulto': RaceRegistration.objects.filter(modality='ADULTO').count(),
-    }
-    
-    # Estatísticas por tamanho de camisa
-    shirt_size_stats = {}
-    for size_code, size_name in RaceRegistration.SHIRT_SIZE_CHOICES:
-        shirt_size_stats[size_name] = RaceRegistration.objects.filter(shirt_size=size_code).count()
-    
-    return Response({
-        'total_inscriptions': total_inscriptions,
-        'male_count': male_count,
-        'female_count': female_count,
-        'inscriptions_today': inscriptions_today,
-        'payment_stats': payment_stats,
-        'modality_stats': modality_stats,
-        'shirt_size_stats': shirt_size_stats,
-        'timestamp': timezone.now()
-    })
+    payload = build_statistics_payload(read_race_counts())
+    payload['timestamp'] = timezone.now()
+    return Response(payload)
 
 
 @extend_schema(
@@ -574,6 +608,7 @@ def race_statistics(request):
 )
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@idempotent('payment-create-session')
 def create_payment_session(request):
     """
     Cria uma sessão de checkout do Stripe para pagamento da inscrição
@@ -619,10 +654,55 @@ def create_payment_session(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@extend_schema(
+    tags=['pagamento'],
+    summary='Status da criação da sessão de pagamento',
+    description=(
+        'Consulta a sessão de pagamento criada em background após a inscrição '
+        '(PAYMENT_SESSION_ASYNC). Status: pending, ready (com checkout_url), auto_paid ou failed.'
+    ),
+    responses={
+        200: {
+            'description': 'Status do job',
+            'examples': [
+                {
+                    'application/json': {
+                        'success': True,
+                        'status': 'ready',
+                        'registration_id': 1,
+                        'checkout_url': 'https://checkout.stripe.com/c/pay/cs_test_123',
+                        'session_id': 'cs_test_123',
+                        'amount': 100.0
+                    }
+                }
+            ]
+        },
+        404: {'description': 'Token não encontrado ou expirado'},
+    }
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def payment_session_status(request, token):
+    """
+    Status da criação assíncrona da sessão de pagamento (somente cache)
+    """
+    job = get_payment_job(token)
+    if job is None:
+        return Response({
+            'success': False,
+            'error': 'Token não encontrado ou expirado'
+        }, status=status.HTTP_404_NOT_FOUND)
+    return Response({'success': True, **job}, status=status.HTTP_200_OK)
+
+
 @extend_schema(
     tags=['pagamento'],
     summary='Verificar status de pagamento',
-    description='Verifica o status de uma sessão de checkout do Stripe',
+    description=(
+        'Verifica o status de uma sessão de checkout do Stripe. Inscrição já paga é respondida '
+        'pelo banco e o status da sessão fica em cache (sem expiração depois de pago); '
+        '`source` indica a origem da resposta (db, cache ou stripe).'
+    ),
     parameters=[
         {
             'name': 'session_id',
@@ -642,7 +722,8 @@ def create_payment_session(request):
                         'payment_status': 'paid',
                         'amount_total': 10000,
                         'customer_email': 'usuario@email.com',
-                        'registration_updated': True
+                        'registration_updated': True,
+                        'source': 'stripe'
                     }
                 }
             ]
@@ -656,6 +737,9 @@ def create_payment_session(request):
 def verify_payment_status(request):
     """
     Verifica o status de uma sessão de checkout do Stripe
+
+    Inscrição já paga responde pelo banco e o status da sessão fica em cache
+    (ver api/stripe_sessions.py); o Stripe só é consultado em falha de cache.
     """
     try:
         session_id = request.query_params.get('session_id')
@@ -666,8 +750,7 @@ def verify_payment_status(request):
                 'error': 'session_id é obrigatório'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Verificar sessão no Stripe
-        result = verify_stripe_checkout_session(session_id)
+        result = get_checkout_session_status(session_id)
         
         if not result['success']:
             return Response(result, status=status.HTTP_400_BAD_REQUEST)
@@ -675,54 +758,30 @@ def verify_payment_status(request):
         session = result['session']
         registration_updated = False
         
-        # Se o pagamento foi concluído, atualizar a inscrição
-        if session.payment_status == 'paid':
-            registration_id = session.metadata.get('registration_id')
+        # Pagamento concluído e o banco ainda não tem a inscrição como paga:
+        # atualizar. Vale também para o cache (marcação anterior pode ter falhado)
+        if result['source'] != 'db' and session['payment_status'] == 'paid':
+            registration_id = session['registration_id']
             
             if registration_id:
                 try:
-                    registration = RaceRegistration.objects.get(id=registration_id)
-                    
-                    if registration.payment_status != 'PAID':
-                        registration.payment_status = 'PAID'
-                        registration.payment_date = timezone.now()
-                        if session.payment_intent:
-                            registration.stripe_payment_intent_id = session.payment_intent
-                        try:
-                            amt_total = getattr(session, 'amount_total', None)
-                            if amt_total is not None:
-                                registration.payment_amount = (amt_total or 0) / 100.0
-                        except Exception:
-                            pass
-                        
-                        # Gerar número de inscrição único se ainda não existe
-                        if not registration.registration_number:
-                            from .services import generate_unique_registration_number
-                            registration.registration_number = generate_unique_registration_number()
-                        
-                        registration.save(update_fields=[
-                            'payment_status', 
-                            'payment_date', 
-                            'stripe_payment_intent_id',
-                            'registration_number',
-                            'payment_amount'
-                        ])
-                        
-                        # Enviar email de confirmação se ainda não enviado
-                        if not registration.payment_email_sent:
-                            send_payment_confirmation_email(registration)
-                        
-                        registration_updated = True
-                        
+                    amt_total = session['amount_total']
+                    # Marca como paga e enfileira o email na mesma transação
+                    registration_updated = mark_registration_paid_atomic(
+                        int(registration_id),
+                        amount_reais=(amt_total or 0) / 100.0 if amt_total is not None else None,
+                        payment_intent_id=session['payment_intent'],
+                    )
                 except RaceRegistration.DoesNotExist:
                     pass
         
         return Response({
             'success': True,
-            'payment_status': session.payment_status,
-            'amount_total': session.amount_total,
-            'customer_email': session.customer_email,
-            'registration_updated': registration_updated
+            'payment_status': session['payment_status'],
+            'amount_total': session['amount_total'],
+            'customer_email': session['customer_email'],
+            'registration_updated': registration_updated,
+            'source': result['source']
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -735,13 +794,17 @@ def verify_payment_status(request):
 @extend_schema(
     tags=['pagamento'],
     summary='Webhook do Stripe',
-    description='Endpoint para receber eventos de webhook do Stripe',
+    description=(
+        'Endpoint para receber eventos de webhook do Stripe. O evento é verificado, gravado e '
+        'confirmado na hora; o processamento é feito pelo worker `run_stripe_event_worker`. '
+        'Eventos repetidos (mesmo id) são ignorados.'
+    ),
     request={
         'type': 'object',
         'description': 'Evento do webhook do Stripe'
     },
     responses={
-        200: {'description': 'Webhook processado com sucesso'},
+        200: {'description': 'Evento recebido (ou já recebido anteriormente)'},
         400: {'description': 'Dados inválidos ou assinatura inválida'},
     }
 )
@@ -749,8 +812,12 @@ def verify_payment_status(request):
 @permission_classes([AllowAny])
 def stripe_webhook(request):
     """
-    Endpoint para processar webhooks do Stripe
+    Endpoint para receber webhooks do Stripe
+
+    Apenas verifica a assinatura e grava o evento em StripeEvent; o
+    processamento (marcar como pago, enfileirar email) fica com o worker.
     """
+    import json
     import stripe
     from django.conf import settings
     from django.http import HttpResponse
@@ -762,23 +829,19 @@ def stripe_webhook(request):
     try:
         if endpoint_secret:
             # Verificar a assinatura do webhook
-            event = stripe.Webhook.construct_event(
+            stripe.Webhook.construct_event(
                 payload, sig_header, endpoint_secret
             )
-        else:
-            # Se não há secret configurado, aceitar qualquer evento (apenas para desenvolvimento)
-            event = stripe.Event.construct_from(
-                stripe.util.json.loads_object(payload), stripe.api_key
-            )
-        
-        # Processar o evento
-        result = process_stripe_webhook_event(event)
+        # Sem secret configurado aceita qualquer evento (apenas para desenvolvimento)
+        event = json.loads(payload)
         
-        if result['success']:
-            return HttpResponse(status=200)
-        else:
-            print(f"Erro ao processar webhook: {result['error']}")
+        if not event.get('id'):
+            print("Evento Stripe sem id")
             return HttpResponse(status=400)
+        
+        if not record_stripe_event(event):
+            print(f"Evento Stripe {event['id']} já recebido, ignorando")
+        return HttpResponse(status=200)
             
     except ValueError as e:
         print(f"Payload inválido: {e}")
@@ -791,6 +854,67 @@ def stripe_webhook(request):
         return HttpResponse(status=500)
 
 
+@extend_schema(
+    tags=['pagamento'],
+    summary='Webhook do AbacatePay',
+    description=(
+        'Recebe eventos de cobrança do AbacatePay (billing.paid) e confirma o pagamento PIX. '
+        'Exige o segredo na query string (webhookSecret) e/ou a assinatura HMAC no header '
+        'X-Webhook-Signature. Eventos repetidos (mesmo id) são ignorados.'
+    ),
+    request={
+        'type': 'object',
+        'description': 'Evento do webhook do AbacatePay'
+    },
+    responses={
+        200: {'description': 'Evento processado (ou já processado anteriormente)'},
+        400: {'description': 'Payload inválido'},
+        401: {'description': 'Assinatura ou segredo inválido'},
+    }
+)
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def abacatepay_webhook(request):
+    """
+    Endpoint para processar webhooks do AbacatePay
+    """
+    import json
+
+    payload = request.body
+    if not verify_abacatepay_webhook(
+        payload,
+        request.query_params.get('webhookSecret'),
+        request.META.get('HTTP_X_WEBHOOK_SIGNATURE'),
+    ):
+        print("Webhook AbacatePay recusado: assinatura ou segredo inválido")
+        return Response({
+            'success': False,
+            'error': 'Assinatura inválida'
+        }, status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        event = json.loads(payload)
+    except ValueError as e:
+        print(f"Payload inválido: {e}")
+        return Response({
+            'success': False,
+            'error': 'Payload inválido'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = process_abacatepay_webhook_event(event)
+    except Exception as e:
+        print(f"Erro geral no webhook AbacatePay: {e}")
+        return Response({
+            'success': False,
+            'error': f'Erro interno: {str(e)}'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    if result['success']:
+        return Response(result, status=status.HTTP_200_OK)
+    return Response(result, status=status.HTTP_400_BAD_REQUEST)
+
+
 @extend_schema(
     tags=['pagamento'],
     summary='Obter preços das modalidades',
@@ -944,6 +1068,7 @@ def validate_coupon(request):
 )
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@idempotent('payment-pix-create')
 def create_pix_payment(request):
     """
     Cria um QR Code PIX via AbacatePay para pagamento da inscrição
@@ -1130,10 +1255,126 @@ def check_pix_status(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+PAID_REGISTRATIONS_CHUNK_SIZE = 2000
+PAID_REGISTRATIONS_MAX_LIMIT = 5000
+
+PAID_REGISTRATION_FIELDS = (
+    'id', 'full_name', 'cpf', 'email', 'phone', 'birth_date', 'gender', 'course',
+    'modality', 'shirt_size', 'registration_number', 'payment_date',
+    'payment_email_sent', 'created_at',
+)
+
+PAID_REGISTRATION_COURSE_DISPLAY = {
+    'WALK_3K': 'Caminhada 3KM',
+    'RUN_5K': 'Corrida 5KM',
+    'RUN_10K': 'Corrida 10KM',
+    'KIDS': 'Kids',
+}
+
+
+_GENDER_DISPLAY = dict(RaceRegistration.GENDER_CHOICES)
+_MODALITY_DISPLAY = dict(RaceRegistration.MODALITY_CHOICES)
+_ADULT_SHIRT_DISPLAY = dict(RaceRegistration.SHIRT_SIZE_CHOICES)
+_INFANT_SHIRT_DISPLAY = dict(RaceRegistration.INFANT_SHIRT_SIZE_CHOICES)
+
+
+def _paid_registration_row(row):
+    """Converte uma linha de .values() no formato retornado pela listagem"""
+    shirt_choices = _INFANT_SHIRT_DISPLAY if row['modality'] == 'INFANTIL' else _ADULT_SHIRT_DISPLAY
+    modality_name = _MODALITY_DISPLAY.get(row['modality'], row['modality'])
+
+    return {
+        'id': row['id'],
+        'full_name': row['full_name'],
+        'cpf': row['cpf'] or 'N/A',
+        'email': row['email'],
+        'phone': row['phone'],
+        'birth_date': row['birth_date'].isoformat() if row['birth_date'] else None,
+        'gender': row['gender'],
+        'gender_display': _GENDER_DISPLAY.get(row['gender'], row['gender']),
+        'course': row['course'],
+        'course_display': PAID_REGISTRATION_COURSE_DISPLAY.get(row['course'], modality_name),
+        'modality': row['modality'],
+        'modality_display': modality_name,
+        'shirt_size': row['shirt_size'],
+        'shirt_size_display': shirt_choices.get(row['shirt_size'], row['shirt_size']),
+        'registration_number': row['registration_number'] or 'Pendente',
+        'payment_date': row['payment_date'].isoformat() if row['payment_date'] else None,
+        'payment_email_sent': row['payment_email_sent'],
+        'created_at': row['created_at'].isoformat(),
+    }
+
+
+def _stream_paid_registrations(rows, limit):
+    """Gera o JSON da listagem aos pedaços, sem montar a lista inteira em memória"""
+    import json
+
+    yield b'{"success": true, "registrations": ['
+    count = 0
+    last = None
+    for row in rows:
+        if count:
+            yield b','
+        yield json.dumps(_paid_registration_row(row), ensure_ascii=False).encode('utf-8')
+        count += 1
+        last = row
+
+    next_cursor = None
+    if limit and count == limit and last is not None:
+        next_cursor = f"{last['full_name']},{last['id']}"
+    yield (
+        f'], "count": {count}, "next_cursor": {json.dumps(next_cursor, ensure_ascii=False)}}}'
+    ).encode('utf-8')
+
+
+
+async def _astream_paid_registrations(rows, limit):
+    """
+    _stream_paid_registrations para o worker ASGI.
+
+    Com um iterador síncrono o Django consumiria o streaming inteiro com
+    sync_to_async(list) antes de enviar o primeiro byte. Aqui os pedaços são
+    lidos em lotes na thread da requisição (thread_sensitive), a mesma da
+    conexão com o banco usada pelo cursor da consulta.
+    """
+    from itertools import islice
+
+    from asgiref.sync import sync_to_async
+
+    parts = _stream_paid_registrations(rows, limit)
+    # Cada inscrição gera até dois pedaços (vírgula e JSON)
+    take = sync_to_async(lambda: list(islice(parts, 2 * PAID_REGISTRATIONS_CHUNK_SIZE)))
+    try:
+        while batch := await take():
+            for part in batch:
+                yield part
+    finally:
+        await sync_to_async(parts.close)()
+
 @extend_schema(
     tags=['admin'],
     summary='Listar inscrições com número de registro',
-    description='Lista todas as inscrições com número de registro preenchido ordenadas alfabeticamente',
+    description=(
+        'Lista as inscrições com número de registro preenchido ordenadas alfabeticamente. '
+        'A resposta é enviada em streaming. Para paginar, informe `limit` e repasse o '
+        '`next_cursor` recebido no parâmetro `after`.'
+    ),
+    parameters=[
+        {
+            'name': 'after',
+            'in': 'query',
+            'description': 'Cursor no formato <full_name>,<id> (next_cursor da página anterior)',
+            'required': False,
+            'type': 'string'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'description': f'Tamanho da página (máx. {PAID_REGISTRATIONS_MAX_LIMIT}); se omitido retorna todas',
+            'required': False,
+            'type': 'integer'
+        }
+    ],
     responses={
         200: {
             'description': 'Lista de inscrições pagas',
@@ -1141,7 +1382,6 @@ def check_pix_status(request):
                 {
                     'application/json': {
                         'success': True,
-                        'count': 10,
                         'registrations': [
                             {
                                 'id': 1,
@@ -1155,11 +1395,14 @@ def check_pix_status(request):
                                 'payment_email_sent': True,
                                 'created_at': '2025-12-01T10:00:00Z'
                             }
-                        ]
+                        ],
+                        'count': 10,
+                        'next_cursor': 'João Silva,1'
                     }
                 }
             ]
-        }
+        },
+        400: {'description': 'Cursor ou limite inválido'},
     }
 )
 @api_view(['GET'])
@@ -1168,54 +1411,51 @@ def list_paid_registrations(request):
     """
     Lista todas as inscrições com número de registro preenchido ordenadas alfabeticamente
     """
+    from django.db.models import Q
+    from django.http import StreamingHttpResponse
+
     try:
         registrations = RaceRegistration.objects.exclude(
             registration_number__isnull=True
         ).exclude(
             registration_number=''
-        ).order_by('full_name')
-        
-        data = []
-        for reg in registrations:
-            # Determinar exibição do percurso
-            course_code = reg.course
-            if course_code == 'WALK_3K':
-                course_display = 'Caminhada 3KM'
-            elif course_code == 'RUN_5K':
-                course_display = 'Corrida 5KM'
-            elif course_code == 'RUN_10K':
-                course_display = 'Corrida 10KM'
-            elif course_code == 'KIDS':
-                course_display = 'Kids'
-            else:
-                course_display = reg.get_modality_display()
-            
-            data.append({
-                'id': reg.id,
-                'full_name': reg.full_name,
-                'cpf': reg.cpf or 'N/A',
-                'email': reg.email,
-                'phone': reg.phone,
-                'birth_date': reg.birth_date.isoformat() if hasattr(reg, 'birth_date') and reg.birth_date else None,
-                'gender': reg.gender,
-                'gender_display': reg.get_gender_display(),
-                'course': reg.course,
-                'course_display': course_display,
-                'modality': reg.modality,
-                'modality_display': reg.get_modality_display(),
-                'shirt_size': reg.shirt_size,
-                'shirt_size_display': reg.get_shirt_size_display(),
-                'registration_number': reg.registration_number or 'Pendente',
-                'payment_date': reg.payment_date.isoformat() if reg.payment_date else None,
-                'payment_email_sent': reg.payment_email_sent,
-                'created_at': reg.created_at.isoformat()
-            })
-        
-        return Response({
-            'success': True,
-            'count': len(data),
-            'registrations': data
-        }, status=status.HTTP_200_OK)
+        ).order_by('full_name', 'id').values(*PAID_REGISTRATION_FIELDS)
+
+        after = request.query_params.get('after')
+        if after:
+            # full_name pode conter vírgula: o id é sempre o último campo
+            after_name, _, after_id = after.rpartition(',')
+            if not after_id.isdigit():
+                return Response({
+                    'success': False,
+                    'error': 'Cursor inválido. Formato esperado: <full_name>,<id>'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            registrations = registrations.filter(
+                Q(full_name__gt=after_name) | Q(full_name=after_name, id__gt=int(after_id))
+            )
+
+        limit = request.query_params.get('limit')
+        if limit:
+            if not limit.isdigit() or not 0 < int(limit) <= PAID_REGISTRATIONS_MAX_LIMIT:
+                return Response({
+                    'success': False,
+                    'error': f'limit deve estar entre 1 e {PAID_REGISTRATIONS_MAX_LIMIT}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            limit = int(limit)
+            registrations = registrations[:limit]
+
+        from django.core.handlers.asgi import ASGIRequest
+
+        rows = registrations.iterator(chunk_size=PAID_REGISTRATIONS_CHUNK_SIZE)
+        stream = (
+            _astream_paid_registrations if isinstance(request._request, ASGIRequest)
+            else _stream_paid_registrations
+        )
+        return StreamingHttpResponse(
+            stream(rows, limit),
+            content_type='application/json',
+            status=status.HTTP_200_OK,
+        )
         
     except Exception as e:
         return Response({
@@ -1491,7 +1731,7 @@ def send_broadcast_email(request):
             'success': True,
             'task_id': result,
             'total': registrations.count(),
-            'message': 'Envio iniciado em background'
+            'message': 'Envio enfileirado'
         }, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -1507,9 +1747,9 @@ def check_broadcast_status(request, task_id):
     """
     Retorna o status atual do envio em massa
     """
-    from django.core.cache import cache
+    from .broadcasts import get_broadcast_progress
 
-    progress = cache.get(f'broadcast_{task_id}')
+    progress = get_broadcast_progress(task_id)
     if not progress:
         return Response({
             'success': False,
@@ -1520,3 +1760,90 @@ def check_broadcast_status(request, task_id):
         'success': True,
         **progress,
     }, status=status.HTTP_200_OK)
+
+
+BROADCAST_FAILURES_MAX_LIMIT = 500
+
+
+@extend_schema(
+    tags=['admin'],
+    summary='Falhas de um envio em massa',
+    description=(
+        'Lista, paginada, os destinatários cujo email falhou. Para a próxima página, '
+        'repasse o `next_cursor` recebido no parâmetro `after`.'
+    ),
+    parameters=[
+        {
+            'name': 'after',
+            'in': 'query',
+            'description': 'Cursor (next_cursor da página anterior)',
+            'required': False,
+            'type': 'integer'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'description': f'Tamanho da página (padrão 100, máx. {BROADCAST_FAILURES_MAX_LIMIT})',
+            'required': False,
+            'type': 'integer'
+        }
+    ],
+    responses={
+        200: {
+            'description': 'Página de falhas',
+            'examples': [
+                {
+                    'application/json': {
+                        'success': True,
+                        'failures': [
+                            {
+                                'id': 42,
+                                'registration_id': 7,
+                                'email': 'joao@example.com',
+                                'full_name': 'João Silva',
+                                'error': 'SMTPRecipientsRefused'
+                            }
+                        ],
+                        'count': 1,
+                        'next_cursor': None
+                    }
+                }
+            ]
+        },
+        400: {'description': 'Cursor ou limite inválido'},
+        404: {'description': 'Tarefa não encontrada'},
+    }
+)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def list_broadcast_failures(request, task_id):
+    """
+    Retorna os destinatários com falha de um envio em massa, paginados
+    """
+    from .broadcasts import list_broadcast_failures as fetch_failures
+
+    try:
+        broadcast_id = uuid.UUID(task_id)
+    except ValueError:
+        broadcast_id = None
+    if broadcast_id is None or not Broadcast.objects.filter(id=broadcast_id).exists():
+        return Response({
+            'success': False,
+            'error': 'Tarefa não encontrada'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    after = request.query_params.get('after')
+    limit = request.query_params.get('limit', '100')
+    if (after and not after.isdigit()) or not limit.isdigit() or not 0 < int(limit) <= BROADCAST_FAILURES_MAX_LIMIT:
+        return Response({
+            'success': False,
+            'error': f'after deve ser numérico e limit deve estar entre 1 e {BROADCAST_FAILURES_MAX_LIMIT}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    failures, next_cursor = fetch_failures(broadcast_id, after=int(after) if after else None, limit=int(limit))
+    return Response({
+        'success': True,
+        'failures': failures,
+        'count': len(failures),
+        'next_cursor': next_cursor,
+    }, status=status.HTTP_200_OK)
@@ -58,8 +58,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'corsheaders.middleware.CorsMiddleware',  # CORS middleware deve vir primeiro
+    'api.middleware.MetricsMiddleware',  # Primeiro: mede a requisição inteira (api/metrics.py)
+    'corsheaders.middleware.CorsMiddleware',  # CORS antes dos demais (só as métricas vêm antes)
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.RateLimitMiddleware',  # Antes da sessão/autenticação: barra floods cedo
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,6 +89,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 
 # Database (usar Postgres no container; sem SQLite)
@@ -99,9 +102,36 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD', default='postgres'),
         'HOST': config('DB_HOST', default='db'),
         'PORT': config('DB_PORT', default='5432'),
+        # Conexão validada antes de ser usada (reaproveitada do pool ou persistente)
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
     }
 }
 
+# Conexões reaproveitadas entre requisições (benchmarks/bench_db_connections.py)
+# DB_POOL=True (padrão): pool do psycopg 3 por processo. Cada requisição pega
+# uma conexão já aberta e a devolve ao final; funciona também no worker ASGI,
+# onde cada requisição roda em uma thread diferente e CONN_MAX_AGE não
+# reaproveitaria nada. No gunicorn o tamanho do pool vem do número de
+# workers/threads (gunicorn.conf.py); fora dele (comandos, runserver) vale o
+# padrão abaixo. Workers x DB_POOL_MAX_SIZE + serviços de fundo deve caber
+# no max_connections do PostgreSQL.
+# DB_POOL=False: uma conexão persistente por thread por DB_CONN_MAX_AGE segundos.
+DB_POOL = config('DB_POOL', default=True, cast=bool)
+if DB_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # o pool não aceita conexões persistentes
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=1, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=4, cast=int),
+            # Espera por uma conexão livre antes de falhar a requisição
+            'timeout': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+            # Conexões além de min_size ociosas por mais que isso são fechadas
+            'max_idle': config('DB_POOL_MAX_IDLE', default=300.0, cast=float),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -238,6 +268,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
     'access-control-allow-origin',
     'access-control-allow-methods',
     'access-control-allow-headers',
@@ -263,6 +294,10 @@ DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@ad-mooving.co
 EMAIL_CHARSET = 'utf-8'
 DEFAULT_CHARSET = 'utf-8'
 
+# Envio em massa (worker run_broadcast_worker)
+BROADCAST_SMTP_CONNECTIONS = config('BROADCAST_SMTP_CONNECTIONS', default=4, cast=int)
+BROADCAST_MAX_RATE = config('BROADCAST_MAX_RATE', default=10.0, cast=float)  # emails/segundo (0 = sem limite)
+
 # Stripe settings
 STRIPE_PUBLIC_KEY = config('STRIPE_PUBLIC_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
@@ -270,6 +305,49 @@ STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
 STRIPE_ENABLE_PIX = config('STRIPE_ENABLE_PIX', default=True, cast=bool)
 STRIPE_CONNECT_ACCOUNT_ID = config('STRIPE_CONNECT_ACCOUNT_ID', default='')  # Se usar Stripe Connect
 STRIPE_APPLICATION_FEE_AMOUNT = config('STRIPE_APPLICATION_FEE_AMOUNT', default=0, cast=int)  # em centavos
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='')  # vazio = API real; ex.: http://localhost:8086 (Stripe falso)
+STRIPE_SESSION_CACHE_TTL = config('STRIPE_SESSION_CACHE_TTL', default=10, cast=int)  # segundos; sessões pagas ficam sem expiração
+
+# Criação da sessão de pagamento em background no POST de inscrição (api/payment_jobs.py)
+PAYMENT_SESSION_ASYNC = config('PAYMENT_SESSION_ASYNC', default=False, cast=bool)
+PAYMENT_SESSION_WORKERS = config('PAYMENT_SESSION_WORKERS', default=4, cast=int)  # threads por processo
+PAYMENT_SESSION_JOB_TIMEOUT = config('PAYMENT_SESSION_JOB_TIMEOUT', default=60, cast=int)  # segundos
+
+# Views assíncronas (api/async_views.py) nos endpoints que esperam pelo Stripe/AbacatePay.
+# Só valem sob ASGI; o gunicorn.conf.py liga junto com o worker uvicorn.
+ASYNC_GATEWAY_VIEWS = config('ASYNC_GATEWAY_VIEWS', default=False, cast=bool)
+
+# Header Idempotency-Key nos POSTs de inscrição e pagamento (api/idempotency.py)
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=24 * 3600, cast=int)  # segundos que a resposta fica guardada
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', default=60, cast=int)
+IDEMPOTENCY_WAIT_TIMEOUT = config('IDEMPOTENCY_WAIT_TIMEOUT', default=30, cast=float)  # espera máxima de uma duplicata
+
+# GET /api/metrics/ (Prometheus) exige 'Authorization: Bearer <token>'; sem token
+# configurado o endpoint só responde com DEBUG=True
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Header Server-Timing com o tempo gasto em Stripe, AbacatePay, SMTP e banco (api/tracing.py);
+# expõe tempos internos ao navegador, por isso só vem ligado com DEBUG=True
+SERVER_TIMING_ENABLED = config('SERVER_TIMING_ENABLED', default=DEBUG, cast=bool)
+
+# Rate limiting por rota e IP (api/rate_limit.py): 'N/período', período em s, m, h ou d
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMITS = {
+    'registration': config('RATE_LIMIT_REGISTRATION', default='10/h'),
+    'payment': config('RATE_LIMIT_PAYMENT', default='5/m'),
+    'pix': config('RATE_LIMIT_PIX', default='5/m'),
+    'verify_payment': config('RATE_LIMIT_VERIFY_PAYMENT', default='30/m'),
+    'pix_status': config('RATE_LIMIT_PIX_STATUS', default='30/m'),
+    'statistics': config('RATE_LIMIT_STATISTICS', default='100/h'),
+}
+# IP real do cliente atrás de proxy, no formato de request.META (como SECURE_PROXY_SSL_HEADER);
+# conta RATE_LIMIT_PROXY_COUNT proxies confiáveis a partir da direita. O padrão 0 usa REMOTE_ADDR:
+# só aumente com um proxy confiável à frente, senão o cliente escolhe o próprio IP pelo header
+RATE_LIMIT_CLIENT_IP_HEADER = config('RATE_LIMIT_CLIENT_IP_HEADER', default='HTTP_X_FORWARDED_FOR')
+RATE_LIMIT_PROXY_COUNT = config('RATE_LIMIT_PROXY_COUNT', default=0, cast=int)
+
+# AbacatePay webhook (ao menos um dos dois deve estar configurado)
+ABACATEPAY_WEBHOOK_SECRET = config('ABACATEPAY_WEBHOOK_SECRET', default='')  # ?webhookSecret= da URL cadastrada
+ABACATEPAY_WEBHOOK_HMAC_KEY = config('ABACATEPAY_WEBHOOK_HMAC_KEY', default='')  # chave do header X-Webhook-Signature
 
 # Redis Cache Configuration for Rate Limiting
 CACHES = {
@@ -0,0 +1,66 @@
+"""
+Utilitários compartilhados pelos benchmarks
+
+Cada benchmark roda contra um banco de teste descartável (criado e destruído
+com a mesma infraestrutura do test runner do Django), nunca contra o banco real.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+# Mesmo percentil dos comandos (não depende do Django configurado)
+from api.tracing import percentile  # noqa: E402,F401
+
+
+def setup_django():
+    """Configura o Django a partir do diretório do backend"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Cria um banco de teste descartável e o remove ao final"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def make_cpf(base):
+    """CPF válido a partir de uma base de 9 dígitos"""
+    digits = [int(d) for d in f'{base:09d}']
+    for weight in (10, 11):
+        total = sum(d * w for d, w in zip(digits, range(weight, 1, -1)))
+        digits.append((total * 10 % 11) % 10)
+    return ''.join(map(str, digits))
+
+
+def timed(func, *args, **kwargs):
+    """Executa func e retorna (resultado, duração em ms)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def print_latency_row(label, samples_ms):
+    """Imprime uma linha padronizada de latência"""
+    print(
+        f"{label:<24} n={len(samples_ms):<6} "
+        f"média={sum(samples_ms) / max(len(samples_ms), 1):7.3f}ms "
+        f"p50={percentile(samples_ms, 50):7.3f}ms "
+        f"p95={percentile(samples_ms, 95):7.3f}ms "
+        f"p99={percentile(samples_ms, 99):7.3f}ms"
+    )
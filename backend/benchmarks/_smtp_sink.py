@@ -0,0 +1,75 @@
+"""
+Servidor SMTP local que aceita e descarta as mensagens (para benchmarks)
+
+Fala o mínimo do protocolo usado pelo backend SMTP do Django. Uma latência
+opcional por mensagem simula o tempo de resposta de um servidor real.
+`received` guarda, por destinatário, o instante (perf_counter) da última
+mensagem aceita, para medir quanto tempo um email levou para chegar.
+"""
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 sink ESMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('latin-1').strip().upper()
+            if command.startswith('EHLO'):
+                self.wfile.write(b'250-sink\r\n250 8BITMIME\r\n')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                now = time.perf_counter()
+                with self.server.lock:
+                    self.server.messages += 1
+                    for address in recipients:
+                        self.server.received[address] = now
+                recipients = []
+                self.reply('250 OK')
+            elif command.startswith('RCPT'):
+                address = line.decode('latin-1').split(':', 1)[-1].split('>')[0]
+                recipients.append(address.strip(' <').lower())
+                self.reply('250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                # HELO, MAIL, RSET, NOOP
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Uso: with SMTPSink(latency=0.02) as sink: ... sink.port / sink.messages / sink.received"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.latency = latency
+        self.messages = 0
+        self.received = {}
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Requisições simultâneas por worker: gunicorn sync (WSGI) x uvicorn (ASGI)
+
+Sobe o gunicorn com UM worker em cada modo (gunicorn.conf.py, GUNICORN_ASGI)
+contra um Stripe falso e um AbacatePay falso com latência simulada e dispara
+N requisições com C clientes simultâneos nos endpoints que esperam pelo
+gateway:
+
+- pix:    GET /api/payment/pix/check-status/ (AbacatePay, sem banco);
+- stripe: GET /api/payment/verify-status/    (banco + cache + Stripe).
+
+Para cada modo imprime a vazão, p50/p95/p99 e quantas chamadas ao gateway o
+worker manteve em andamento ao mesmo tempo (média pela lei de Little,
+vazão × latência do gateway; pico medido em cada servidor falso). O worker sync fica
+em 1: cada requisição segura o worker durante todo o round-trip.
+
+O gunicorn usa as configurações do ambiente (PostgreSQL e Redis, como no
+container) com o banco de teste descartável criado aqui.
+
+Uso:
+    python benchmarks/bench_async_gateway.py
+    python benchmarks/bench_async_gateway.py --requests 500 --concurrency 100 --latency-ms 300 --endpoint pix
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from _common import BACKEND_DIR, print_latency_row, setup_django, test_database
+
+setup_django()
+
+from testes.fake_abacatepay import FakeAbacatePay  # noqa: E402
+from testes.fake_stripe import FakeStripe  # noqa: E402
+
+MODES = (('sync (WSGI)', False), ('uvicorn (ASGI)', True))
+STARTUP_TIMEOUT = 30.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Gunicorn:
+    """gunicorn.conf.py com um worker, no modo sync ou ASGI"""
+
+    def __init__(self, asgi, env):
+        self.port = free_port()
+        self.asgi = asgi
+        self.env = env
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        env = {
+            **os.environ,
+            **self.env,
+            'GUNICORN_ASGI': str(self.asgi),
+            'ASYNC_GATEWAY_VIEWS': str(self.asgi),
+            'PROMETHEUS_MULTIPROC_DIR': tempfile.mkdtemp(prefix='bench_async_gateway_'),
+        }
+        self.process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+                '--bind', f'127.0.0.1:{self.port}', '--workers', '1', '--timeout', '120',
+                '--log-level', 'warning',
+            ],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_ready()
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def wait_ready(self):
+        deadline = time.perf_counter() + STARTUP_TIMEOUT
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'gunicorn terminou ao iniciar (código {self.process.returncode})')
+            try:
+                # Sem pix_id a view responde 400 sem chamar o AbacatePay
+                requests.get(f'{self.base_url}/api/payment/pix/check-status/', timeout=STARTUP_TIMEOUT)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        raise RuntimeError('gunicorn não respondeu a tempo')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+def run(base_url, urls, concurrency):
+    """Dispara as requisições; retorna (latências em ms, erros, duração em s)"""
+    def call(url):
+        started = time.perf_counter()
+        try:
+            response = requests.get(f'{base_url}{url}', timeout=300)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return ok, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, urls))
+    elapsed = time.perf_counter() - started
+    samples = [ms for ok, ms in results if ok]
+    return samples, len(results) - len(samples), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Requisições por modo')
+    parser.add_argument('--concurrency', type=int, default=50, help='Clientes simultâneos')
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='Latência do Stripe/AbacatePay falsos')
+    parser.add_argument('--endpoint', choices=('pix', 'stripe', 'both'), default='both')
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    with test_database() as connection, \
+            FakeStripe(latency=latency) as fake_stripe, \
+            FakeAbacatePay(latency=latency) as fake_abacatepay:
+        pix_ids = [fake_abacatepay.create_pix({'amount': 10000})['id'] for _ in range(10)]
+        session_ids = [fake_stripe.create_session({'mode': 'payment'})['id'] for _ in range(10)]
+        urls = []
+        for i in range(args.requests):
+            if args.endpoint == 'pix' or (args.endpoint == 'both' and i % 2 == 0):
+                urls.append(f'/api/payment/pix/check-status/?pix_id={pix_ids[i % len(pix_ids)]}')
+            else:
+                urls.append(f'/api/payment/verify-status/?session_id={session_ids[i % len(session_ids)]}')
+
+        env = {
+            'DB_NAME': connection.settings_dict['NAME'],
+            'ABACATEPAY_BASE_URL': fake_abacatepay.base_url,
+            'STRIPE_API_BASE': fake_stripe.api_base,
+            'STRIPE_SECRET_KEY': 'sk_test_bench',
+            'STRIPE_SESSION_CACHE_TTL': '0',  # toda consulta de sessão vai ao Stripe
+            'RATE_LIMIT_ENABLED': 'False',
+        }
+
+        print(
+            f"{args.requests} requisições ({args.endpoint}), {args.concurrency} clientes, "
+            f"1 worker, latência do gateway {args.latency_ms:.0f}ms"
+        )
+        for label, asgi in MODES:
+            with Gunicorn(asgi, env) as server:
+                fake_stripe.peak_in_flight = fake_abacatepay.peak_in_flight = 0
+                samples, errors, elapsed = run(server.base_url, urls, args.concurrency)
+
+            throughput = len(samples) / elapsed
+            print(
+                f"{label:<16} {throughput:8.1f} req/s em {elapsed:.1f}s, erros={errors}; em andamento no "
+                f"gateway: média={throughput * latency:.1f}, pico Stripe={fake_stripe.peak_in_flight} "
+                f"AbacatePay={fake_abacatepay.peak_in_flight}"
+            )
+            print_latency_row(f'  {label}', samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark de vazão do envio em massa
+
+Popula o banco de teste com N inscrições (padrão 5k), sobe um servidor SMTP
+local que descarta as mensagens e executa o envio com 1, 4 e 8 conexões,
+sem limite de taxa, imprimindo emails/segundo de cada configuração.
+
+Uso:
+    python benchmarks/bench_broadcast.py
+    python benchmarks/bench_broadcast.py --recipients 5000 --latency-ms 20 --connections 1 4 8
+"""
+import argparse
+import time
+from datetime import date
+
+from _common import setup_django, test_database
+from _smtp_sink import SMTPSink
+
+setup_django()
+
+from django.test.utils import override_settings  # noqa: E402
+
+from api.broadcasts import create_broadcast, run_broadcast  # noqa: E402
+from api.models import RaceRegistration  # noqa: E402
+
+
+def seed(rows):
+    RaceRegistration.objects.bulk_create([
+        RaceRegistration(
+            full_name=f'Atleta {i:05d}',
+            cpf=f'{i:011d}',
+            email=f'atleta{i}@email.com',
+            phone='86999999999',
+            birth_date=date(1990, 1, 1),
+            gender='M' if i % 2 else 'F',
+            course='RUN_5K',
+            shirt_size='M',
+            athlete_declaration=True,
+            payment_status='PAID',
+            registration_number=f'{i:05d}',
+        )
+        for i in range(rows)
+    ], batch_size=1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipients', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Latência simulada do servidor SMTP por mensagem')
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    with test_database(), SMTPSink(latency=args.latency_ms / 1000) as sink:
+        seed(args.recipients)
+        registrations = RaceRegistration.objects.all()
+        print(f"{args.recipients} destinatários, latência SMTP simulada {args.latency_ms:.0f}ms")
+
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=sink.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+        ):
+            for connections in args.connections:
+                broadcast = create_broadcast('Benchmark', 'Mensagem de teste', registrations)
+                before = sink.messages
+                start = time.perf_counter()
+                result = run_broadcast(broadcast, connections=connections, max_rate=0)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"conexões={connections:<3} enviados={result['sent']:<6} falhos={result['failed']:<4} "
+                    f"recebidos={sink.messages - before:<6} tempo={elapsed:7.2f}s "
+                    f"vazão={result['sent'] / elapsed:8.1f} emails/s"
+                )
+
+
+if __name__ == '__main__':
+    main()
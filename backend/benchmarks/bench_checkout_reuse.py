@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark do reaproveitamento de sessões de checkout do Stripe
+
+Simula usuários que voltam ou clicam várias vezes em "pagar": cada inscrição
+chama create_stripe_checkout_session N vezes. O Stripe é substituído por um
+falso com latência configurável; compara latência (p50/p95/p99) e chamadas
+ao Stripe com e sem o reaproveitamento.
+
+Uso:
+    python benchmarks/bench_checkout_reuse.py
+    python benchmarks/bench_checkout_reuse.py --registrations 200 --attempts 4 --stripe-latency-ms 400
+"""
+import argparse
+import itertools
+import time
+from contextlib import nullcontext
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from _common import print_latency_row, setup_django, test_database, timed
+
+setup_django()
+
+from django.core.cache import cache  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from api.models import RaceRegistration  # noqa: E402
+from api.services import create_stripe_checkout_session  # noqa: E402
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class FakeStripeCheckout:
+    """stripe.checkout.Session.create com latência fixa"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._ids = itertools.count(1)
+
+    def create(self, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        session_id = f'cs_bench_{next(self._ids)}'
+        return SimpleNamespace(
+            id=session_id,
+            url=f'https://checkout.stripe.com/c/pay/{session_id}',
+            expires_at=int(time.time()) + 24 * 3600,
+        )
+
+
+def seed(rows):
+    return RaceRegistration.objects.bulk_create([
+        RaceRegistration(
+            full_name=f'Atleta {i:05d}',
+            cpf=f'{i:011d}',
+            email=f'atleta{i}@email.com',
+            phone='86999999999',
+            birth_date=date(1990, 1, 1),
+            gender='M' if i % 2 else 'F',
+            course='RUN_5K',
+            shirt_size='M',
+            athlete_declaration=True,
+        )
+        for i in range(rows)
+    ])
+
+
+def run(attempts, latency, reuse):
+    """Retorna (latências da 1ª chamada, latências das repetições, chamadas ao Stripe)"""
+    fake = FakeStripeCheckout(latency)
+    first, repeats = [], []
+    cache.clear()
+    RaceRegistration.objects.update(stripe_checkout_session_id=None)
+    no_reuse = nullcontext() if reuse else patch('api.services.find_reusable_checkout_session', return_value=None)
+    with patch('api.services.stripe.checkout.Session.create', fake.create), no_reuse:
+        for registration in RaceRegistration.objects.all():
+            for attempt in range(attempts):
+                result, elapsed = timed(create_stripe_checkout_session, registration)
+                assert result['success'], result
+                (repeats if attempt else first).append(elapsed)
+    return first, repeats, fake.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registrations', type=int, default=100)
+    parser.add_argument('--attempts', type=int, default=4, help='Chamadas ao create por inscrição')
+    parser.add_argument('--stripe-latency-ms', type=float, default=300.0)
+    args = parser.parse_args()
+
+    with test_database(), override_settings(CACHES=LOCMEM_CACHE):
+        seed(args.registrations)
+        print(
+            f"{args.registrations} inscrições x {args.attempts} chamadas, "
+            f"latência Stripe simulada {args.stripe_latency_ms:.0f}ms"
+        )
+        for label, reuse in (('sem reaproveitamento', False), ('com reaproveitamento', True)):
+            first, repeats, calls = run(args.attempts, args.stripe_latency_ms / 1000, reuse)
+            print(f"{label} ({calls} chamadas ao Stripe)")
+            print_latency_row('  todas', first + repeats)
+            print_latency_row('  repetições', repeats)
+
+
+if __name__ == '__main__':
+    main()
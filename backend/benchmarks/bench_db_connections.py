@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Custo de conexão com o PostgreSQL por requisição
+
+Simula o ciclo de uma requisição do Django (request_started → consultas →
+request_finished, que fecha ou devolve a conexão) N vezes e compara:
+
+- nova conexão:    sem CONN_MAX_AGE nem pool (uma conexão por requisição);
+- CONN_MAX_AGE=60: conexão persistente por thread;
+- pool psycopg 3:  OPTIONS['pool'] (DB_POOL, padrão do backend/settings.py).
+
+Para cada modo imprime p50/p95/p99 da requisição e quantas conexões foram
+abertas no PostgreSQL (pg_backend_pid distintos). Com --thread-per-request
+cada requisição roda em uma thread nova, como as views síncronas e o ORM
+assíncrono no worker ASGI: a conexão persistente deixa de ser reaproveitada
+e só o pool evita abrir uma conexão por requisição.
+
+As validações de conexão (CONN_HEALTH_CHECKS) seguem as configurações.
+Precisa do PostgreSQL das configurações (DB_HOST, DB_USER...) e do psycopg 3.
+
+Uso:
+    python benchmarks/bench_db_connections.py
+    python benchmarks/bench_db_connections.py --requests 2000 --threads 4
+    python benchmarks/bench_db_connections.py --thread-per-request
+"""
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from _common import print_latency_row, setup_django, test_database, timed
+
+setup_django()
+
+from django.core.signals import request_finished, request_started  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from api.models import RaceRegistration  # noqa: E402
+
+MODES = (
+    ('nova conexão', 0, None),
+    ('CONN_MAX_AGE=60', 60, None),
+    ('pool psycopg 3', 0, {'min_size': 1}),
+)
+
+
+def configure(conn_max_age, pool):
+    """Troca o modo de conexão do alias default (vale para todas as threads)"""
+    connection.close()
+    if connection.pool:
+        connection.close_pool()
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    if pool:
+        connection.settings_dict['OPTIONS']['pool'] = pool
+    else:
+        connection.settings_dict['OPTIONS'].pop('pool', None)
+
+
+def request(registration_id, pids, lock):
+    """Uma requisição típica: uma leitura pela chave primária"""
+    request_started.send(sender=None)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            pid = cursor.fetchone()[0]
+        RaceRegistration.objects.filter(id=registration_id).exists()
+    finally:
+        request_finished.send(sender=None)
+    with lock:
+        pids.add(pid)
+
+
+def run(requests, threads, thread_per_request, registration_id):
+    """Retorna (latências em ms, conexões abertas)"""
+    pids, lock = set(), threading.Lock()
+
+    def call(_):
+        return timed(request, registration_id, pids, lock)[1]
+
+    def call_in_new_thread(i):
+        result = []
+
+        def target():
+            try:
+                result.append(call(i))
+            finally:
+                # A conexão persistente da thread não seria mais usada por ninguém
+                connection.close()
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        return result[0]
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = list(pool.map(call_in_new_thread if thread_per_request else call, range(requests)))
+    return samples, len(pids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000, help='Requisições por modo')
+    parser.add_argument('--threads', type=int, default=1, help='Requisições simultâneas (threads do worker)')
+    parser.add_argument(
+        '--thread-per-request', action='store_true', help='Cada requisição em uma thread nova (worker ASGI)'
+    )
+    args = parser.parse_args()
+
+    with test_database():
+        registration = RaceRegistration.objects.create(
+            full_name='Atleta Bench',
+            cpf='00000000191',
+            email='bench@email.com',
+            phone='86999999999',
+            birth_date=date(1990, 1, 1),
+            gender='F',
+            course='RUN_5K',
+            shirt_size='M',
+            athlete_declaration=True,
+        )
+
+        print(
+            f"{args.requests} requisições, {args.threads} thread(s)"
+            f"{', thread nova por requisição' if args.thread_per_request else ''}, "
+            f"health checks {'ligados' if connection.settings_dict['CONN_HEALTH_CHECKS'] else 'desligados'}"
+        )
+        baseline = None
+        for label, conn_max_age, pool in MODES:
+            configure(conn_max_age, pool and {**pool, 'max_size': args.threads})
+            samples, opened = run(args.requests, args.threads, args.thread_per_request, registration.id)
+            configure(0, None)
+
+            mean = sum(samples) / len(samples)
+            baseline = mean if baseline is None else baseline
+            print_latency_row(label, samples)
+            print(
+                f"{'':<24} conexões abertas={opened}, diferença por requisição "
+                f"para 'nova conexão': {mean - baseline:+.3f}ms"
+            )
+
+
+if __name__ == '__main__':
+    main()
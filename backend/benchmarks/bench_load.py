@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Teste de carga offline: inscrição → pagamento → email de confirmação
+
+Sobe a API num servidor WSGI com threads (banco de teste descartável), um
+Stripe falso (testes/fake_stripe.py), um AbacatePay falso
+(testes/fake_abacatepay.py) e um servidor SMTP local, cada um com latência
+configurável, além dos workers de eventos do Stripe e de emails em threads.
+N clientes concorrentes executam fluxos completos:
+
+- cartão: POST inscrição (cria a sessão no Stripe) → pagamento no Stripe
+  falso (webhook checkout.session.completed) → verify-status até 'paid';
+- PIX: POST inscrição → POST pix/create → simulate-payment no AbacatePay
+  falso (webhook billing.paid) → pix/check-status até PAID;
+
+e em ambos espera o email de confirmação chegar ao SMTP. Imprime a vazão e
+p50/p95/p99 de cada etapa. Nada sai para a rede.
+
+Use com o PostgreSQL: no SQLite as escritas concorrentes se serializam e
+os workers falham com "database is locked".
+
+Uso:
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --flows 500 --concurrency 50 --pix-ratio 0.5 \\
+        --stripe-latency-ms 300 --abacatepay-latency-ms 200 --smtp-latency-ms 50
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import requests
+
+from _common import make_cpf, print_latency_row, setup_django, test_database
+from _smtp_sink import SMTPSink
+
+setup_django()
+
+import stripe  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.core.mail import get_connection  # noqa: E402
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from api.email_outbox import process_outbox_batch  # noqa: E402
+from api.stripe_events import process_stripe_event_batch  # noqa: E402
+from testes.fake_abacatepay import FakeAbacatePay  # noqa: E402
+from testes.fake_stripe import FakeStripe  # noqa: E402
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+STRIPE_WEBHOOK_SECRET = 'whsec_carga'
+ABACATEPAY_WEBHOOK_SECRET = 'segredo-carga'
+ABACATEPAY_HMAC_KEY = 'chave-carga'
+WORKER_INTERVAL = 0.05
+STAGES = ('inscrição', 'criar PIX', 'pagamento', 'confirmação', 'fluxo completo')
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class ApiServer:
+    """A API do Django num ThreadedWSGIServer local (uma thread por requisição)"""
+
+    def __init__(self):
+        self._server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietHandler, allow_reuse_address=True)
+        self._server.set_app(get_wsgi_application())
+
+    @property
+    def base_url(self):
+        return f'http://localhost:{self._server.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def run_worker(stop, process_batch, errors):
+    """Laço de um worker (eventos do Stripe ou emails) até stop ser sinalizado"""
+    try:
+        while not stop.is_set():
+            try:
+                result = process_batch()
+            except Exception as e:
+                # Um lote que falhou volta para a fila; o worker continua
+                errors.append(f'worker: {e}')
+                connections.close_all()
+                result = {}
+            if not any(result.values()):
+                stop.wait(WORKER_INTERVAL)
+    finally:
+        connections.close_all()
+
+
+def email_batch():
+    connection = get_connection()
+    return lambda: process_outbox_batch(connection)
+
+
+class LoadTest:
+    def __init__(self, args, api, fake_stripe, fake_abacatepay, sink):
+        self.args = args
+        self.api = api
+        self.fake_stripe = fake_stripe
+        self.fake_abacatepay = fake_abacatepay
+        self.sink = sink
+        self.samples = defaultdict(list)
+        self.errors = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def wait_for(self, check, what):
+        deadline = time.perf_counter() + self.args.timeout
+        while time.perf_counter() < deadline:
+            result = check()
+            if result:
+                return result
+            time.sleep(self.args.poll_ms / 1000)
+        raise TimeoutError(f'tempo esgotado esperando {what}')
+
+    def register(self, i):
+        response = self.http.post(f'{self.api.base_url}/api/race-registrations/', json={
+            'full_name': f'Atleta Carga {i:05d}',
+            'cpf': make_cpf(200000000 + i),
+            'email': f'carga{i}@email.com',
+            'phone': '86999999999',
+            'birth_date': '1990-01-01',
+            'gender': 'M' if i % 2 else 'F',
+            'course': 'RUN_5K',
+            'shirt_size': 'M',
+            'athlete_declaration': True,
+        }, timeout=self.args.timeout)
+        data = response.json()
+        if response.status_code != 201 or 'payment' not in data:
+            raise RuntimeError(f'inscrição {response.status_code}: {data}')
+        return data
+
+    def pay_with_card(self, session_id):
+        self.http.post(f'{self.fake_stripe.api_base}/v1/checkout/sessions/{session_id}/pay', timeout=self.args.timeout)
+
+        def paid():
+            response = self.http.get(
+                f'{self.api.base_url}/api/payment/verify-status/', params={'session_id': session_id}, timeout=self.args.timeout,
+            )
+            return response.status_code == 200 and response.json()['payment_status'] == 'paid'
+
+        self.wait_for(paid, f'sessão {session_id} paga')
+
+    def create_pix(self, registration_id):
+        response = self.http.post(
+            f'{self.api.base_url}/api/payment/pix/create/', json={'registration_id': registration_id}, timeout=self.args.timeout,
+        )
+        data = response.json()
+        if response.status_code != 200 or not data.get('pix_id'):
+            raise RuntimeError(f'PIX {response.status_code}: {data}')
+        return data['pix_id']
+
+    def pay_with_pix(self, pix_id):
+        self.http.post(
+            f'{self.fake_abacatepay.base_url}/pixQrCode/simulate-payment', params={'id': pix_id}, json={}, timeout=self.args.timeout,
+        )
+
+        def paid():
+            response = self.http.get(
+                f'{self.api.base_url}/api/payment/pix/check-status/', params={'pix_id': pix_id}, timeout=self.args.timeout,
+            )
+            return response.status_code == 200 and response.json()['status'] == 'PAID'
+
+        self.wait_for(paid, f'PIX {pix_id} pago')
+
+    def flow(self, i, pix):
+        timings = {}
+        started = time.perf_counter()
+        data = self.register(i)
+        timings['inscrição'] = time.perf_counter() - started
+
+        if pix:
+            stage_started = time.perf_counter()
+            pix_id = self.create_pix(data['id'])
+            timings['criar PIX'] = time.perf_counter() - stage_started
+            paid_started = time.perf_counter()
+            self.pay_with_pix(pix_id)
+        else:
+            paid_started = time.perf_counter()
+            self.pay_with_card(data['payment']['session_id'])
+        timings['pagamento'] = time.perf_counter() - paid_started
+
+        email = data['email'].lower()
+        received = self.wait_for(lambda: self.sink.received.get(email), f'email para {email}')
+        timings['confirmação'] = received - paid_started
+        timings['fluxo completo'] = received - started
+        return timings
+
+    def run_flow(self, i):
+        # Distribui os fluxos PIX uniformemente entre os de cartão
+        pix = int((i + 1) * self.args.pix_ratio) > int(i * self.args.pix_ratio)
+        kind = 'pix' if pix else 'cartão'
+        try:
+            timings = self.flow(i, pix)
+        except Exception as e:
+            with self._lock:
+                self.errors.append(f'fluxo {i} ({kind}): {e}')
+            return
+        with self._lock:
+            for stage, seconds in timings.items():
+                self.samples[(kind, stage)].append(seconds * 1000)
+                self.samples[('todos', stage)].append(seconds * 1000)
+
+    def run(self):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            list(pool.map(self.run_flow, range(self.args.flows)))
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flows', type=int, default=200, help='Fluxos inscrição→pagamento→email')
+    parser.add_argument('--concurrency', type=int, default=20, help='Clientes simultâneos')
+    parser.add_argument('--pix-ratio', type=float, default=0.5, help='Fração dos fluxos pagos por PIX (AbacatePay)')
+    parser.add_argument('--stripe-latency-ms', type=float, default=300.0)
+    parser.add_argument('--abacatepay-latency-ms', type=float, default=200.0)
+    parser.add_argument('--smtp-latency-ms', type=float, default=50.0)
+    parser.add_argument('--stripe-workers', type=int, default=1, help='Threads de run_stripe_event_worker')
+    parser.add_argument('--email-workers', type=int, default=1, help='Threads de run_email_worker')
+    parser.add_argument('--cache', choices=('redis', 'locmem'), default='redis')
+    parser.add_argument('--poll-ms', type=float, default=50.0, help='Intervalo das consultas de status')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Segundos por etapa antes de contar erro')
+    args = parser.parse_args()
+
+    caches = settings.CACHES if args.cache == 'redis' else LOCMEM_CACHE
+    stop = threading.Event()
+    with test_database(), SMTPSink(latency=args.smtp_latency_ms / 1000) as sink, \
+            FakeStripe(webhook_secret=STRIPE_WEBHOOK_SECRET, latency=args.stripe_latency_ms / 1000) as fake_stripe, \
+            FakeAbacatePay(
+                webhook_secret=ABACATEPAY_WEBHOOK_SECRET, hmac_key=ABACATEPAY_HMAC_KEY,
+                latency=args.abacatepay_latency_ms / 1000,
+            ) as fake_abacatepay, \
+            override_settings(
+                CACHES=caches,
+                RATE_LIMIT_ENABLED=False,
+                PAYMENT_SESSION_ASYNC=False,
+                STRIPE_WEBHOOK_SECRET=STRIPE_WEBHOOK_SECRET,
+                ABACATEPAY_WEBHOOK_SECRET=ABACATEPAY_WEBHOOK_SECRET,
+                ABACATEPAY_WEBHOOK_HMAC_KEY=ABACATEPAY_HMAC_KEY,
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                EMAIL_HOST='127.0.0.1',
+                EMAIL_PORT=sink.port,
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+                EMAIL_HOST_USER='',
+                EMAIL_HOST_PASSWORD='',
+            ), \
+            patch.multiple(stripe, api_base=fake_stripe.api_base, api_key='sk_test_carga', max_network_retries=0), \
+            patch('api.abacatepay_client.ABACATEPAY_BASE_URL', fake_abacatepay.base_url), \
+            ApiServer() as api:
+        cache.clear()
+        fake_stripe.webhook_url = f'{api.base_url}/api/payment/stripe-webhook/'
+        fake_abacatepay.webhook_url = f'{api.base_url}/api/payment/pix/webhook/'
+
+        load = LoadTest(args, api, fake_stripe, fake_abacatepay, sink)
+        workers = [
+            threading.Thread(target=run_worker, args=(stop, process_stripe_event_batch, load.errors), daemon=True)
+            for _ in range(args.stripe_workers)
+        ] + [
+            threading.Thread(target=run_worker, args=(stop, email_batch(), load.errors), daemon=True)
+            for _ in range(args.email_workers)
+        ]
+        # Os prints de DEBUG das views não entram na saída
+        with patch('builtins.print'):
+            for worker in workers:
+                worker.start()
+            try:
+                elapsed = load.run()
+            finally:
+                stop.set()
+                for worker in workers:
+                    worker.join()
+        cache.clear()
+
+    completed = sum(len(load.samples[(kind, 'fluxo completo')]) for kind in ('cartão', 'pix'))
+    print(
+        f"{args.flows} fluxos, {args.concurrency} clientes, {args.pix_ratio:.0%} PIX; latência simulada "
+        f"Stripe {args.stripe_latency_ms:.0f}ms, AbacatePay {args.abacatepay_latency_ms:.0f}ms, "
+        f"SMTP {args.smtp_latency_ms:.0f}ms"
+    )
+    print(f"Vazão: {completed / elapsed:.2f} fluxos/s ({completed} concluídos em {elapsed:.1f}s)")
+    for kind in ('todos', 'cartão', 'pix'):
+        if not load.samples[(kind, 'fluxo completo')]:
+            continue
+        print(kind)
+        for stage in STAGES:
+            if load.samples[(kind, stage)]:
+                print_latency_row(f'  {stage}', load.samples[(kind, stage)])
+    print(
+        f"Chamadas: Stripe {len(fake_stripe.requests)}, AbacatePay {len(fake_abacatepay.requests)}, "
+        f"emails {sink.messages}"
+    )
+    if load.errors:
+        print(f"{len(load.errors)} erro(s) em fluxos e workers:")
+        for error in load.errors[:10]:
+            print(f"  {error}")
+
+
+if __name__ == '__main__':
+    main()
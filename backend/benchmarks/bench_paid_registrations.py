@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memória da listagem /api/admin/paid-registrations/
+
+Popula o banco de teste com N inscrições pagas (padrão 50k), consome a
+resposta em streaming e mede o pico de memória do processo (RSS) e das
+alocações Python (tracemalloc) durante a requisição.
+
+Uso:
+    python benchmarks/bench_paid_registrations.py
+    python benchmarks/bench_paid_registrations.py --rows 100000 --page 1000
+"""
+import argparse
+import gc
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+from _common import setup_django, test_database
+
+setup_django()
+
+from django.test import Client  # noqa: E402
+
+from api.models import RaceRegistration  # noqa: E402
+
+SEED_BATCH_SIZE = 5000
+
+
+def peak_rss_mb():
+    """Pico de RSS do processo em MB (ru_maxrss é KB no Linux e bytes no macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def seed(rows):
+    """Cria as inscrições pagas em lotes, sem manter os objetos em memória"""
+    for start in range(0, rows, SEED_BATCH_SIZE):
+        RaceRegistration.objects.bulk_create([
+            RaceRegistration(
+                full_name=f'Atleta {i:06d}',
+                cpf=f'{i:011d}',
+                email=f'atleta{i}@email.com',
+                phone='86999999999',
+                birth_date=date(1990, 1, 1),
+                gender='M' if i % 2 else 'F',
+                course='RUN_5K',
+                shirt_size='M',
+                athlete_declaration=True,
+                payment_status='PAID',
+                registration_number=f'{i:05d}'[-5:] if i < 100000 else None,
+            )
+            for i in range(start, min(start + SEED_BATCH_SIZE, rows))
+        ])
+
+
+def measure(client, url):
+    """Consome a resposta e retorna (bytes, segundos, pico tracemalloc MB, pico RSS MB)"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(url)
+    size = sum(len(chunk) for chunk in response.streaming_content)
+    elapsed = time.perf_counter() - started
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, traced_peak / (1024 * 1024), peak_rss_mb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de memória da listagem de inscrições pagas')
+    parser.add_argument('--rows', type=int, default=50000, help='Inscrições pagas no banco de teste')
+    parser.add_argument('--page', type=int, default=1000, help='Tamanho da página no modo paginado')
+    args = parser.parse_args()
+
+    with test_database():
+        print(f"Criando {args.rows} inscrições pagas...")
+        seed(args.rows)
+        client = Client()
+        # aquece imports/URLconf para não contar na medição
+        b''.join(client.get('/api/admin/paid-registrations/?limit=1').streaming_content)
+
+        rss_before = peak_rss_mb()
+        print(f"Pico de RSS antes das requisições: {rss_before:.1f}MB\n")
+
+        size, elapsed, traced, rss = measure(client, '/api/admin/paid-registrations/')
+        print(
+            f"{'listagem completa':<24} {size / 1024 / 1024:7.1f}MB em {elapsed:6.2f}s "
+            f"pico tracemalloc={traced:6.1f}MB pico RSS={rss:6.1f}MB (+{rss - rss_before:.1f}MB)"
+        )
+
+        size, elapsed, traced, rss = measure(client, f'/api/admin/paid-registrations/?limit={args.page}')
+        print(
+            f"{f'página de {args.page}':<24} {size / 1024 / 1024:7.1f}MB em {elapsed:6.2f}s "
+            f"pico tracemalloc={traced:6.1f}MB pico RSS={rss:6.1f}MB"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark do custo do RateLimitMiddleware por requisição
+
+Passa N requisições a uma rota limitada pelo middleware (sem executar a
+view) com IPs variados e mede o tempo gasto no middleware. Com
+--backend redis usa o Redis de REDIS_URL (uma chamada EVALSHA por
+requisição, incluindo a ida e volta na rede); com --backend locmem, o balde
+no cache do processo. Falha (código de saída 1) se o p99 passar de
+--budget-ms.
+
+Uso:
+    python benchmarks/bench_rate_limit.py --backend locmem
+    REDIS_URL=redis://127.0.0.1:6379/1 python benchmarks/bench_rate_limit.py --backend redis --requests 20000
+"""
+import argparse
+import sys
+import time
+
+from _common import percentile, print_latency_row, setup_django
+
+setup_django()
+
+from django.core.cache import cache  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from api.middleware import RateLimitMiddleware  # noqa: E402
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+WARMUP = 200
+
+
+def run(requests, clients):
+    factory = RequestFactory()
+    middleware = RateLimitMiddleware(lambda request: HttpResponse())
+    samples = []
+    for i in range(WARMUP + requests):
+        client = i % clients
+        request = factory.get(
+            '/api/race-statistics/',
+            HTTP_X_FORWARDED_FOR=f'10.{client >> 16 & 255}.{client >> 8 & 255}.{client & 255}',
+        )
+        started = time.perf_counter()
+        response = middleware(request)
+        elapsed = (time.perf_counter() - started) * 1000
+        assert response.status_code == 200, response.status_code
+        if i >= WARMUP:
+            samples.append(elapsed)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('redis', 'locmem'), default='redis')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--clients', type=int, default=1000, help='IPs distintos')
+    parser.add_argument('--budget-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    caches = settings.CACHES if args.backend == 'redis' else LOCMEM_CACHE
+    # Limite alto o bastante para nenhuma requisição ser barrada
+    with override_settings(
+        CACHES=caches,
+        RATE_LIMIT_ENABLED=True,
+        RATE_LIMIT_PROXY_COUNT=1,
+        RATE_LIMITS={**settings.RATE_LIMITS, 'statistics': '1000000/s'},
+    ):
+        cache.clear()
+        samples = run(args.requests, args.clients)
+        cache.clear()
+
+    print(f"{args.requests} requisições, {args.clients} IPs, backend {args.backend}")
+    print_latency_row('  middleware', samples)
+    p99 = percentile(samples, 99)
+    if p99 > args.budget_ms:
+        print(f"p99 {p99:.3f}ms acima do orçamento de {args.budget_ms:.3f}ms")
+        sys.exit(1)
+    print(f"p99 dentro do orçamento de {args.budget_ms:.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
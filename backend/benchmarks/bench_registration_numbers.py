@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark do alocador de números de inscrição
+
+Mede a latência de allocate_registration_number() com o pool em 10%, 50% e
+90% de uso. Com o pool pré-embaralhado a latência deve ser constante,
+independente de quantos números já foram distribuídos.
+
+Uso:
+    python benchmarks/bench_registration_numbers.py
+    python benchmarks/bench_registration_numbers.py --samples 2000
+"""
+import argparse
+
+from _common import setup_django, test_database, timed, print_latency_row
+
+setup_django()
+
+from api.models import RaceRegistration, RegistrationNumberPool  # noqa: E402
+from api.registration_numbers import (  # noqa: E402
+    NUMBER_MIN,
+    NUMBER_MAX,
+    allocate_registration_number,
+    fill_registration_number_pool,
+)
+
+POOL_SIZE = NUMBER_MAX - NUMBER_MIN + 1
+
+
+def consume_until(usage_pct):
+    """Remove números do início do pool até atingir o uso desejado"""
+    target_remaining = POOL_SIZE - int(POOL_SIZE * usage_pct / 100)
+    remaining = RegistrationNumberPool.objects.count()
+    to_remove = remaining - target_remaining
+    if to_remove <= 0:
+        return
+    cutoff = (
+        RegistrationNumberPool.objects.order_by('id')
+        .values_list('id', flat=True)[to_remove - 1]
+    )
+    RegistrationNumberPool.objects.filter(id__lte=cutoff).delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do pool de números de inscrição')
+    parser.add_argument('--samples', type=int, default=1000, help='Alocações medidas por nível de uso')
+    args = parser.parse_args()
+
+    with test_database():
+        print(f"Preenchendo pool com {POOL_SIZE} números...")
+        _, fill_ms = timed(fill_registration_number_pool, RegistrationNumberPool, RaceRegistration)
+        print(f"Pool preenchido em {fill_ms:.0f}ms\n")
+
+        for usage in (10, 50, 90):
+            consume_until(usage)
+            samples = []
+            for _ in range(args.samples):
+                _, elapsed = timed(allocate_registration_number)
+                samples.append(elapsed)
+            print_latency_row(f"uso {usage}%", samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark do POST de inscrição: sessão de pagamento síncrona x em background
+
+Faz N inscrições pelo endpoint /api/race-registrations/ com um Stripe falso
+de latência configurável, nos dois modos de PAYMENT_SESSION_ASYNC. Mede a
+latência do POST e, no modo assíncrono, o tempo até o checkout_url ficar
+disponível em /api/payment/session-status/<token>/.
+
+Uso:
+    python benchmarks/bench_registration_payment_mode.py
+    python benchmarks/bench_registration_payment_mode.py --registrations 200 --stripe-latency-ms 500
+"""
+import argparse
+import itertools
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from _common import make_cpf, print_latency_row, setup_django, test_database
+
+setup_django()
+
+from django.core.cache import cache  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class FakeStripeCheckout:
+    """stripe.checkout.Session.create com latência fixa"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self._ids = itertools.count(1)
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        session_id = f'cs_bench_{next(self._ids)}'
+        return SimpleNamespace(
+            id=session_id,
+            url=f'https://checkout.stripe.com/c/pay/{session_id}',
+            expires_at=int(time.time()) + 24 * 3600,
+        )
+
+
+def register(client, i):
+    response = client.post('/api/race-registrations/', data={
+        'full_name': f'Atleta {i:05d}',
+        'cpf': make_cpf(100000000 + i),
+        'email': f'atleta{i}@email.com',
+        'phone': '86999999999',
+        'birth_date': '1990-01-01',
+        'gender': 'M',
+        'course': 'RUN_5K',
+        'shirt_size': 'M',
+        'athlete_declaration': True,
+    }, content_type='application/json')
+    assert response.status_code == 201, response.content
+    return response.json()['payment']
+
+
+def wait_ready(client, token, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        job = client.get(f'/api/payment/session-status/{token}/').json()
+        if job['status'] != 'pending':
+            assert job['status'] == 'ready', job
+            return
+        time.sleep(0.005)
+    raise TimeoutError(token)
+
+
+def run(start, count, asynchronous, stripe_latency):
+    client = Client()
+    post_ms, ready_ms = [], []
+    with override_settings(PAYMENT_SESSION_ASYNC=asynchronous), \
+            patch('api.services.stripe.checkout.Session.create', FakeStripeCheckout(stripe_latency).create), \
+            patch('builtins.print'):
+        for i in range(start, start + count):
+            started = time.perf_counter()
+            payment = register(client, i)
+            post_ms.append((time.perf_counter() - started) * 1000)
+            if asynchronous:
+                wait_ready(client, payment['token'])
+            else:
+                assert payment.get('checkout_url'), payment
+            ready_ms.append((time.perf_counter() - started) * 1000)
+    return post_ms, ready_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registrations', type=int, default=50)
+    parser.add_argument('--stripe-latency-ms', type=float, default=300.0)
+    args = parser.parse_args()
+
+    # Todas as inscrições saem do mesmo IP: sem rate limiting
+    with test_database(), override_settings(CACHES=LOCMEM_CACHE, RATE_LIMIT_ENABLED=False):
+        cache.clear()
+        print(f"{args.registrations} inscrições por modo, latência Stripe simulada {args.stripe_latency_ms:.0f}ms")
+        for offset, (label, asynchronous) in enumerate((('síncrono', False), ('assíncrono', True))):
+            post_ms, ready_ms = run(offset * args.registrations, args.registrations, asynchronous, args.stripe_latency_ms / 1000)
+            print(label)
+            print_latency_row('  POST inscrição', post_ms)
+            print_latency_row('  até checkout_url', ready_ms)
+
+
+if __name__ == '__main__':
+    main()
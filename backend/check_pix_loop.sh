@@ -1,13 +1,18 @@
 #!/bin/sh
-# Loop que verifica pagamentos PIX pendentes a cada 2 minutos.
-# Roda como serviço separado no docker-compose.
+# Reconciliação periódica de pagamentos PIX pendentes.
+# A confirmação normal chega pelo webhook do AbacatePay (/api/payment/pix/webhook/);
+# este loop só cobre webhooks perdidos. Roda como serviço separado no docker-compose.
+# O loop roda dentro do próprio comando (--interval): o Django e a conexão com o
+# banco são reaproveitados entre as passadas em vez de recriados a cada uma.
 
-echo "[check_pix] Iniciando verificação periódica de pagamentos PIX (a cada 120s)..."
+# Intervalo curto para seguir o agendamento de api/pix_schedule.py (1ª verificação
+# em 30s, depois a cada minuto enquanto o QR Code vale): cada passada só consulta
+# os PIX com next_check_at vencido, então as passadas sem nada vencido são baratas.
+INTERVAL="${PIX_CHECK_INTERVAL:-30}"
+
+echo "[check_pix] Iniciando reconciliação periódica de pagamentos PIX (a cada ${INTERVAL}s)..."
 
 # Aguardar o banco estar pronto (migrations rodarem no serviço principal)
 sleep 15
 
-while true; do
-    python manage.py check_pending_pix 2>&1
-    sleep 120
-done
+exec python manage.py check_pending_pix --concurrency 8 --interval "$INTERVAL" 2>&1
@@ -0,0 +1,64 @@
+"""
+Configuração do gunicorn (as opções de linha de comando do Dockerfile continuam valendo)
+
+Métricas do Prometheus com vários workers: cada worker grava suas métricas em
+arquivos em PROMETHEUS_MULTIPROC_DIR e /api/metrics/ soma todos (api/metrics.py).
+O diretório é limpo a cada início do servidor; ao morrer um worker (ex.:
+--max-requests), suas requisições em andamento deixam de ser exportadas.
+
+Workers ASGI (padrão): cada worker é um uvicorn com event loop e serve as
+views assíncronas de api/async_views.py (ASYNC_GATEWAY_VIEWS), que não
+seguram o worker enquanto esperam o Stripe ou o AbacatePay. As demais views
+continuam síncronas e rodam em threads do Django. Com GUNICORN_ASGI=False
+volta ao worker sync com backend.wsgi (compare os dois com
+benchmarks/bench_async_gateway.py).
+
+Pool de conexões com o PostgreSQL (DB_POOL, backend/settings.py): o pool é
+por worker e o tamanho sai das opções finais do gunicorn (inclusive as da
+linha de comando), passado aos workers por DB_POOL_MIN_SIZE/DB_POOL_MAX_SIZE
+se não vierem definidos no ambiente. Worker sync: uma conexão por thread
+(--threads). Worker ASGI: cada requisição roda o ORM na sua própria thread,
+então GUNICORN_DB_CONNECTIONS (total do serviço, padrão 40) é dividido entre
+os workers e requisições além disso esperam uma conexão livre.
+"""
+import os
+import shutil
+
+# Definido antes de os workers importarem o Django (e o prometheus_client)
+PROMETHEUS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+# (nomes do módulo viram opções do gunicorn: nada de `config` aqui)
+ASGI = os.environ.get('GUNICORN_ASGI', 'True').lower() not in ('false', '0', 'no', 'off')
+
+if ASGI:
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    os.environ.setdefault('ASYNC_GATEWAY_VIEWS', 'True')
+else:
+    wsgi_app = 'backend.wsgi:application'
+
+DB_CONNECTIONS = int(os.environ.get('GUNICORN_DB_CONNECTIONS', '40'))
+
+
+def db_pool_size(workers, threads):
+    """(min_size, max_size) do pool de conexões de cada worker"""
+    if ASGI:
+        max_size = max(1, DB_CONNECTIONS // workers)
+        return max(1, max_size // 2), max_size
+    # Worker sync/gthread: todas as threads usam o banco ao mesmo tempo
+    return threads, threads
+
+
+def on_starting(server):
+    shutil.rmtree(PROMETHEUS_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_DIR, exist_ok=True)
+
+    # Os workers leem as configurações do Django depois do fork
+    min_size, max_size = db_pool_size(server.cfg.workers, server.cfg.threads)
+    os.environ.setdefault('DB_POOL_MIN_SIZE', str(min_size))
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(max_size))
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid, PROMETHEUS_DIR)
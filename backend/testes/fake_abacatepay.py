@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Servidor AbacatePay falso para testes offline
+
+Implementa os endpoints de PIX usados pelo backend (create, check e
+simulate-payment) e, quando um pagamento é simulado, dispara o webhook
+billing.paid assinado como o AbacatePay faz (segredo na query string e
+HMAC-SHA256 em base64 no header X-Webhook-Signature).
+
+Sem webhook_url os eventos ficam em `webhooks` para o teste entregar
+(ex.: com o Client do Django).
+
+Uso standalone:
+    python testes/fake_abacatepay.py --port 8085 \\
+        --webhook-url http://localhost:8000/api/payment/pix/webhook/ \\
+        --webhook-secret segredo --hmac-key chave
+    # e no backend: ABACATEPAY_BASE_URL=http://localhost:8085/v1
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+def sign(body: bytes, hmac_key: str) -> str:
+    """Assinatura do header X-Webhook-Signature"""
+    return base64.b64encode(hmac.new(hmac_key.encode(), body, hashlib.sha256).digest()).decode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        fake.requests.append((method, url.path))
+
+        if method == 'POST' and url.path == '/v1/pixQrCode/create':
+            return self._reply(200, {'data': fake.create_pix(self._read_json()), 'error': None})
+
+        pix = fake.pix_codes.get(query.get('id'))
+        if url.path in ('/v1/pixQrCode/check', '/v1/pixQrCode/simulate-payment') and pix is None:
+            return self._reply(404, {'data': None, 'error': 'PIX não encontrado'})
+        if method == 'GET' and url.path == '/v1/pixQrCode/check':
+            return self._reply(200, {'data': {'status': pix['status'], 'expiresAt': pix['expiresAt']}, 'error': None})
+        if method == 'POST' and url.path == '/v1/pixQrCode/simulate-payment':
+            self._read_json()
+            return self._reply(200, {'data': fake.pay(pix['id']), 'error': None})
+
+        return self._reply(404, {'data': None, 'error': 'Rota não encontrada'})
+
+    def do_GET(self):
+        with self.server.fake.tracking():
+            self._route('GET')
+
+    def do_POST(self):
+        with self.server.fake.tracking():
+            self._route('POST')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # testes de carga abrem dezenas de conexões de uma vez
+
+
+class FakeAbacatePay:
+    """
+    Uso: with FakeAbacatePay(webhook_secret='s', hmac_key='k') as fake: ...
+    fake.base_url aponta para a API (/v1); fake.webhooks guarda os eventos não entregues.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, webhook_url=None, webhook_secret='', hmac_key='', latency=0.0):
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.hmac_key = hmac_key
+        self.latency = latency
+        self.pix_codes = {}
+        self.webhooks = []
+        self.requests = []
+        # Requisições sendo atendidas agora e o máximo simultâneo (benchmarks)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+
+    @contextmanager
+    def tracking(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def create_pix(self, payload):
+        pix_id = f'pix_char_{uuid.uuid4().hex[:24]}'
+        expires_in = int(payload.get('expiresIn') or 3600)
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+        pix = {
+            'id': pix_id,
+            'amount': payload.get('amount'),
+            'status': 'PENDING',
+            'devMode': True,
+            'brCode': f'00020101021226950014br.gov.bcb.pix{pix_id}',
+            'brCodeBase64': 'data:image/png;base64,iVBORw0KGgo=',
+            'expiresAt': expires_at.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'metadata': payload.get('metadata') or {},
+        }
+        self.pix_codes[pix_id] = pix
+        return pix
+
+    def pay(self, pix_id):
+        """Marca o PIX como pago e dispara o webhook billing.paid"""
+        pix = self.pix_codes[pix_id]
+        pix['status'] = 'PAID'
+        self.fire('billing.paid', {
+            'pixQrCode': dict(pix),
+            'payment': {'amount': pix['amount'], 'fee': 80, 'method': 'PIX'},
+        })
+        return pix
+
+    def fire(self, event_type, data, event_id=None):
+        """Monta, assina e entrega (ou guarda) um evento de webhook"""
+        event = {
+            'id': event_id or f'log_{uuid.uuid4().hex[:24]}',
+            'event': event_type,
+            'devMode': True,
+            'data': data,
+        }
+        body = json.dumps(event).encode()
+        headers = {'Content-Type': 'application/json'}
+        if self.hmac_key:
+            headers['X-Webhook-Signature'] = sign(body, self.hmac_key)
+        query = urlencode({'webhookSecret': self.webhook_secret}) if self.webhook_secret else ''
+        webhook = {'event': event, 'body': body, 'headers': headers, 'query': query}
+
+        if self.webhook_url:
+            threading.Thread(target=self._deliver, args=(webhook,), daemon=True).start()
+        else:
+            self.webhooks.append(webhook)
+        return webhook
+
+    def _deliver(self, webhook):
+        import requests
+
+        url = self.webhook_url + (f'?{webhook["query"]}' if webhook['query'] else '')
+        try:
+            requests.post(url, data=webhook['body'], headers=webhook['headers'], timeout=10)
+        except requests.RequestException as e:
+            print(f'Falha ao entregar webhook {webhook["event"]["id"]}: {e}')
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--webhook-url')
+    parser.add_argument('--webhook-secret', default='')
+    parser.add_argument('--hmac-key', default='')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    with FakeAbacatePay(args.host, args.port, args.webhook_url, args.webhook_secret, args.hmac_key, args.latency_ms / 1000) as fake:
+        print(f'AbacatePay falso em {fake.base_url} (Ctrl+C para sair)')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
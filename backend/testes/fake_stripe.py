@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Servidor Stripe falso para testes offline
+
+Implementa as chamadas de Checkout usadas pelo backend
+(stripe.checkout.Session.create e retrieve) e, quando um pagamento é
+simulado, dispara o webhook checkout.session.completed assinado como o
+Stripe faz (header Stripe-Signature: t=<timestamp>,v1=<HMAC-SHA256>).
+
+Sem webhook_url os eventos ficam em `webhooks` para o teste entregar
+(ex.: com o Client do Django).
+
+Uso standalone:
+    python testes/fake_stripe.py --port 8086 \\
+        --webhook-url http://localhost:8000/api/payment/stripe-webhook/ --webhook-secret whsec_teste
+    # e no backend: STRIPE_API_BASE=http://localhost:8086 STRIPE_WEBHOOK_SECRET=whsec_teste
+    # simular o pagamento: curl -X POST http://localhost:8086/v1/checkout/sessions/<id>/pay
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+SESSIONS_PATH = '/v1/checkout/sessions'
+
+
+def sign(body: bytes, secret: str, timestamp=None) -> str:
+    """Valor do header Stripe-Signature"""
+    timestamp = int(timestamp or time.time())
+    signed = f'{timestamp}.'.encode() + body
+    return f't={timestamp},v1={hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()}'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return dict(parse_qsl(self.rfile.read(length).decode()))
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self, message):
+        return self._reply(404, {'error': {
+            'type': 'invalid_request_error', 'code': 'resource_missing', 'message': message,
+        }})
+
+    def _route(self, method):
+        path = urlparse(self.path).path.rstrip('/')
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        fake.requests.append((method, path))
+
+        if method == 'POST' and path == SESSIONS_PATH:
+            return self._reply(200, fake.create_session(self._read_form()))
+
+        if not path.startswith(f'{SESSIONS_PATH}/'):
+            return self._not_found('Rota não encontrada')
+        session_id, _, action = path[len(SESSIONS_PATH) + 1:].partition('/')
+        session = fake.sessions.get(session_id)
+        if session is None:
+            return self._not_found(f"No such checkout.session: '{session_id}'")
+        if method == 'GET' and not action:
+            return self._reply(200, session)
+        if method == 'POST' and action == 'pay':
+            self._read_form()
+            return self._reply(200, fake.pay(session_id))
+        return self._not_found('Rota não encontrada')
+
+    def do_GET(self):
+        with self.server.fake.tracking():
+            self._route('GET')
+
+    def do_POST(self):
+        with self.server.fake.tracking():
+            self._route('POST')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # testes de carga abrem dezenas de conexões de uma vez
+
+
+class FakeStripe:
+    """
+    Uso: with FakeStripe(webhook_secret='whsec_teste') as fake: ...
+    fake.api_base vai em stripe.api_base; fake.webhooks guarda os eventos não entregues.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, webhook_url=None, webhook_secret='', latency=0.0):
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.latency = latency
+        self.sessions = {}
+        self.webhooks = []
+        self.requests = []
+        # Requisições sendo atendidas agora e o máximo simultâneo (benchmarks)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+
+    @contextmanager
+    def tracking(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    @property
+    def api_base(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def create_session(self, form):
+        """Sessão aberta a partir dos parâmetros (form-encoded) do stripe.checkout.Session.create"""
+        session_id = f'cs_test_{uuid.uuid4().hex}'
+        amount = int(form.get('line_items[0][price_data][unit_amount]') or 0)
+        quantity = int(form.get('line_items[0][quantity]') or 1)
+        session = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'url': f'https://checkout.stripe.com/c/pay/{session_id}',
+            'status': 'open',
+            'payment_status': 'unpaid',
+            'mode': form.get('mode', 'payment'),
+            'amount_total': amount * quantity,
+            'currency': 'brl',
+            'customer_email': form.get('customer_email'),
+            'payment_intent': None,
+            'expires_at': int(time.time()) + 24 * 3600,
+            'metadata': {
+                key[len('metadata['):-1]: value
+                for key, value in form.items() if key.startswith('metadata[')
+            },
+        }
+        self.sessions[session_id] = session
+        return session
+
+    def pay(self, session_id):
+        """Marca a sessão como paga e dispara o webhook checkout.session.completed"""
+        session = self.sessions[session_id]
+        session.update(
+            status='complete',
+            payment_status='paid',
+            payment_intent=f'pi_test_{uuid.uuid4().hex[:24]}',
+        )
+        self.fire('checkout.session.completed', dict(session))
+        return session
+
+    def fire(self, event_type, data_object, event_id=None):
+        """Monta, assina e entrega (ou guarda) um evento de webhook"""
+        event = {
+            'id': event_id or f'evt_test_{uuid.uuid4().hex[:24]}',
+            'object': 'event',
+            'type': event_type,
+            'created': int(time.time()),
+            'livemode': False,
+            'data': {'object': data_object},
+        }
+        body = json.dumps(event).encode()
+        headers = {'Content-Type': 'application/json'}
+        if self.webhook_secret:
+            headers['Stripe-Signature'] = sign(body, self.webhook_secret)
+        webhook = {'event': event, 'body': body, 'headers': headers}
+
+        if self.webhook_url:
+            threading.Thread(target=self._deliver, args=(webhook,), daemon=True).start()
+        else:
+            self.webhooks.append(webhook)
+        return webhook
+
+    def _deliver(self, webhook):
+        import requests
+
+        try:
+            requests.post(self.webhook_url, data=webhook['body'], headers=webhook['headers'], timeout=10)
+        except requests.RequestException as e:
+            print(f'Falha ao entregar webhook {webhook["event"]["id"]}: {e}')
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8086)
+    parser.add_argument('--webhook-url')
+    parser.add_argument('--webhook-secret', default='')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    with FakeStripe(args.host, args.port, args.webhook_url, args.webhook_secret, args.latency_ms / 1000) as fake:
+        print(f'Stripe falso em {fake.api_base} (Ctrl+C para sair)')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
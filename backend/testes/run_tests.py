@@ -58,7 +58,9 @@ class TestRunner:
             'test_models',
             'test_services', 
             'test_api',
+            'test_indexes',
             'test_rate_limiting',
+            'test_performance',
             'test_integration'
         ]
         
@@ -142,6 +144,24 @@ class TestRunner:
         """Executa testes de performance"""
         self.print_section("Executando testes de performance")
         
+        # Orçamento de consultas e de tempo por endpoint (não precisa do servidor)
+        try:
+            result = self.run_django_tests('test_performance', verbosity=1)
+            self.results['test_performance'] = {
+                'status': 'PASSED' if result == 0 else 'FAILED',
+                'exit_code': result
+            }
+            if result == 0:
+                print("✅ Orçamento de consultas e tempo: OK")
+            else:
+                print("❌ Orçamento de consultas e tempo: ESTOURADO")
+        except Exception as e:
+            print(f"❌ test_performance: ERRO - {e}")
+            self.results['test_performance'] = {
+                'status': 'ERROR',
+                'error': str(e)
+            }
+        
         try:
             # Teste de carga simples
             import requests
@@ -1,17 +1,63 @@
 """
 Testes de API endpoints
 """
+import hashlib
+import hmac
 import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import pytest
-from django.test import TestCase, Client
+from io import StringIO
+from types import SimpleNamespace
+from django.test import TestCase, Client, AsyncRequestFactory
 from django.urls import reverse
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
 from django.utils import timezone
 from decimal import Decimal
-from datetime import date
+from datetime import date, timedelta
+from unittest import skipUnless
 from unittest.mock import patch, MagicMock
+from django.test import override_settings
+from django.conf import settings
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import HttpResponse
+from prometheus_client import REGISTRY
 
-from api.models import RaceRegistration
+from api import async_views, statistics
+from api.middleware import MetricsMiddleware
+from api.models import RaceRegistration, Broadcast, BroadcastRecipient, EmailOutbox, AbacatePayWebhookEvent, StripeEvent
+from api.broadcasts import claim_next_broadcast, run_broadcast
+from api.broadcast_progress import ProgressReporter, read_progress, write_progress
+from api.paid_cpfs import (
+    ADDED_DURING_BUILD_KEY,
+    BUILDING_KEY,
+    PAID_CPFS_KEY,
+    READY_KEY,
+    REMOVED_DURING_BUILD_KEY,
+    add_paid_cpf,
+    discard_paid_cpf,
+    is_cpf_paid,
+    paid_cpfs_from_db,
+    rebuild_paid_cpf_set,
+)
+from api.redis_utils import cache_key
+from api.services import process_stripe_webhook_event, send_payment_confirmation_email
+from api.stripe_events import process_stripe_event_batch
+from api.stripe_sessions import session_cache_stats
+from api.tracing import end_trace, percentile, span, start_trace
+from testes.fake_abacatepay import FakeAbacatePay
+from testes.fake_stripe import FakeStripe
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
 
 
 class APITestCase(TestCase):
@@ -177,6 +223,11 @@ class RaceRegistrationAPITest(APITestCase):
 class RaceStatisticsAPITest(APITestCase):
     """Testes para endpoint de estatísticas"""
     
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        cache.clear()
+    
     def test_race_statistics_empty(self):
         """Testa estatísticas com banco vazio"""
         response = self.client.get('/api/race-statistics/')
@@ -267,6 +318,608 @@ class RaceStatisticsAPITest(APITestCase):
         for size in sizes:
             self.assertEqual(data['shirt_size_stats'][size], 1)
 
+    def test_race_statistics_courses_and_infant_sizes(self):
+        """Testa breakdown por percurso e tamanhos infantis"""
+        data = self.valid_registration_data.copy()
+        data.update(email='kid@email.com', modality='INFANTIL', course='KIDS', shirt_size='8')
+        RaceRegistration.objects.create(**data)
+        RaceRegistration.objects.create(**self.valid_registration_data)
+
+        response = self.client.get('/api/race-statistics/')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertEqual(data['course_stats']['kids'], 1)
+        self.assertEqual(data['course_stats']['run_5k'], 1)
+        self.assertEqual(data['course_stats']['walk_3k'], 0)
+        self.assertEqual(data['infant_shirt_size_stats']['8 anos'], 1)
+        self.assertEqual(data['shirt_size_stats']['M'], 1)
+
+    def test_race_statistics_query_budget(self):
+        """Testa que as estatísticas usam uma única consulta, qualquer que seja o número de opções"""
+        for i, size in enumerate(['PP', 'M', 'XXG']):
+            data = self.valid_registration_data.copy()
+            data['email'] = f'test{i}@email.com'
+            data['shirt_size'] = size
+            RaceRegistration.objects.create(**data)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/race-statistics/')
+        self.assertEqual(response.status_code, 200)
+
+        cache.clear()
+        extra_sizes = RaceRegistration.SHIRT_SIZE_CHOICES + [(f'X{i}', f'X{i}') for i in range(20)]
+        with patch.object(RaceRegistration, 'SHIRT_SIZE_CHOICES', extra_sizes):
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/race-statistics/')
+        self.assertEqual(response.json()['shirt_size_stats']['X19'], 0)
+
+    def test_race_statistics_served_from_counters(self):
+        """Testa que, com contadores inicializados, as estatísticas não consultam o banco"""
+        self.client.get('/api/race-statistics/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registration = RaceRegistration.objects.create(**self.valid_registration_data)
+        with self.captureOnCommitCallbacks(execute=True):
+            registration.payment_status = 'PAID'
+            registration.shirt_size = 'G'
+            registration.save()
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/race-statistics/')
+        data = response.json()
+
+        self.assertEqual(data['total_inscriptions'], 1)
+        self.assertEqual(data['inscriptions_today'], 1)
+        self.assertEqual(data['payment_stats'], {'pending': 0, 'paid': 1})
+        self.assertEqual(data['shirt_size_stats']['M'], 0)
+        self.assertEqual(data['shirt_size_stats']['G'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registration.delete()
+
+        data = self.client.get('/api/race-statistics/').json()
+        self.assertEqual(data['total_inscriptions'], 0)
+        self.assertEqual(data['payment_stats']['paid'], 0)
+        self.assertEqual(data['course_stats']['run_5k'], 0)
+
+
+class RebuildStatsCountersCommandTest(APITestCase):
+    """Testes para o comando rebuild_stats_counters"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        cache.clear()
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        """Testa que o comando informa e corrige contadores divergentes"""
+        self.client.get('/api/race-statistics/')
+        # bulk_create não dispara signals: contadores ficam divergentes
+        RaceRegistration.objects.bulk_create([RaceRegistration(**self.valid_registration_data)])
+
+        out = StringIO()
+        call_command('rebuild_stats_counters', stdout=out)
+
+        self.assertIn('total: contador=0 banco=1', out.getvalue())
+        self.assertEqual(self.client.get('/api/race-statistics/').json()['total_inscriptions'], 1)
+
+        out = StringIO()
+        call_command('rebuild_stats_counters', '--dry-run', stdout=out)
+        self.assertIn('Nenhuma divergência', out.getvalue())
+
+
+@skipUnless(fakeredis, 'fakeredis não instalado')
+class StatsCounterSeedTest(APITestCase):
+    """Testes para a inicialização dos contadores de estatísticas no Redis"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch('api.statistics.get_redis_connection_or_none', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        RaceRegistration.objects.create(**self.valid_registration_data)
+
+    def counter(self, name):
+        value = self.redis.get(cache_key(f'stats:{name}'))
+        return None if value is None else int(value)
+
+    def test_deltas_during_seed_are_kept(self):
+        """Testa que deltas de commits durante a agregação entram nos contadores"""
+        aggregate = statistics.aggregate_race_counts
+
+        def aggregate_then_commit():
+            counts = aggregate()
+            # Inscrição confirmada enquanto a agregação rodava
+            statistics.apply_counter_deltas({'stats:total': 1, 'stats:gender_F': 1})
+            return counts
+
+        with patch('api.statistics.aggregate_race_counts', side_effect=aggregate_then_commit):
+            counts = statistics.seed_race_counts()
+
+        self.assertEqual(counts['total'], 1)
+        self.assertEqual(self.counter('total'), 2)
+        self.assertEqual(self.counter('gender_F'), 1)
+        self.assertEqual(self.counter('gender_M'), 1)
+        self.assertGreater(self.redis.ttl(cache_key(statistics.READY_KEY)), 0)
+        self.assertFalse(self.redis.exists(cache_key(statistics.SEEDING_KEY), cache_key(statistics.PENDING_KEY)))
+
+        statistics.apply_counter_deltas({'stats:total': 1})
+        self.assertEqual(self.counter('total'), 3)
+
+    def test_concurrent_seed_answers_from_database(self):
+        """Testa que só um processo inicializa e os demais não gravam contadores"""
+        self.redis.set(cache_key(statistics.SEEDING_KEY), 1)
+
+        self.assertIsNone(statistics.seed_race_counts())
+        self.assertIsNone(self.counter('total'))
+
+        statistics.apply_counter_deltas({'stats:total': 1})
+        self.assertEqual(self.redis.hgetall(cache_key(statistics.PENDING_KEY)), {cache_key('stats:total').encode(): b'1'})
+
+    def test_seed_error_releases_lock(self):
+        """Testa que erro na agregação libera a trava da inicialização"""
+        with patch('api.statistics.aggregate_race_counts', side_effect=Exception('timeout')):
+            with self.assertRaises(Exception):
+                statistics.seed_race_counts()
+        self.assertFalse(self.redis.exists(cache_key(statistics.SEEDING_KEY)))
+
+
+@skipUnless(fakeredis, 'fakeredis não instalado')
+class PaidCpfSetTest(APITestCase):
+    """Testes para o conjunto de CPFs pagos no Redis (validate_cpf)"""
+
+    CPF = '52998224725'
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch('api.paid_cpfs.get_redis_connection_or_none', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored(self):
+        return {cpf.decode() for cpf in self.redis.smembers(cache_key(PAID_CPFS_KEY))}
+
+    def create_registration(self, payment_status='PAID'):
+        data = {**self.valid_registration_data, 'cpf': self.CPF, 'birth_date': date(1990, 1, 1)}
+        with self.captureOnCommitCallbacks(execute=True):
+            return RaceRegistration.objects.create(payment_status=payment_status, **data)
+
+    def test_database_answers_until_set_is_built(self):
+        """Testa que sem o conjunto montado o banco responde, sem montar na requisição"""
+        self.create_registration()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(is_cpf_paid(self.CPF))
+        with self.assertNumQueries(1):
+            self.assertFalse(is_cpf_paid('11144477735'))
+        self.assertFalse(self.redis.exists(cache_key(READY_KEY)))
+
+        call_command('rebuild_paid_cpfs', stdout=StringIO())
+        with self.assertNumQueries(0):
+            self.assertTrue(is_cpf_paid(self.CPF))
+            self.assertFalse(is_cpf_paid('11144477735'))
+
+    def test_registration_rejected_from_set(self):
+        """Testa que a inscrição é recusada pelo conjunto, sem consultar o banco"""
+        rebuild_paid_cpf_set({self.CPF})
+
+        response = self.client.post(
+            f'{self.base_url}race-registrations/',
+            data={**self.valid_registration_data, 'cpf': self.CPF},
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cpf', response.json())
+
+    def test_status_changes_update_set(self):
+        """Testa inclusão ao pagar e remoção quando não resta inscrição paga"""
+        rebuild_paid_cpf_set()
+        first = self.create_registration()
+        second = self.create_registration()
+        self.assertEqual(self.stored(), {self.CPF})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.payment_status = 'PENDING'
+            first.save(update_fields=['payment_status'])
+        self.assertEqual(self.stored(), {self.CPF})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.stored(), set())
+
+    def test_pending_registration_not_added(self):
+        """Testa que inscrição pendente não entra no conjunto"""
+        rebuild_paid_cpf_set()
+        self.create_registration(payment_status='PENDING')
+        self.assertFalse(is_cpf_paid(self.CPF))
+
+    def test_add_during_rebuild_is_kept(self):
+        """Testa que um CPF pago entre a leitura do banco e a troca do conjunto não se perde"""
+        self.create_registration()
+        late_cpf = '11144477735'
+
+        def read_then_add():
+            cpfs = paid_cpfs_from_db()
+            add_paid_cpf(late_cpf)  # pagamento confirmado durante a remontagem
+            return cpfs
+
+        with patch('api.paid_cpfs.paid_cpfs_from_db', side_effect=read_then_add):
+            rebuild_paid_cpf_set()
+
+        self.assertEqual(self.stored(), {self.CPF, late_cpf})
+        self.assertTrue(is_cpf_paid(late_cpf))
+        self.assertFalse(self.redis.exists(cache_key(BUILDING_KEY), cache_key(ADDED_DURING_BUILD_KEY)))
+
+        # Fora da remontagem a inclusão vai só para o conjunto
+        add_paid_cpf('39053344705')
+        self.assertFalse(self.redis.exists(cache_key(ADDED_DURING_BUILD_KEY)))
+
+    def test_discard_during_rebuild_is_kept(self):
+        """Testa que um CPF que deixou de estar pago durante a remontagem não volta ao conjunto"""
+        registration = self.create_registration()
+        readded_cpf = '11144477735'
+
+        def read_then_discard():
+            cpfs = paid_cpfs_from_db()
+            # Pagamento desfeito depois da leitura do banco
+            registration.payment_status = 'PENDING'
+            with self.captureOnCommitCallbacks(execute=True):
+                registration.save()
+            # Removido e incluído de novo: vale a inclusão
+            discard_paid_cpf(readded_cpf)
+            add_paid_cpf(readded_cpf)
+            return cpfs
+
+        with patch('api.paid_cpfs.paid_cpfs_from_db', side_effect=read_then_discard):
+            rebuild_paid_cpf_set()
+
+        self.assertEqual(self.stored(), {readded_cpf})
+        self.assertFalse(is_cpf_paid(self.CPF))
+        self.assertFalse(self.redis.exists(cache_key(REMOVED_DURING_BUILD_KEY)))
+
+    def test_redis_error_falls_back_to_db(self):
+        """Testa que uma falha do Redis faz a consulta ir ao banco"""
+        self.create_registration()
+        broken = MagicMock()
+        broken.pipeline.return_value.execute.side_effect = ConnectionError('redis fora do ar')
+
+        with patch('api.paid_cpfs.get_redis_connection_or_none', return_value=broken), patch('builtins.print'):
+            self.assertTrue(is_cpf_paid(self.CPF))
+
+    def test_rebuild_command_reports_and_fixes_drift(self):
+        """Testa que rebuild_paid_cpfs informa e corrige a divergência"""
+        self.create_registration()
+        rebuild_paid_cpf_set({'11144477735'})
+
+        out = StringIO()
+        call_command('rebuild_paid_cpfs', stdout=out)
+
+        self.assertIn('1 CPF(s) pago(s) ausente(s), 1 CPF(s) sobrando', out.getvalue())
+        self.assertEqual(self.stored(), {self.CPF})
+
+        out = StringIO()
+        call_command('rebuild_paid_cpfs', '--dry-run', stdout=out)
+        self.assertIn('Nenhuma divergência', out.getvalue())
+
+
+class CheckPendingPixCommandTest(APITestCase):
+    """Testes para o comando check_pending_pix"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        for i in range(6):
+            data = self.valid_registration_data.copy()
+            data.update(full_name=f'Atleta {i}', email=f'pix{i}@email.com')
+            RaceRegistration.objects.create(**data, abacatepay_pix_id=f'pix_{i}', next_check_at=timezone.now())
+
+    @patch('api.management.commands.check_pending_pix.check_abacatepay_payment_status')
+    def test_concurrent_pass_marks_paid_and_reports_latency(self, mock_check):
+        """Testa verificação concorrente com relatório de vazão e p95"""
+        def check(pix_id):
+            if pix_id == 'pix_5':
+                return {'success': False, 'error': 'timeout'}
+            return {'success': True, 'status': 'PAID' if pix_id in ('pix_1', 'pix_3') else 'PENDING'}
+        mock_check.side_effect = check
+
+        out = StringIO()
+        call_command('check_pending_pix', '--concurrency', '4', stdout=out)
+
+        self.assertEqual(mock_check.call_count, 6)
+        paid = set(RaceRegistration.objects.filter(payment_status='PAID').values_list('abacatepay_pix_id', flat=True))
+        self.assertEqual(paid, {'pix_1', 'pix_3'})
+        output = out.getvalue()
+        self.assertIn('2 atualizado(s), 1 erro(s), 6 verificado(s)', output)
+        self.assertIn('verificações/s', output)
+        self.assertIn('latência p95', output)
+
+    @patch('api.management.commands.check_pending_pix.check_abacatepay_payment_status')
+    def test_only_due_pix_are_checked_and_expired_are_parked(self, mock_check):
+        """Testa que só PIX agendados são consultados e expirados são estacionados"""
+        now = timezone.now()
+        RaceRegistration.objects.filter(abacatepay_pix_id__in=['pix_0', 'pix_1']).update(
+            next_check_at=now + timedelta(minutes=5)
+        )
+        RaceRegistration.objects.filter(abacatepay_pix_id='pix_2').update(next_check_at=None)
+        RaceRegistration.objects.filter(abacatepay_pix_id='pix_3').update(pix_expires_at=now - timedelta(hours=1))
+        mock_check.side_effect = lambda pix_id: {
+            'success': True, 'status': 'EXPIRED' if pix_id == 'pix_4' else 'PENDING'
+        }
+
+        out = StringIO()
+        call_command('check_pending_pix', stdout=out)
+
+        checked = sorted(call.args[0] for call in mock_check.call_args_list)
+        self.assertEqual(checked, ['pix_3', 'pix_4', 'pix_5'])
+        self.assertIn('2 estacionado(s)', out.getvalue())
+
+        rows = {r.abacatepay_pix_id: r for r in RaceRegistration.objects.all()}
+        self.assertIsNone(rows['pix_3'].next_check_at)
+        self.assertIsNone(rows['pix_4'].next_check_at)
+        self.assertGreater(rows['pix_5'].next_check_at, now)
+        self.assertEqual(rows['pix_5'].check_attempts, 1)
+
+        # Nada vencido na passada seguinte
+        mock_check.reset_mock()
+        call_command('check_pending_pix', stdout=StringIO())
+        mock_check.assert_not_called()
+
+    # Fechar a conexão dentro da transação do TestCase quebraria os testes seguintes
+    @patch('api.management.commands.check_pending_pix.close_old_connections')
+    @patch('api.management.commands.check_pending_pix.time.sleep')
+    @patch('api.management.commands.check_pending_pix.check_abacatepay_payment_status')
+    def test_interval_repeats_passes_in_the_same_process(self, mock_check, mock_sleep, mock_close):
+        """Testa --interval: várias passadas sem reiniciar o comando, resistindo a erros"""
+        mock_check.return_value = {'success': True, 'status': 'PENDING'}
+        mock_sleep.side_effect = [None, None, KeyboardInterrupt]
+
+        bulk_update = RaceRegistration.objects.bulk_update
+        failures = [Exception('banco indisponível')]
+
+        def flaky_bulk_update(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return bulk_update(*args, **kwargs)
+
+        out = StringIO()
+        with patch.object(RaceRegistration.objects, 'bulk_update', side_effect=flaky_bulk_update):
+            call_command('check_pending_pix', '--interval', '600', stdout=out)
+
+        mock_sleep.assert_called_with(600.0)
+        # Conexão com o banco liberada antes e depois de cada passada
+        self.assertEqual(mock_close.call_count, 6)
+        output = out.getvalue()
+        # 1ª passada falha ao gravar, a 2ª verifica de novo e agenda, a 3ª não tem nada vencido
+        self.assertIn('Erro na verificação: banco indisponível', output)
+        self.assertEqual(mock_check.call_count, 12)
+        self.assertIn('Nenhum pagamento PIX pendente para verificar.', output)
+
+
+class PaidRegistrationsAPITest(APITestCase):
+    """Testes para listagem de inscrições pagas"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        names = ['Carlos, Filho', 'Ana', 'Bruno', 'Ana']
+        for i, name in enumerate(names):
+            data = self.valid_registration_data.copy()
+            data.update(full_name=name, email=f'paid{i}@email.com')
+            RaceRegistration.objects.create(**data, registration_number=str(10000 + i))
+        RaceRegistration.objects.create(**self.valid_registration_data)
+
+    def get_json(self, params=''):
+        response = self.client.get(f'/api/admin/paid-registrations/{params}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_list_all_paid_registrations(self):
+        """Testa listagem completa ordenada por nome"""
+        data = self.get_json()
+
+        self.assertTrue(data['success'])
+        self.assertEqual(data['count'], 4)
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(
+            [r['full_name'] for r in data['registrations']],
+            ['Ana', 'Ana', 'Bruno', 'Carlos, Filho']
+        )
+        self.assertEqual(data['registrations'][0]['course_display'], 'Corrida 5KM')
+        self.assertEqual(data['registrations'][0]['gender_display'], 'Masculino')
+
+    def test_keyset_pagination(self):
+        """Testa paginação por cursor (full_name,id)"""
+        seen = []
+        cursor = None
+        while True:
+            params = '?limit=2' + (f'&after={cursor}' if cursor else '')
+            data = self.get_json(params)
+            seen.extend(r['id'] for r in data['registrations'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [r['id'] for r in self.get_json()['registrations']])
+
+    async def test_streams_async_under_asgi(self):
+        """Testa que sob ASGI o streaming usa um iterador assíncrono (sem juntar o corpo em memória)"""
+        response = await self.async_client.get('/api/admin/paid-registrations/?limit=3')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        data = json.loads(b''.join([part async for part in response.streaming_content]))
+        self.assertEqual([r['full_name'] for r in data['registrations']], ['Ana', 'Ana', 'Bruno'])
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_invalid_cursor(self):
+        """Testa cursor inválido"""
+        response = self.client.get('/api/admin/paid-registrations/?after=Ana')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/admin/paid-registrations/?limit=0')
+        self.assertEqual(response.status_code, 400)
+
+
+class BroadcastAPITest(APITestCase):
+    """Testes para o envio de email em massa"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        cache.clear()
+        for i in range(5):
+            data = self.valid_registration_data.copy()
+            data.update(full_name=f'Atleta {i}', email=f'atleta{i}@email.com')
+            RaceRegistration.objects.create(**data, registration_number=str(10000 + i))
+
+    def enqueue(self):
+        response = self.client.post(
+            '/api/admin/enviar-notificacao/',
+            data=json.dumps({'subject': 'Aviso', 'message': 'Largada às 6h'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['task_id']
+
+    def get_status(self, task_id):
+        response = self.client.get(f'/api/admin/status-notificacao/{task_id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_broadcast_is_queued_and_sent_by_worker(self):
+        """Testa que a API só enfileira e o worker envia para todos"""
+        task_id = self.enqueue()
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(BroadcastRecipient.objects.filter(broadcast_id=task_id).count(), 5)
+        status_data = self.get_status(task_id)
+        self.assertEqual(status_data['status'], 'running')
+        self.assertEqual(status_data['total'], 5)
+        self.assertEqual(status_data['sent_count'], 0)
+
+        broadcast = claim_next_broadcast()
+        self.assertEqual(str(broadcast.id), task_id)
+        result = run_broadcast(broadcast, connections=2, max_rate=0)
+
+        self.assertEqual(result, {'sent': 5, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 5)
+        status_data = self.get_status(task_id)
+        self.assertEqual(status_data['status'], 'done')
+        self.assertEqual(status_data['sent_count'], 5)
+        self.assertEqual(status_data['failed_count'], 0)
+        self.assertIsNone(claim_next_broadcast())
+
+    def test_resume_skips_already_sent_recipients(self):
+        """Testa retomada após queda: só destinatários pendentes são enviados"""
+        task_id = self.enqueue()
+        broadcast = claim_next_broadcast()
+        already_sent = BroadcastRecipient.objects.filter(broadcast=broadcast).order_by('id')[:3]
+        BroadcastRecipient.objects.filter(id__in=[r.id for r in already_sent]).update(
+            status=BroadcastRecipient.STATUS_SENT
+        )
+
+        # Worker caiu: sinal antigo, outro worker retoma
+        Broadcast.objects.filter(id=broadcast.id).update(heartbeat_at=timezone.now() - timedelta(minutes=10))
+        resumed = claim_next_broadcast()
+        self.assertEqual(resumed.id, broadcast.id)
+        result = run_broadcast(resumed, connections=2, max_rate=0)
+
+        self.assertEqual(result['sent'], 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(self.get_status(task_id)['sent_count'], 5)
+
+    def test_progress_reporter_batches_writes(self):
+        """Testa que o progresso é gravado a cada N mensagens ou T ms, não por email"""
+        now = [0.0]
+        write_progress('t1', {'status': 'running', 'total': 10, 'sent_count': 0, 'failed_count': 0})
+        reporter = ProgressReporter('t1', flush_every=4, flush_interval_ms=500, clock=lambda: now[0])
+        recipient = {'email': 'a@email.com', 'full_name': 'Atleta'}
+
+        for _ in range(3):
+            reporter.record(recipient, True)
+        self.assertEqual(reporter.flushes, 0)
+        self.assertEqual(read_progress('t1')['sent_count'], 0)
+
+        reporter.record(recipient, False)
+        self.assertEqual(reporter.flushes, 1)
+
+        # Poucas mensagens, mas o intervalo passou
+        now[0] = 0.6
+        reporter.record(recipient, True)
+        self.assertEqual(reporter.flushes, 2)
+
+        reporter.finish()
+        progress = read_progress('t1')
+        self.assertEqual(progress, {
+            'status': 'done',
+            'total': 10,
+            'sent_count': 4,
+            'failed_count': 1,
+            'current_email': 'a@email.com',
+            'current_name': 'Atleta',
+        })
+
+    @patch('builtins.print')
+    @patch('api.broadcasts.get_connection', side_effect=Exception('backend de email inválido'))
+    def test_setup_error_fails_recipients_instead_of_hanging(self, mock_connection, mock_print):
+        """Testa que erro ao preparar as threads marca os destinatários como falhos e termina"""
+        task_id = self.enqueue()
+
+        result = run_broadcast(claim_next_broadcast(), connections=2, max_rate=0)
+
+        self.assertEqual(result, {'sent': 0, 'failed': 5})
+        status_data = self.get_status(task_id)
+        self.assertEqual(status_data['status'], 'done')
+        self.assertEqual(status_data['failed_count'], 5)
+        self.assertEqual(
+            set(BroadcastRecipient.objects.filter(broadcast_id=task_id).values_list('error', flat=True)),
+            {'backend de email inválido'},
+        )
+
+    @patch('django.core.mail.EmailMultiAlternatives.send', autospec=True)
+    def test_failures_are_listed_in_pages(self, mock_send):
+        """Testa listagem paginada dos destinatários com falha"""
+        def send(message, fail_silently=False):
+            if message.to[0] in ('atleta1@email.com', 'atleta3@email.com', 'atleta4@email.com'):
+                raise Exception('Destinatário recusado')
+            return 1
+        mock_send.side_effect = send
+
+        task_id = self.enqueue()
+        run_broadcast(claim_next_broadcast(), connections=1, max_rate=0)
+
+        self.assertEqual(self.get_status(task_id)['failed_count'], 3)
+
+        url = f'/api/admin/status-notificacao/{task_id}/falhas/'
+        page = self.client.get(url + '?limit=2').json()
+        self.assertEqual(page['count'], 2)
+        self.assertIsNotNone(page['next_cursor'])
+        last = self.client.get(url + f'?limit=2&after={page["next_cursor"]}').json()
+        self.assertIsNone(last['next_cursor'])
+        emails = [f['email'] for f in page['failures'] + last['failures']]
+        self.assertCountEqual(emails, ['atleta1@email.com', 'atleta3@email.com', 'atleta4@email.com'])
+        self.assertEqual(last['failures'][0]['error'], 'Destinatário recusado')
+
+        self.assertEqual(self.client.get(url + '?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/status-notificacao/nao-existe/falhas/').status_code, 404)
+
+    def test_status_falls_back_to_database(self):
+        """Testa status lido do banco quando o cache expirou"""
+        task_id = self.enqueue()
+        cache.clear()
+
+        self.assertEqual(self.get_status(task_id)['total'], 5)
+        response = self.client.get('/api/admin/status-notificacao/nao-existe/')
+        self.assertEqual(response.status_code, 404)
+
 
 class PaymentAPITest(APITestCase):
     """Testes para endpoints de pagamento"""
@@ -321,7 +974,7 @@ class PaymentAPITest(APITestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIn('error', response.json())
     
-    @patch('api.views.verify_stripe_checkout_session')
+    @patch('api.services.verify_stripe_checkout_session')
     def test_verify_payment_status_success(self, mock_verify):
         """Testa verificação bem-sucedida de status de pagamento"""
         mock_verify.return_value = {
@@ -406,6 +1059,491 @@ class PaymentAPITest(APITestCase):
         self.assertEqual(response.status_code, 404)
 
 
+@override_settings(ABACATEPAY_WEBHOOK_SECRET='segredo', ABACATEPAY_WEBHOOK_HMAC_KEY='chave-hmac')
+class AbacatePayWebhookTest(APITestCase):
+    """Testes para o webhook do AbacatePay (com servidor AbacatePay falso)"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        data = self.valid_registration_data.copy()
+        data['cpf'] = '52998224725'
+        self.registration = RaceRegistration.objects.create(**data)
+        self.fake = FakeAbacatePay(webhook_secret='segredo', hmac_key='chave-hmac').__enter__()
+        self.addCleanup(self.fake.__exit__, None, None, None)
+        patcher = patch('api.abacatepay_client.ABACATEPAY_BASE_URL', self.fake.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def deliver(self, webhook, query=None, signature=None):
+        headers = dict(webhook['headers'])
+        if signature is not None:
+            headers['X-Webhook-Signature'] = signature
+        return self.client.post(
+            f'/api/payment/pix/webhook/?{webhook["query"] if query is None else query}',
+            data=webhook['body'],
+            content_type='application/json',
+            HTTP_X_WEBHOOK_SIGNATURE=headers.get('X-Webhook-Signature', ''),
+        )
+
+    def create_pix(self):
+        response = self.client.post(
+            '/api/payment/pix/create/',
+            data=json.dumps({'registration_id': self.registration.id}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['pix_id']
+
+    def test_paid_webhook_confirms_payment_once(self):
+        """Testa confirmação via webhook e reenvio idempotente"""
+        pix_id = self.create_pix()
+        self.fake.pay(pix_id)
+        webhook = self.fake.webhooks.pop()
+
+        response = self.deliver(webhook)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['registration_updated'])
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PAID')
+        self.assertIsNotNone(self.registration.registration_number)
+        self.assertEqual(AbacatePayWebhookEvent.objects.get().registration, self.registration)
+
+        # Reenvio do mesmo evento: não reprocessa
+        with self.assertNumQueries(3):
+            response = self.deliver(webhook)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['duplicate'])
+        self.assertEqual(EmailOutbox.objects.filter(registration=self.registration).count(), 1)
+
+    def test_invalid_signature_or_secret_rejected(self):
+        """Testa recusa de webhook sem segredo ou com assinatura inválida"""
+        pix_id = self.create_pix()
+        self.fake.pay(pix_id)
+        webhook = self.fake.webhooks.pop()
+
+        self.assertEqual(self.deliver(webhook, query='webhookSecret=errado').status_code, 401)
+        self.assertEqual(self.deliver(webhook, signature='YXNzaW5hdHVyYQ==').status_code, 401)
+        with override_settings(ABACATEPAY_WEBHOOK_SECRET='', ABACATEPAY_WEBHOOK_HMAC_KEY=''):
+            self.assertEqual(self.deliver(webhook).status_code, 401)
+
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PENDING')
+        self.assertFalse(AbacatePayWebhookEvent.objects.exists())
+
+    def test_other_events_are_recorded_and_ignored(self):
+        """Testa que eventos não tratados são aceitos sem alterar a inscrição"""
+        webhook = self.fake.fire('billing.refunded', {'pixQrCode': {'id': 'pix_x'}})
+
+        response = self.deliver(webhook)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(AbacatePayWebhookEvent.objects.filter(event_type='billing.refunded').exists())
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PENDING')
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_teste')
+class StripeWebhookTest(APITestCase):
+    """Testes para o webhook do Stripe (grava e responde; worker processa)"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        self.registration = RaceRegistration.objects.create(**self.valid_registration_data)
+
+    def make_event(self, event_id, registration_id, created):
+        return {
+            'id': event_id,
+            'type': 'checkout.session.completed',
+            'created': created,
+            'data': {'object': {
+                'metadata': {'registration_id': str(registration_id)},
+                'amount_total': 12000,
+                'payment_intent': f'pi_{event_id}',
+            }},
+        }
+
+    def deliver(self, event, secret='whsec_teste'):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post(
+            '/api/payment/stripe-webhook/',
+            data=payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}',
+        )
+
+    def test_webhook_records_event_without_processing(self):
+        """Testa que o webhook grava o evento e responde sem marcar como pago"""
+        response = self.deliver(self.make_event('evt_1', self.registration.id, 1700000000))
+
+        self.assertEqual(response.status_code, 200)
+        event = StripeEvent.objects.get()
+        self.assertEqual(event.status, StripeEvent.STATUS_PENDING)
+        self.assertEqual(event.payload['data']['object']['payment_intent'], 'pi_evt_1')
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PENDING')
+
+    def test_redelivered_event_is_deduplicated(self):
+        """Testa que reenvio do mesmo evento custa uma consulta e não duplica"""
+        event = self.make_event('evt_1', self.registration.id, 1700000000)
+        self.deliver(event)
+
+        with self.assertNumQueries(1):
+            response = self.deliver(event)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_invalid_signature_rejected(self):
+        """Testa recusa de evento com assinatura inválida"""
+        response = self.deliver(self.make_event('evt_1', self.registration.id, 1700000000), secret='whsec_errado')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_worker_processes_events_in_stripe_order(self):
+        """Testa processamento em ordem de criação no Stripe e marcação como pago"""
+        data = self.valid_registration_data.copy()
+        data.update(cpf='52998224725', email='maria@email.com')
+        other = RaceRegistration.objects.create(**data)
+        self.deliver(self.make_event('evt_late', other.id, 1700000100))
+        self.deliver(self.make_event('evt_early', self.registration.id, 1700000000))
+
+        with patch('api.services.process_stripe_webhook_event', wraps=process_stripe_webhook_event) as mock_process:
+            result = process_stripe_event_batch()
+
+        self.assertEqual(result, {'processed': 2, 'retried': 0, 'failed': 0})
+        self.assertEqual([call.args[0]['id'] for call in mock_process.call_args_list], ['evt_early', 'evt_late'])
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PAID')
+        self.assertEqual(self.registration.stripe_payment_intent_id, 'pi_evt_early')
+        self.assertTrue(EmailOutbox.objects.filter(registration=self.registration).exists())
+        self.assertFalse(StripeEvent.objects.exclude(status=StripeEvent.STATUS_PROCESSED).exists())
+
+    def test_worker_retries_then_fails_event(self):
+        """Testa backoff de evento com erro e falha definitiva após o limite"""
+        self.deliver(self.make_event('evt_1', 999999, 1700000000))
+
+        self.assertEqual(process_stripe_event_batch(max_attempts=2), {'processed': 0, 'retried': 1, 'failed': 0})
+        event = StripeEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        self.assertIn('999999', event.last_error)
+
+        StripeEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_stripe_event_batch(max_attempts=2), {'processed': 0, 'retried': 0, 'failed': 1})
+        self.assertEqual(StripeEvent.objects.get().status, StripeEvent.STATUS_FAILED)
+
+    def test_checkout_through_fake_stripe(self):
+        """Testa sessão criada e paga no Stripe falso, com webhook assinado aceito pela API"""
+        import stripe
+
+        with FakeStripe(webhook_secret='whsec_teste') as fake, \
+                patch.multiple(stripe, api_base=fake.api_base, api_key='sk_test_falso', max_network_retries=0):
+            response = self.client.post(
+                '/api/payment/create-session/',
+                data=json.dumps({'registration_id': self.registration.id}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            session_id = response.json()['session_id']
+            self.assertEqual(fake.sessions[session_id]['metadata']['registration_id'], str(self.registration.id))
+
+            fake.pay(session_id)
+            webhook = fake.webhooks.pop()
+            response = self.client.post(
+                '/api/payment/stripe-webhook/',
+                data=webhook['body'],
+                content_type='application/json',
+                HTTP_STRIPE_SIGNATURE=webhook['headers']['Stripe-Signature'],
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(process_stripe_event_batch()['processed'], 1)
+
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PAID')
+        self.assertEqual(self.registration.stripe_payment_intent_id, fake.sessions[session_id]['payment_intent'])
+
+
+class VerifyPaymentStatusCacheTest(APITestCase):
+    """Testes para o cache do status da sessão de checkout do Stripe"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.registration = RaceRegistration.objects.create(
+            **self.valid_registration_data, stripe_checkout_session_id='cs_test_123'
+        )
+
+    def stripe_session(self, payment_status):
+        return MagicMock(
+            payment_status=payment_status,
+            amount_total=12000,
+            customer_email='joao@email.com',
+            metadata={'registration_id': str(self.registration.id)},
+            payment_intent='pi_test_123',
+        )
+
+    def verify(self):
+        response = self.client.get('/api/payment/verify-status/?session_id=cs_test_123')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    @patch('stripe.checkout.Session.retrieve')
+    def test_unpaid_session_cached_for_ttl(self, mock_retrieve):
+        """Testa que sessão não paga é consultada no Stripe uma vez por TTL"""
+        mock_retrieve.return_value = self.stripe_session('unpaid')
+
+        first = self.verify()
+        second = self.verify()
+
+        self.assertEqual(mock_retrieve.call_count, 1)
+        self.assertEqual((first['source'], second['source']), ('stripe', 'cache'))
+        self.assertEqual(second['payment_status'], 'unpaid')
+        self.assertEqual(session_cache_stats(), {'db': 0, 'hits': 1, 'misses': 1})
+
+        cache.delete('stripe_session:cs_test_123')  # TTL expirado
+        self.verify()
+        self.assertEqual(mock_retrieve.call_count, 2)
+
+    @patch('stripe.checkout.Session.retrieve')
+    def test_paid_session_marks_once_then_database_answers(self, mock_retrieve):
+        """Testa que após o pagamento o banco responde sem chamar o Stripe"""
+        mock_retrieve.return_value = self.stripe_session('paid')
+
+        first = self.verify()
+        self.assertTrue(first['registration_updated'])
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PAID')
+
+        with self.assertNumQueries(1):
+            second = self.verify()
+
+        self.assertEqual(mock_retrieve.call_count, 1)
+        self.assertEqual(second['source'], 'db')
+        self.assertEqual(second['payment_status'], 'paid')
+        self.assertEqual(second['amount_total'], 12000)
+        self.assertFalse(second['registration_updated'])
+        self.assertEqual(EmailOutbox.objects.filter(registration=self.registration).count(), 1)
+        self.assertEqual(session_cache_stats(), {'db': 1, 'hits': 0, 'misses': 1})
+
+    @patch('stripe.checkout.Session.retrieve')
+    def test_paid_session_from_cache_retries_failed_mark(self, mock_retrieve):
+        """Testa que falha ao marcar como paga é retentada na consulta seguinte (cache)"""
+        mock_retrieve.return_value = self.stripe_session('paid')
+
+        with patch('api.views.mark_registration_paid_atomic', side_effect=Exception('deadlock')):
+            response = self.client.get('/api/payment/verify-status/?session_id=cs_test_123')
+        self.assertEqual(response.status_code, 500)
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PENDING')
+
+        second = self.verify()
+        self.assertEqual(second['source'], 'cache')
+        self.assertTrue(second['registration_updated'])
+        self.assertEqual(mock_retrieve.call_count, 1)
+        self.registration.refresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PAID')
+
+        self.assertEqual(self.verify()['source'], 'db')
+
+    @patch('stripe.checkout.Session.retrieve')
+    def test_paid_session_cached_without_expiry(self, mock_retrieve):
+        """Testa que sessão paga fica no cache sem expiração"""
+        mock_retrieve.return_value = self.stripe_session('paid')
+        RaceRegistration.objects.filter(id=self.registration.id).update(stripe_checkout_session_id='cs_outra')
+
+        with patch('api.stripe_sessions.cache.set', wraps=cache.set) as mock_set:
+            self.verify()
+        self.assertIsNone(mock_set.call_args.kwargs['timeout'])
+
+        self.assertEqual(self.verify()['source'], 'cache')
+        self.assertEqual(mock_retrieve.call_count, 1)
+
+
+@override_settings(PAYMENT_SESSION_ASYNC=True)
+@patch('api.payment_jobs._submit', lambda func, *args: func(*args))
+class AsyncPaymentSessionTest(APITestCase):
+    """Testes para a criação da sessão de pagamento em background"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.valid_registration_data['cpf'] = '52998224725'
+
+    def register(self):
+        response = self.client.post(
+            '/api/race-registrations/',
+            data=json.dumps(self.valid_registration_data),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['payment']
+
+    @patch('api.services.create_stripe_checkout_session')
+    def test_create_returns_token_and_status_has_checkout_url(self, mock_create):
+        """Testa 201 com token e checkout_url disponível no endpoint de status"""
+        mock_create.return_value = {
+            'success': True,
+            'checkout_url': 'https://checkout.stripe.com/c/pay/cs_test_123',
+            'session_id': 'cs_test_123',
+            'amount': 100.0,
+        }
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            payment = self.register()
+
+        self.assertTrue(payment['payment_pending'])
+        self.assertTrue(payment['status_url'].endswith(f"/api/payment/session-status/{payment['token']}/"))
+        mock_create.assert_not_called()
+        self.assertEqual(self.client.get(payment['status_url']).json()['status'], 'pending')
+
+        for callback in callbacks:
+            callback()
+
+        with self.assertNumQueries(0):
+            data = self.client.get(payment['status_url']).json()
+        self.assertEqual(data['status'], 'ready')
+        self.assertEqual(data['checkout_url'], 'https://checkout.stripe.com/c/pay/cs_test_123')
+        self.assertEqual(data['registration_id'], RaceRegistration.objects.get().id)
+
+    @patch('api.services.create_stripe_checkout_session')
+    def test_failed_job_reported(self, mock_create):
+        """Testa que erro do Stripe aparece no status do job"""
+        mock_create.return_value = {'success': False, 'error': 'Erro no Stripe: indisponível'}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = self.register()
+
+        data = self.client.get(payment['status_url']).json()
+        self.assertEqual(data['status'], 'failed')
+        self.assertIn('indisponível', data['error'])
+
+    @override_settings(PAYMENT_SESSION_JOB_TIMEOUT=0)
+    def test_stale_pending_job_reported_as_failed(self):
+        """Testa que job que não terminou no prazo é informado como falho"""
+        payment = self.register()
+
+        data = self.client.get(payment['status_url']).json()
+        self.assertEqual(data['status'], 'failed')
+        self.assertIn('create-session', data['error'])
+
+    def test_unknown_token_returns_404(self):
+        """Testa token inexistente"""
+        response = self.client.get('/api/payment/session-status/naoexiste/')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class IdempotencyKeyTest(APITestCase):
+    """Testes para o header Idempotency-Key"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.registration = RaceRegistration.objects.create(**self.valid_registration_data)
+        self.session_result = {
+            'success': True,
+            'checkout_url': 'https://checkout.stripe.com/c/pay/cs_test_123',
+            'session_id': 'cs_test_123',
+            'amount': 100.0,
+        }
+
+    def post(self, url, data, key='chave-1'):
+        return self.client.post(url, data=json.dumps(data), content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    @patch('api.views.create_stripe_checkout_session')
+    def test_replay_returns_stored_response_without_view(self, mock_create):
+        """Testa que a repetição devolve a mesma resposta sem banco nem Stripe"""
+        mock_create.return_value = self.session_result
+        body = {'registration_id': self.registration.id}
+
+        first = self.post('/api/payment/create-session/', body)
+        with self.assertNumQueries(0):
+            second = self.post('/api/payment/create-session/', body)
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        mock_create.assert_called_once()
+
+    @patch('api.views.create_abacatepay_pix')
+    def test_same_key_with_other_body_rejected(self, mock_pix):
+        """Testa 422 quando a chave é reutilizada com outro conteúdo"""
+        mock_pix.return_value = {'success': True, 'pix_id': 'pix_1'}
+
+        self.post('/api/payment/pix/create/', {'registration_id': self.registration.id})
+        response = self.post('/api/payment/pix/create/', {'registration_id': self.registration.id, 'coupon_code': 'AD10'})
+
+        self.assertEqual(response.status_code, 422)
+        mock_pix.assert_called_once()
+
+    @patch('api.views.create_stripe_checkout_session')
+    def test_registration_resubmit_creates_one_row(self, mock_create):
+        """Testa que reenvio da inscrição com a mesma chave não duplica"""
+        mock_create.return_value = self.session_result
+        data = self.valid_registration_data.copy()
+        data.update(cpf='52998224725', email='maria@email.com')
+
+        first = self.post('/api/race-registrations/', data)
+        second = self.post('/api/race-registrations/', data)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(RaceRegistration.objects.filter(email='maria@email.com').count(), 1)
+
+    @patch('api.views.create_stripe_checkout_session')
+    def test_concurrent_duplicate_waits_for_first(self, mock_create):
+        """Testa que a duplicata espera a requisição em andamento e recebe o resultado dela"""
+        body = {'registration_id': self.registration.id}
+        cache.add('idempotency:payment-create-session:chave-1:lock', 'outra-requisicao')
+        stored = {
+            'fingerprint': hashlib.sha256(json.dumps(body).encode()).hexdigest(),
+            'status': 200,
+            'body': json.dumps(self.session_result),
+        }
+        finish = threading.Timer(0.2, lambda: cache.set('idempotency:payment-create-session:chave-1', stored))
+        finish.start()
+        self.addCleanup(finish.cancel)
+
+        response = self.post('/api/payment/create-session/', body)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['session_id'], 'cs_test_123')
+        mock_create.assert_not_called()
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.1)
+    def test_duplicate_gives_up_with_409(self):
+        """Testa 409 quando a requisição original não termina no prazo"""
+        cache.add('idempotency:payment-create-session:chave-1:lock', 'outra-requisicao')
+
+        response = self.post('/api/payment/create-session/', {'registration_id': self.registration.id})
+
+        self.assertEqual(response.status_code, 409)
+
+    @patch('api.views.create_stripe_checkout_session')
+    def test_server_errors_not_stored(self, mock_create):
+        """Testa que erro 5xx não é guardado e a repetição processa de novo"""
+        mock_create.side_effect = [RuntimeError('falhou'), self.session_result]
+        body = {'registration_id': self.registration.id}
+
+        self.assertEqual(self.post('/api/payment/create-session/', body).status_code, 500)
+        self.assertEqual(self.post('/api/payment/create-session/', body).status_code, 200)
+        self.assertEqual(mock_create.call_count, 2)
+
+
 class CouponAPITest(APITestCase):
     """Testes para endpoints de cupom"""
     
@@ -456,6 +1594,277 @@ class CouponAPITest(APITestCase):
         self.assertIn('error', response.json())
 
 
+class MetricsEndpointTest(APITestCase):
+    """Testes para o MetricsMiddleware e /api/metrics/"""
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    @override_settings(METRICS_TOKEN='segredo')
+    def test_requests_counted_per_route_and_status(self):
+        """Testa contagem, latência e status por rota (nome da view)"""
+        labels = {'route': 'api:health_check', 'method': 'GET'}
+        before = self.sample('http_requests_total', status='200', **labels)
+        observed = self.sample('http_request_duration_seconds_count', **labels)
+
+        self.client.get(f'{self.base_url}health/')
+        self.client.get(f'{self.base_url}health/')
+
+        self.assertEqual(self.sample('http_requests_total', status='200', **labels), before + 2)
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **labels), observed + 2)
+
+        response = self.client.get(f'{self.base_url}metrics/', HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('http_requests_total{method="GET",route="api:health_check",status="200"}', body)
+        self.assertIn('http_request_duration_seconds_bucket', body)
+        self.assertIn('http_requests_in_progress', body)
+        self.assertIn('stripe_session_status_total{source="hits"}', body)
+
+    def test_db_queries_per_request(self):
+        """Testa o histograma de consultas SQL por requisição"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        labels = {'route': 'api:race_statistics', 'method': 'GET'}
+        before = self.sample('http_request_db_queries_sum', **labels)
+
+        self.client.get(f'{self.base_url}race-statistics/')
+
+        self.assertGreaterEqual(self.sample('http_request_db_queries_sum', **labels), before + 1)
+
+    def test_unknown_path_uses_single_label(self):
+        """Testa que caminhos inexistentes não criam uma série por URL"""
+        before = self.sample('http_requests_total', route='unmatched', method='GET', status='404')
+        self.client.get('/nao-existe/123/')
+        self.assertEqual(self.sample('http_requests_total', route='unmatched', method='GET', status='404'), before + 1)
+
+    @override_settings(METRICS_TOKEN='segredo')
+    def test_token_required_when_configured(self):
+        """Testa que METRICS_TOKEN exige o header Authorization"""
+        self.assertEqual(self.client.get(f'{self.base_url}metrics/').status_code, 401)
+        response = self.client.get(f'{self.base_url}metrics/', HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_without_token_only_served_in_debug(self):
+        """Testa que sem METRICS_TOKEN as métricas ficam fechadas fora do DEBUG"""
+        with override_settings(DEBUG=False):
+            self.assertEqual(self.client.get(f'{self.base_url}metrics/').status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get(f'{self.base_url}metrics/').status_code, 200)
+
+    def test_multiprocess_workers_are_aggregated(self):
+        """Testa que, com PROMETHEUS_MULTIPROC_DIR, a exportação soma os processos"""
+        worker = (
+            "import django; django.setup();"
+            "from django.test import Client; Client(HTTP_HOST='localhost').get('/api/health/')"
+        )
+        exporter = (
+            "import django; django.setup();"
+            "from api.metrics import render_metrics; print(render_metrics().decode())"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory}
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', worker], cwd=settings.BASE_DIR, env=env, check=True)
+            output = subprocess.run(
+                [sys.executable, '-c', exporter], cwd=settings.BASE_DIR, env=env,
+                check=True, capture_output=True, text=True,
+            ).stdout
+
+        self.assertIn('http_requests_total{method="GET",route="api:health_check",status="200"} 2.0', output)
+
+
+@override_settings(SERVER_TIMING_ENABLED=True)
+class ServerTimingTest(APITestCase):
+    """Testes para os spans de chamadas externas (Server-Timing e histograma)"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.registration = RaceRegistration.objects.create(
+            **{**self.valid_registration_data, 'birth_date': date(1990, 1, 1)}
+        )
+
+    def fake_session(self, **kwargs):
+        return SimpleNamespace(
+            id='cs_test_timing',
+            url='https://checkout.stripe.com/c/pay/cs_test_timing',
+            expires_at=int(time.time()) + 24 * 3600,
+        )
+
+    def test_stripe_and_db_spans_in_header(self):
+        """Testa que o header Server-Timing separa Stripe, banco e total"""
+        before = REGISTRY.get_sample_value('outbound_call_duration_seconds_count', {'target': 'stripe'}) or 0.0
+
+        with patch('api.services.stripe.checkout.Session.create', side_effect=self.fake_session):
+            response = self.client.post(
+                '/api/payment/create-session/',
+                data=json.dumps({'registration_id': self.registration.id}),
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        parts = {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+        self.assertTrue(parts['stripe'].endswith('desc="1x"'))
+        self.assertIn('db', parts)
+        self.assertTrue(parts['total'].startswith('total;dur='))
+        self.assertEqual(
+            REGISTRY.get_sample_value('outbound_call_duration_seconds_count', {'target': 'stripe'}),
+            before + 1,
+        )
+
+    def test_smtp_span(self):
+        """Testa o span do envio de email"""
+        trace, token = start_trace()
+        try:
+            send_payment_confirmation_email(self.registration)
+        finally:
+            end_trace(token)
+        self.assertEqual(trace.count('smtp'), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_span_outside_request(self):
+        """Testa que spans fora de uma requisição só alimentam o histograma"""
+        before = REGISTRY.get_sample_value('outbound_call_duration_seconds_count', {'target': 'abacatepay'}) or 0.0
+        with span('abacatepay'):
+            pass
+        self.assertEqual(
+            REGISTRY.get_sample_value('outbound_call_duration_seconds_count', {'target': 'abacatepay'}),
+            before + 1,
+        )
+
+    def test_percentile_interpolates(self):
+        """Testa o percentil usado pelos comandos e pelos benchmarks"""
+        self.assertEqual(percentile([], 95), 0.0)
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertAlmostEqual(percentile(list(range(1, 101)), 95), 95.05)
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_header_disabled(self):
+        """Testa que SERVER_TIMING_ENABLED=False remove o header"""
+        response = self.client.get(f'{self.base_url}health/')
+        self.assertNotIn('Server-Timing', response)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, SERVER_TIMING_ENABLED=True)
+class AsyncGatewayViewsTest(APITestCase):
+    """Testes para as views assíncronas de pagamento (api/async_views.py)"""
+
+    def setUp(self):
+        """Configuração inicial"""
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        data = self.valid_registration_data.copy()
+        data['cpf'] = '52998224725'
+        self.registration = RaceRegistration.objects.create(**data)
+        self.factory = AsyncRequestFactory()
+
+    def start_abacatepay(self):
+        fake = FakeAbacatePay().__enter__()
+        self.addCleanup(fake.__exit__, None, None, None)
+        patcher = patch('api.abacatepay_client.ABACATEPAY_BASE_URL', fake.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return fake
+
+    def post(self, view, data, **headers):
+        request = self.factory.post('/', data=json.dumps(data), content_type='application/json', headers=headers)
+        return view(request)
+
+    def get(self, view, **params):
+        return view(self.factory.get('/', params))
+
+    async def test_pix_create_and_check_through_fake_abacatepay(self):
+        """Testa criação e confirmação do PIX sem bloquear o event loop"""
+        fake = self.start_abacatepay()
+
+        response = await self.post(async_views.create_pix_payment, {'registration_id': self.registration.id})
+        self.assertEqual(response.status_code, 200)
+        pix_id = response.data['pix_id']
+
+        response = await self.get(async_views.check_pix_status, pix_id=pix_id)
+        self.assertEqual(response.data['status'], 'PENDING')
+        self.assertFalse(response.data['registration_updated'])
+
+        fake.pay(pix_id)
+        response = await self.get(async_views.check_pix_status, pix_id=pix_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['registration_updated'])
+
+        await self.registration.arefresh_from_db()
+        self.assertEqual(self.registration.payment_status, 'PAID')
+        self.assertEqual(self.registration.abacatepay_pix_id, pix_id)
+        self.assertEqual(await EmailOutbox.objects.filter(registration=self.registration).acount(), 1)
+
+    async def test_checkout_and_verify_through_fake_stripe(self):
+        """Testa criação da sessão e verify-status com o Stripe falso"""
+        import stripe
+
+        fake = FakeStripe().__enter__()
+        self.addCleanup(fake.__exit__, None, None, None)
+        patcher = patch.multiple(stripe, api_base=fake.api_base, api_key='sk_test_falso', max_network_retries=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        response = await self.post(async_views.create_payment_session, {'registration_id': self.registration.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['reused'])
+        session_id = response.data['session_id']
+
+        fake.pay(session_id)
+        first = await self.get(async_views.verify_payment_status, session_id=session_id)
+        second = await self.get(async_views.verify_payment_status, session_id=session_id)
+
+        self.assertEqual((first.data['source'], second.data['source']), ('stripe', 'db'))
+        self.assertTrue(first.data['registration_updated'])
+        self.assertEqual(second.data['amount_total'], 10000)
+        self.assertEqual(len([r for r in fake.requests if r[0] == 'GET']), 1)
+
+        response = await self.post(async_views.create_payment_session, {'registration_id': self.registration.id})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_invalid_requests(self):
+        """Testa os erros de validação, iguais aos das views síncronas"""
+        response = await self.post(async_views.create_pix_payment, {})
+        self.assertEqual(response.status_code, 400)
+        response = await self.post(async_views.create_payment_session, {'registration_id': 999999})
+        self.assertEqual(response.status_code, 404)
+        response = await self.get(async_views.check_pix_status)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_idempotency_key_replay(self):
+        """Testa que a repetição com a mesma Idempotency-Key não chama o AbacatePay de novo"""
+        fake = self.start_abacatepay()
+        body = {'registration_id': self.registration.id}
+
+        first = await self.post(async_views.create_pix_payment, body, **{'Idempotency-Key': 'chave-async'})
+        second = await self.post(async_views.create_pix_payment, body, **{'Idempotency-Key': 'chave-async'})
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['pix_id'], first.data['pix_id'])
+        self.assertEqual(len(fake.pix_codes), 1)
+
+    async def test_metrics_middleware_async_mode(self):
+        """Testa o MetricsMiddleware na cadeia assíncrona (ASGI), com consultas feitas em threads"""
+        async def get_response(request):
+            await sync_to_async(RaceRegistration.objects.count)()
+            return HttpResponse('ok')
+
+        middleware = MetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        response = await middleware(self.factory.get('/api/health/'))
+
+        parts = {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+        self.assertTrue(parts['db'].endswith('desc="1x"'))
+
+
 class APIRootTest(APITestCase):
     """Testes para endpoint raiz da API"""
     
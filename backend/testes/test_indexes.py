@@ -0,0 +1,102 @@
+"""
+Testes dos índices de RaceRegistration (EXPLAIN no PostgreSQL)
+
+Cada consulta frequente deve usar o índice criado para ela. Os testes só
+rodam no PostgreSQL; no SQLite são ignorados.
+"""
+from datetime import date, timedelta
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import RaceRegistration
+from api.pix_schedule import due_pix_checks
+from api.statistics import created_on
+
+ROWS = 10000
+PENDING_EVERY = 20  # 5% pendentes com PIX
+CREATED_DAYS = 60
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN dos índices só é verificado no PostgreSQL')
+class RaceRegistrationIndexTest(TestCase):
+    """As consultas quentes usam index scan, não seq scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        registrations = []
+        for i in range(ROWS):
+            pending = i % PENDING_EVERY == 0
+            registrations.append(RaceRegistration(
+                full_name=f'Atleta {i:05d}',
+                cpf=f'{i:011d}',
+                email=f'atleta{i}@email.com',
+                phone='86999999999',
+                birth_date=date(1990, 1, 1),
+                gender='M' if i % 2 else 'F',
+                course='RUN_5K',
+                shirt_size='M',
+                athlete_declaration=True,
+                payment_status='PENDING' if pending else 'PAID',
+                registration_number=None if pending else f'{i:05d}',
+                stripe_checkout_session_id=None if pending else f'cs_test_{i}',
+                abacatepay_pix_id=f'pix_char_{i}' if pending else None,
+                next_check_at=now + timedelta(minutes=i % 120 - 60) if pending else None,
+            ))
+        RaceRegistration.objects.bulk_create(registrations, batch_size=1000)
+
+        table = RaceRegistration._meta.db_table
+        with connection.cursor() as cursor:
+            # created_at é auto_now_add; espalha as inscrições pelos últimos dias
+            cursor.execute(
+                f"UPDATE {table} SET created_at = %s - (id %% {CREATED_DAYS}) * interval '1 day'",
+                [now],
+            )
+            cursor.execute(f'ANALYZE {table}')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_pix_id_lookup(self):
+        """Webhook, simulate e check-status do PIX"""
+        queryset = RaceRegistration.objects.filter(abacatepay_pix_id='pix_char_200')
+        self.assertUsesIndex(queryset, 'reg_pix_id_idx')
+
+    def test_paid_cpf_lookup(self):
+        """validate_cpf"""
+        queryset = RaceRegistration.objects.filter(cpf='00000000123', payment_status='PAID')
+        self.assertUsesIndex(queryset, 'reg_cpf_status_idx')
+
+    def test_status_filter_newest_first(self):
+        queryset = RaceRegistration.objects.filter(payment_status='PENDING').order_by('-created_at')[:20]
+        self.assertUsesIndex(queryset, 'reg_status_created_idx')
+
+    def test_default_listing(self):
+        queryset = RaceRegistration.objects.all()[:20]
+        self.assertUsesIndex(queryset, 'reg_created_idx')
+
+    def test_created_today(self):
+        queryset = RaceRegistration.objects.filter(created_on(timezone.now().date()))
+        self.assertUsesIndex(queryset, 'reg_created_idx')
+
+    def test_paid_checkout_session_lookup(self):
+        """verify-status"""
+        queryset = RaceRegistration.objects.filter(stripe_checkout_session_id='cs_test_201', payment_status='PAID')
+        self.assertUsesIndex(queryset, 'reg_stripe_session_idx')
+
+    def test_due_pix_checks(self):
+        """check_pending_pix"""
+        self.assertUsesIndex(due_pix_checks(), 'reg_pix_due_idx')
+
+    def test_paid_registrations_page(self):
+        queryset = RaceRegistration.objects.exclude(
+            registration_number__isnull=True
+        ).exclude(
+            registration_number=''
+        ).order_by('full_name', 'id')[:100]
+        self.assertUsesIndex(queryset, 'reg_numbered_name_idx')
@@ -6,6 +6,7 @@ import pytest
 from unittest.mock import patch, MagicMock
 from django.test import TestCase, Client
 from django.core import mail
+from django.core.cache import cache
 from django.utils import timezone
 from decimal import Decimal
 from datetime import date
@@ -19,6 +20,8 @@ class PaymentIntegrationTest(TestCase):
     def setUp(self):
         """Configuração inicial"""
         self.client = Client()
+        # Contadores de estatísticas ficam no cache: isolar entre testes
+        cache.clear()
         
         # Dados válidos para inscrição
         self.valid_registration_data = {
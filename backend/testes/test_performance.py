@@ -0,0 +1,177 @@
+"""
+Orçamento de consultas SQL e de tempo por endpoint
+
+Com uma tabela de RaceRegistration de tamanho realista (PERF_ROWS, padrão
+10000; até 100000), cada endpoint público e de admin deve responder com no
+máximo N consultas e dentro de um tempo máximo. Uma consulta N+1 ou um
+endpoint que passou a varrer a tabela inteira quebra o teste.
+
+Os tempos são medidos no processo de teste (sem rede) e podem ser
+multiplicados por PERF_TIME_SCALE em máquinas mais lentas (CI):
+
+    PERF_ROWS=100000 PERF_TIME_SCALE=2 python manage.py test testes.test_performance
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Broadcast, BroadcastRecipient, RaceRegistration
+
+ROWS = min(int(os.environ.get('PERF_ROWS', 10000)), 100000)
+TIME_SCALE = float(os.environ.get('PERF_TIME_SCALE', 1))
+PAID_EVERY = 4  # 75% pagas (com número de inscrição)
+BROADCAST_IDS = 200
+
+# Endpoint -> (máximo de consultas, tempo máximo em ms para 10k inscrições)
+BUDGETS = {
+    'list': (2, 100),
+    'list_deep_page': (2, 150),
+    'retrieve': (1, 50),
+    'stats_cold': (2, 300),
+    'stats_warm': (0, 50),
+    'paid_registrations_page': (1, 100),
+    'paid_registrations_all': (2, 3000),
+    'update_registration': (2, 50),
+    'broadcast_enqueue': (10, 500),
+}
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, SERVER_TIMING_ENABLED=False)
+class QueryBudgetTest(TestCase):
+    """Cada endpoint fica dentro do orçamento de consultas e de tempo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        registrations = []
+        for i in range(ROWS):
+            paid = i % PAID_EVERY != 0
+            registrations.append(RaceRegistration(
+                full_name=f'Atleta {i:06d}',
+                cpf=f'{i:011d}',
+                email=f'atleta{i}@email.com',
+                phone='86999999999',
+                birth_date=date(1990, 1, 1) if i % 5 else date(2015, 1, 1),
+                gender='M' if i % 2 else 'F',
+                course='RUN_5K' if i % 5 else 'KIDS',
+                modality='ADULTO' if i % 5 else 'INFANTIL',
+                shirt_size='M',
+                athlete_declaration=True,
+                payment_status='PAID' if paid else 'PENDING',
+                registration_number=f'{i:06d}' if paid else None,
+            ))
+        RaceRegistration.objects.bulk_create(registrations, batch_size=2000)
+        cls.registration_ids = list(
+            RaceRegistration.objects.order_by('id').values_list('id', flat=True)
+        )
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @contextmanager
+    def assertBudget(self, endpoint):
+        """Falha se o bloco passar do orçamento de consultas ou de tempo do endpoint"""
+        max_queries, max_ms = BUDGETS[endpoint]
+        # Endpoints que percorrem a tabela inteira crescem com ela
+        if endpoint == 'paid_registrations_all':
+            max_ms *= max(ROWS / 10000, 1)
+        max_ms *= TIME_SCALE
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            yield
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+        executed = len(queries.captured_queries)
+        self.assertLessEqual(
+            executed, max_queries,
+            f'{endpoint}: {executed} consultas (máximo {max_queries}):\n'
+            + '\n'.join(q['sql'][:200] for q in queries.captured_queries)
+        )
+        self.assertLessEqual(
+            elapsed_ms, max_ms,
+            f'{endpoint}: {elapsed_ms:.1f}ms (máximo {max_ms:.0f}ms, {ROWS} inscrições)'
+        )
+
+    def test_list(self):
+        """Listagem paginada: COUNT + uma página"""
+        with self.assertBudget('list'):
+            response = self.client.get('/api/race-registrations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], ROWS)
+
+        last_page = ROWS // 10
+        with self.assertBudget('list_deep_page'):
+            response = self.client.get(f'/api/race-registrations/?page={last_page}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 10)
+
+    def test_retrieve(self):
+        """Detalhe de uma inscrição: uma consulta pela chave primária"""
+        registration_id = self.registration_ids[ROWS // 2]
+        with self.assertBudget('retrieve'):
+            response = self.client.get(f'/api/race-registrations/{registration_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], registration_id)
+
+    def test_statistics(self):
+        """Estatísticas: agregação só sem contadores no cache; depois, nenhuma consulta"""
+        with self.assertBudget('stats_cold'):
+            response = self.client.get('/api/race-statistics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_inscriptions'], ROWS)
+
+        with self.assertBudget('stats_warm'):
+            response = self.client.get('/api/race-statistics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_inscriptions'], ROWS)
+
+    def test_paid_registrations(self):
+        """Inscrições pagas: uma página pelo cursor e a lista completa em streaming"""
+        paid = ROWS - len(range(0, ROWS, PAID_EVERY))
+
+        with self.assertBudget('paid_registrations_page'):
+            response = self.client.get('/api/admin/paid-registrations/?limit=100&after=Atleta 005000,0')
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['registrations']), 100)
+
+        with self.assertBudget('paid_registrations_all'):
+            response = self.client.get('/api/admin/paid-registrations/')
+            data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['count'], paid)
+
+    def test_update_registration(self):
+        """Atualização: um SELECT e um UPDATE, sem recarregar a inscrição"""
+        registration_id = self.registration_ids[ROWS // 3]
+        with self.assertBudget('update_registration'):
+            response = self.client.post(
+                '/api/admin/update-registration/',
+                data=json.dumps({'registration_id': registration_id, 'course': 'RUN_10K', 'shirt_size': 'G'}),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RaceRegistration.objects.get(id=registration_id).course, 'RUN_10K')
+
+    def test_broadcast_enqueue(self):
+        """Enfileirar envio em massa: destinatários gravados em lote, sem uma consulta por inscrição"""
+        ids = [pk for i, pk in enumerate(self.registration_ids) if i % PAID_EVERY][:BROADCAST_IDS]
+        with self.assertBudget('broadcast_enqueue'):
+            response = self.client.post(
+                '/api/admin/enviar-notificacao/',
+                data=json.dumps({'subject': 'Aviso', 'message': 'Largada às 6h', 'registration_ids': ids}),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], BROADCAST_IDS)
+        broadcast = Broadcast.objects.get(id=response.json()['task_id'])
+        self.assertEqual(BroadcastRecipient.objects.filter(broadcast=broadcast).count(), BROADCAST_IDS)
@@ -1,15 +1,37 @@
 """
 Testes unitários para services
 """
+import time
+from io import StringIO
+
 import pytest
 from unittest.mock import patch, MagicMock
 from django.test import TestCase
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail import get_connection
+from django.db import connection as db_connection
 from django.utils import timezone
 from decimal import Decimal
-from datetime import date
+from datetime import date, timedelta
+
+import requests
+from prometheus_client import REGISTRY
 
-from api.models import RaceRegistration
+from api import abacatepay_client
+from api.models import RaceRegistration, RegistrationNumberPool, EmailOutbox
+from api.email_outbox import CLAIM_TIMEOUT_SECONDS, process_outbox_batch
+from api.pix_schedule import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    EXPIRY_GRACE,
+    FRESH_ATTEMPTS,
+    FRESH_INTERVAL,
+    next_check_after,
+    parse_expires_at,
+)
+from api.registration_numbers import NUMBER_MIN, NUMBER_MAX, RegistrationNumberPoolExhausted
 from api.services import (
     validate_coupon_code,
     send_payment_confirmation_email,
@@ -175,6 +197,41 @@ class RegistrationNumberTest(TestCase):
         
         self.assertEqual(len(numbers), 100)
 
+    def test_pool_is_filled_lazily_without_used_numbers(self):
+        """Testa que o pool é preenchido sem números já atribuídos"""
+        RaceRegistration.objects.create(
+            full_name='João Silva',
+            cpf='12345678901',
+            email='joao@email.com',
+            phone='11999999999',
+            birth_date=date(1990, 1, 1),
+            gender='M',
+            athlete_declaration=True,
+            registration_number='12345'
+        )
+
+        generate_unique_registration_number()
+
+        total = NUMBER_MAX - NUMBER_MIN + 1
+        self.assertEqual(RegistrationNumberPool.objects.count(), total - 2)
+        self.assertFalse(RegistrationNumberPool.objects.filter(number='12345').exists())
+
+    def test_allocation_pops_in_pool_order(self):
+        """Testa que a alocação retira o primeiro número do pool"""
+        RegistrationNumberPool.objects.bulk_create(
+            [RegistrationNumberPool(number=n) for n in ['54321', '11111']]
+        )
+
+        self.assertEqual(generate_unique_registration_number(), '54321')
+        self.assertEqual(generate_unique_registration_number(), '11111')
+        self.assertFalse(RegistrationNumberPool.objects.exists())
+
+    @patch('api.registration_numbers.fill_registration_number_pool', return_value=0)
+    def test_pool_exhausted(self, mock_fill):
+        """Testa erro quando não há mais números disponíveis"""
+        with self.assertRaises(RegistrationNumberPoolExhausted):
+            generate_unique_registration_number()
+
 
 class PaymentServiceTest(TestCase):
     """Testes para serviços de pagamento"""
@@ -198,8 +255,6 @@ class PaymentServiceTest(TestCase):
     @patch('api.services.send_payment_confirmation_email')
     def test_mark_registration_paid_atomic_success(self, mock_send_email):
         """Testa marcação bem-sucedida de inscrição como paga"""
-        mock_send_email.return_value = True
-        
         result = mark_registration_paid_atomic(
             self.registration.id,
             amount_reais=50.00,
@@ -217,8 +272,11 @@ class PaymentServiceTest(TestCase):
         self.assertIsNotNone(self.registration.payment_date)
         self.assertIsNotNone(self.registration.registration_number)
         
-        # Verificar se email foi enviado
-        mock_send_email.assert_called_once_with(self.registration)
+        # Email vai para o outbox, não é enviado dentro do request
+        mock_send_email.assert_not_called()
+        outbox = EmailOutbox.objects.get(registration=self.registration)
+        self.assertEqual(outbox.status, EmailOutbox.STATUS_PENDING)
+        self.assertEqual(outbox.kind, EmailOutbox.KIND_PAYMENT_CONFIRMATION)
     
     def test_mark_registration_paid_atomic_already_paid(self):
         """Testa tentativa de marcar inscrição já paga"""
@@ -254,6 +312,317 @@ class PaymentServiceTest(TestCase):
             mark_registration_paid_atomic(99999)
 
 
+class PixScheduleTest(TestCase):
+    """Testes para o agendamento das verificações de PIX"""
+    
+    def test_fresh_pix_polled_every_minute(self):
+        """Testa que PIX recente é verificado a cada minuto"""
+        now = timezone.now()
+        expires_at = now + timedelta(hours=1)
+        
+        self.assertEqual(next_check_after(1, expires_at, now), now + FRESH_INTERVAL)
+        self.assertEqual(next_check_after(FRESH_ATTEMPTS - 1, expires_at, now), now + FRESH_INTERVAL)
+    
+    def test_old_pix_backs_off_exponentially(self):
+        """Testa backoff exponencial limitado ao teto"""
+        now = timezone.now()
+        delays = [next_check_after(FRESH_ATTEMPTS + i, None, now) - now for i in range(4)]
+        
+        self.assertEqual(delays, [BACKOFF_BASE * 1, BACKOFF_BASE * 2, BACKOFF_BASE * 4, BACKOFF_BASE * 8])
+        self.assertEqual(next_check_after(19, None, now) - now, BACKOFF_MAX)
+    
+    def test_expired_pix_is_parked_after_final_check(self):
+        """Testa última verificação logo após a expiração e depois estaciona"""
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=30)
+        
+        # Backoff longo é encurtado para a verificação final
+        self.assertEqual(next_check_after(FRESH_ATTEMPTS + 5, expires_at, now), expires_at + EXPIRY_GRACE)
+        self.assertIsNone(next_check_after(1, expires_at, expires_at + EXPIRY_GRACE))
+    
+    def test_parse_expires_at(self):
+        """Testa leitura do expiresAt do AbacatePay"""
+        parsed = parse_expires_at('2026-03-01T10:00:00.000Z')
+        
+        self.assertEqual(parsed.isoformat(), '2026-03-01T10:00:00+00:00')
+        self.assertIsNone(parse_expires_at(None))
+        self.assertIsNone(parse_expires_at('amanhã'))
+
+
+def _response(status_code, headers=None):
+    return MagicMock(status_code=status_code, headers=headers or {})
+
+
+@patch('api.abacatepay_client.time.sleep')
+class AbacatePayClientTest(TestCase):
+    """Testes para o cliente HTTP do AbacatePay"""
+    
+    def setUp(self):
+        patcher = patch('api.abacatepay_client.get_session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+    
+    def test_retries_transient_errors_on_idempotent_calls(self, mock_sleep):
+        """Testa retry de 503 e 429 com backoff antes do sucesso"""
+        self.session.request.side_effect = [_response(503), _response(429, {'Retry-After': '1'}), _response(200)]
+        
+        response = abacatepay_client.get('/pixQrCode/check', params={'id': 'pix_1'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.request.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertLessEqual(mock_sleep.call_args_list[0].args[0], abacatepay_client.BACKOFF_BASE)
+        self.assertEqual(mock_sleep.call_args_list[1].args[0], 1.0)
+        _, kwargs = self.session.request.call_args
+        self.assertEqual(kwargs['timeout'], (abacatepay_client.CONNECT_TIMEOUT, abacatepay_client.READ_TIMEOUT))
+    
+    def test_retries_are_bounded(self, mock_sleep):
+        """Testa que a última resposta é devolvida quando as tentativas acabam"""
+        self.session.request.return_value = _response(502)
+        
+        response = abacatepay_client.get('/pixQrCode/check')
+        
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(self.session.request.call_count, abacatepay_client.MAX_RETRIES + 1)
+    
+    def test_create_is_not_retried_on_server_error(self, mock_sleep):
+        """Testa que a criação do QR Code não é repetida em 5xx nem timeout de leitura"""
+        self.session.request.side_effect = [_response(500)]
+        self.assertEqual(abacatepay_client.post('/pixQrCode/create', idempotent=False).status_code, 500)
+        
+        self.session.request.side_effect = requests.exceptions.ReadTimeout()
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            abacatepay_client.post('/pixQrCode/create', idempotent=False)
+        
+        self.assertEqual(self.session.request.call_count, 2)
+        mock_sleep.assert_not_called()
+    
+    def test_create_is_retried_when_connection_never_opened(self, mock_sleep):
+        """Testa retry da criação quando a conexão nem foi estabelecida"""
+        self.session.request.side_effect = [requests.exceptions.ConnectTimeout(), _response(200)]
+        
+        self.assertEqual(abacatepay_client.post('/pixQrCode/create', idempotent=False).status_code, 200)
+    
+    def test_latency_exported_per_endpoint_and_status(self, mock_sleep):
+        """Testa o histograma de latência por endpoint/status e o contador de retries"""
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+        before = {
+            'check_ok': sample('abacatepay_request_duration_seconds_count', endpoint='/pixQrCode/check', status='200'),
+            'check_retries': sample('abacatepay_retries_total', endpoint='/pixQrCode/check'),
+            'simulate_404': sample(
+                'abacatepay_request_duration_seconds_count', endpoint='/pixQrCode/simulate-payment', status='404'
+            ),
+            'create_error': sample(
+                'abacatepay_request_duration_seconds_count', endpoint='/pixQrCode/create', status='error'
+            ),
+        }
+        self.session.request.side_effect = [
+            _response(503), _response(200), _response(404), requests.exceptions.ReadTimeout(),
+        ]
+        
+        abacatepay_client.get('/pixQrCode/check')
+        abacatepay_client.post('/pixQrCode/simulate-payment')
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            abacatepay_client.post('/pixQrCode/create', idempotent=False)
+        
+        self.assertEqual(
+            sample('abacatepay_request_duration_seconds_count', endpoint='/pixQrCode/check', status='200'),
+            before['check_ok'] + 1,
+        )
+        self.assertEqual(sample('abacatepay_retries_total', endpoint='/pixQrCode/check'), before['check_retries'] + 1)
+        self.assertEqual(
+            sample('abacatepay_request_duration_seconds_count', endpoint='/pixQrCode/simulate-payment', status='404'),
+            before['simulate_404'] + 1,
+        )
+        self.assertEqual(
+            sample('abacatepay_request_duration_seconds_count', endpoint='/pixQrCode/create', status='error'),
+            before['create_error'] + 1,
+        )
+
+
+class EmailOutboxWorkerTest(TestCase):
+    """Testes para o envio dos emails enfileirados"""
+    
+    def setUp(self):
+        """Configuração inicial"""
+        self.registration = RaceRegistration.objects.create(
+            full_name='João Silva',
+            cpf='12345678901',
+            email='joao@email.com',
+            phone='11999999999',
+            birth_date=date(1990, 1, 1),
+            gender='M',
+            modality='ADULTO',
+            course='RUN_5K',
+            shirt_size='M',
+            athlete_declaration=True,
+            payment_status='PENDING'
+        )
+    
+    def test_paid_registration_email_sent_by_worker(self):
+        """Testa que o worker envia o email enfileirado e marca a inscrição"""
+        mark_registration_paid_atomic(self.registration.id)
+        self.assertEqual(len(mail.outbox), 0)
+        
+        result = process_outbox_batch(get_connection())
+        
+        self.assertEqual(result, {'sent': 1, 'retried': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['joao@email.com'])
+        
+        self.registration.refresh_from_db()
+        self.assertTrue(self.registration.payment_email_sent)
+        outbox = EmailOutbox.objects.get(registration=self.registration)
+        self.assertEqual(outbox.status, EmailOutbox.STATUS_SENT)
+        self.assertIsNotNone(outbox.sent_at)
+        
+        # Nada mais a enviar
+        self.assertEqual(process_outbox_batch(get_connection())['sent'], 0)
+    
+    @patch('django.core.mail.EmailMultiAlternatives.send')
+    def test_failed_send_is_rescheduled_with_backoff(self, mock_send):
+        """Testa que falhas são reagendadas e marcadas como falhas no limite"""
+        mock_send.side_effect = Exception('SMTP indisponível')
+        mark_registration_paid_atomic(self.registration.id)
+        
+        result = process_outbox_batch(get_connection(), max_attempts=2)
+        
+        self.assertEqual(result['retried'], 1)
+        outbox = EmailOutbox.objects.get(registration=self.registration)
+        self.assertEqual(outbox.status, EmailOutbox.STATUS_PENDING)
+        self.assertEqual(outbox.attempts, 1)
+        self.assertIn('SMTP indisponível', outbox.last_error)
+        self.assertGreater(outbox.next_attempt_at, timezone.now())
+        
+        # Ainda não venceu: não tenta de novo
+        self.assertEqual(process_outbox_batch(get_connection(), max_attempts=2)['retried'], 0)
+        
+        EmailOutbox.objects.filter(id=outbox.id).update(next_attempt_at=timezone.now())
+        result = process_outbox_batch(get_connection(), max_attempts=2)
+        
+        self.assertEqual(result['failed'], 1)
+        outbox.refresh_from_db()
+        self.assertEqual(outbox.status, EmailOutbox.STATUS_FAILED)
+        self.registration.refresh_from_db()
+        self.assertFalse(self.registration.payment_email_sent)
+    
+    def test_send_happens_after_claim_outside_transaction(self):
+        """Testa que o SMTP é chamado com o lote já reservado e sem transação aberta"""
+        mark_registration_paid_atomic(self.registration.id)
+        outbox = EmailOutbox.objects.get(registration=self.registration)
+        # TestCase envolve cada teste em transações próprias
+        base_depth = len(db_connection.atomic_blocks)
+        seen = []
+        
+        def fake_send(message, fail_silently=False):
+            claimed = EmailOutbox.objects.get(id=outbox.id)
+            seen.append((len(db_connection.atomic_blocks), claimed.status, claimed.last_attempt_at, claimed.next_attempt_at))
+            return 1
+        
+        with patch('django.core.mail.EmailMultiAlternatives.send', autospec=True, side_effect=fake_send):
+            result = process_outbox_batch(get_connection())
+        
+        self.assertEqual(result['sent'], 1)
+        depth, status, last_attempt_at, next_attempt_at = seen[0]
+        self.assertEqual(depth, base_depth)
+        self.assertEqual(status, EmailOutbox.STATUS_SENDING)
+        self.assertIsNotNone(last_attempt_at)
+        self.assertEqual(next_attempt_at, last_attempt_at + timedelta(seconds=CLAIM_TIMEOUT_SECONDS))
+        outbox.refresh_from_db()
+        self.assertEqual(outbox.status, EmailOutbox.STATUS_SENT)
+    
+    def test_expired_claim_is_taken_again(self):
+        """Testa que um email reservado por um worker que morreu volta a ser enviado após o prazo"""
+        mark_registration_paid_atomic(self.registration.id)
+        outbox = EmailOutbox.objects.get(registration=self.registration)
+        EmailOutbox.objects.filter(id=outbox.id).update(
+            status=EmailOutbox.STATUS_SENDING,
+            last_attempt_at=timezone.now(),
+            next_attempt_at=timezone.now() + timedelta(seconds=CLAIM_TIMEOUT_SECONDS),
+        )
+        
+        # Reserva ainda válida: nenhum outro worker envia
+        self.assertEqual(process_outbox_batch(get_connection())['sent'], 0)
+        self.assertEqual(len(mail.outbox), 0)
+        
+        EmailOutbox.objects.filter(id=outbox.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(process_outbox_batch(get_connection())['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        outbox.refresh_from_db()
+        self.assertEqual(outbox.status, EmailOutbox.STATUS_SENT)
+    
+    def paid_registrations(self, count):
+        """Inscrições pagas (a do setUp e mais count - 1), cada uma com seu email na fila"""
+        registrations = [self.registration] + [
+            RaceRegistration.objects.create(
+                full_name=f'Atleta {i}',
+                cpf=f'1111111110{i}',
+                email=f'atleta{i}@email.com',
+                phone='11999999999',
+                birth_date=date(1990, 1, 1),
+                gender='F',
+                modality='ADULTO',
+                course='RUN_5K',
+                shirt_size='M',
+                athlete_declaration=True,
+                payment_status='PENDING'
+            )
+            for i in range(1, count)
+        ]
+        for registration in registrations:
+            mark_registration_paid_atomic(registration.id)
+        return registrations
+    
+    def test_smtp_unavailable_counts_as_failed_attempt(self):
+        """Testa que falha ao abrir a conexão SMTP reagenda o lote em vez de deixá-lo em SENDING"""
+        self.paid_registrations(2)
+        connection = MagicMock()
+        connection.open.side_effect = ConnectionRefusedError('SMTP fora do ar')
+        
+        result = process_outbox_batch(connection)
+        
+        self.assertEqual(result, {'sent': 0, 'retried': 2, 'failed': 0})
+        for outbox in EmailOutbox.objects.all():
+            self.assertEqual(outbox.status, EmailOutbox.STATUS_PENDING)
+            self.assertEqual(outbox.attempts, 1)
+            self.assertIn('SMTP fora do ar', outbox.last_error)
+            self.assertGreater(outbox.next_attempt_at, timezone.now())
+    
+    @patch('django.core.mail.EmailMultiAlternatives.send')
+    def test_connection_lost_mid_batch_keeps_sent_results(self, mock_send):
+        """Testa que os emails enviados antes da queda da conexão ficam gravados como enviados"""
+        first, second, third = self.paid_registrations(3)
+        mock_send.side_effect = [1, Exception('conexão perdida')]
+        connection = MagicMock()
+        connection.open.side_effect = [True, ConnectionRefusedError('SMTP fora do ar')]
+        
+        result = process_outbox_batch(connection)
+        
+        self.assertEqual(result, {'sent': 1, 'retried': 2, 'failed': 0})
+        self.assertEqual(mock_send.call_count, 2)
+        statuses = {
+            outbox.registration_id: (outbox.status, outbox.attempts)
+            for outbox in EmailOutbox.objects.all()
+        }
+        self.assertEqual(statuses[first.id], (EmailOutbox.STATUS_SENT, 0))
+        self.assertEqual(statuses[second.id], (EmailOutbox.STATUS_PENDING, 1))
+        self.assertEqual(statuses[third.id], (EmailOutbox.STATUS_PENDING, 1))
+        first.refresh_from_db()
+        self.assertTrue(first.payment_email_sent)
+    
+    @patch('api.management.commands.run_email_worker.process_outbox_batch')
+    def test_worker_survives_batch_error(self, mock_batch):
+        """Testa que um erro no lote é registrado sem derrubar o worker"""
+        mock_batch.side_effect = Exception('banco indisponível')
+        out = StringIO()
+        
+        call_command('run_email_worker', '--once', stdout=out)
+        
+        self.assertIn('Erro no lote do outbox: banco indisponível', out.getvalue())
+        self.assertIn('Concluído: 0 enviado(s)', out.getvalue())
+
+
 class StripeServiceTest(TestCase):
     """Testes para serviços do Stripe"""
     
@@ -332,3 +701,78 @@ class StripeServiceTest(TestCase):
         
         self.assertFalse(result['success'])
         self.assertIn('error', result)
+
+
+@patch('api.services.stripe.checkout.Session.create')
+class CheckoutSessionReuseTest(TestCase):
+    """Testes para o reaproveitamento de sessões de checkout abertas"""
+    
+    def setUp(self):
+        """Configuração inicial"""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.registration = RaceRegistration.objects.create(
+            full_name='João Silva',
+            cpf='12345678901',
+            email='joao@email.com',
+            phone='11999999999',
+            birth_date=date(1990, 1, 1),
+            gender='M',
+            course='RUN_5K',
+            shirt_size='M',
+            athlete_declaration=True,
+        )
+    
+    def fake_session(self, n, expires_in=24 * 3600):
+        return MagicMock(id=f'cs_test_{n}', url=f'https://checkout.stripe.com/c/pay/cs_test_{n}', expires_at=int(time.time()) + expires_in)
+    
+    def test_open_session_reused(self, mock_create):
+        """Testa que a segunda chamada devolve a mesma sessão sem chamar o Stripe"""
+        from api.services import create_stripe_checkout_session
+        mock_create.side_effect = [self.fake_session(1)]
+        
+        first = create_stripe_checkout_session(self.registration)
+        second = create_stripe_checkout_session(self.registration)
+        
+        self.assertFalse(first['reused'])
+        self.assertTrue(second['reused'])
+        self.assertEqual(second['session_id'], 'cs_test_1')
+        self.assertEqual(second['checkout_url'], first['checkout_url'])
+        self.assertEqual(second['amount'], first['amount'])
+        self.assertEqual(mock_create.call_count, 1)
+    
+    @patch('api.services.validate_coupon_code', return_value=(True, 'ok', 10.0))
+    def test_new_session_when_coupon_changes(self, mock_coupon, mock_create):
+        """Testa que cupom diferente cria outra sessão"""
+        from api.services import create_stripe_checkout_session
+        mock_create.side_effect = [self.fake_session(1), self.fake_session(2)]
+        
+        create_stripe_checkout_session(self.registration)
+        result = create_stripe_checkout_session(self.registration, coupon_code='ad10')
+        
+        self.assertFalse(result['reused'])
+        self.assertEqual(result['session_id'], 'cs_test_2')
+        self.assertEqual(mock_create.call_args.kwargs['metadata']['coupon_code'], 'AD10')
+        self.assertTrue(create_stripe_checkout_session(self.registration, coupon_code='AD10')['reused'])
+    
+    def test_session_close_to_expiry_not_reused(self, mock_create):
+        """Testa que sessão perto de expirar não é reaproveitada"""
+        from api.services import create_stripe_checkout_session
+        mock_create.side_effect = [self.fake_session(1, expires_in=600), self.fake_session(2)]
+        
+        create_stripe_checkout_session(self.registration)
+        result = create_stripe_checkout_session(self.registration)
+        
+        self.assertFalse(result['reused'])
+        self.assertEqual(mock_create.call_count, 2)
+    
+    def test_session_replaced_elsewhere_not_reused(self, mock_create):
+        """Testa que só a sessão gravada na inscrição é reaproveitada"""
+        from api.services import create_stripe_checkout_session
+        mock_create.side_effect = [self.fake_session(1), self.fake_session(2)]
+        
+        create_stripe_checkout_session(self.registration)
+        RaceRegistration.objects.filter(id=self.registration.id).update(stripe_checkout_session_id='cs_outra')
+        self.registration.refresh_from_db()
+        
+        self.assertEqual(create_stripe_checkout_session(self.registration)['session_id'], 'cs_test_2')